@@ -0,0 +1,116 @@
+"""Generator for synthetic pathology reports
+
+Reports consist of filler sentences typical for pathology and discharge letters, interspersed with
+TNM staging statements and ICD-O morphology codes. code_density is the probability that a sentence
+contains a code, so 0 yields code-free documents (e.g., lab notes) and 1 yields staging-heavy tables.
+
+Usage: python -m benchmarks.generate --docs 10 --language en
+"""
+import argparse
+import json
+import random
+
+FILLER = {
+    'de': [
+        'Makroskopie: Resektat mit einer Größe von {size} x {size} cm.',
+        'Mikroskopie: Infiltrate eines {grade} differenzierten Adenokarzinoms.',
+        'Die Absetzungsränder sind tumorfrei, der minimale Abstand beträgt {size} mm.',
+        'Der Patient wurde in gutem Allgemeinzustand entlassen.',
+        'Laborwerte am {day}.{month}.2020: Hb {lab} g/dl, Leukozyten {lab} /nl.',
+        'Immunhistochemie: CK7 positiv, CK20 negativ, TTF-1 negativ.',
+        'Es erfolgte eine Vorstellung im interdisziplinären Tumorboard.',
+        'Kein Nachweis von Lymphgefäß- oder Veneninvasion in den untersuchten Schnitten.',
+        'Anamnestisch Zustand nach Cholezystektomie {year}.',
+        'Empfehlung: adjuvante Chemotherapie nach Rücksprache mit der Onkologie.',
+    ],
+    'en': [
+        'Gross description: specimen measuring {size} x {size} cm.',
+        'Microscopy: infiltrates of a {grade} differentiated adenocarcinoma.',
+        'The resection margins are free of tumor, the closest margin is {size} mm.',
+        'The patient was discharged in good general condition.',
+        'Laboratory values on {month}/{day}/2020: Hb {lab} g/dl, WBC {lab} /nl.',
+        'Immunohistochemistry: CK7 positive, CK20 negative, TTF-1 negative.',
+        'The case was presented at the multidisciplinary tumor board.',
+        'No lymphatic or venous invasion in the examined sections.',
+        'History of cholecystectomy in {year}.',
+        'Recommendation: adjuvant chemotherapy after consultation with oncology.',
+    ]
+}
+
+CODES = {
+    'de': [
+        'TNM (8. Aufl.): {tnm}',
+        'UICC-Klassifikation (8. Auflage, 2017): {tnm}',
+        'Tumorklassifikation: {tnm}',
+        'ICD-O (3. Aufl.): {morphology}',
+        'R-Status {r}',
+        'Grading: G{g}',
+    ],
+    'en': [
+        'TNM (8th ed.): {tnm}',
+        'UICC classification (8th edition, 2017): {tnm}',
+        'Tumor stage: {tnm}',
+        'ICD-O-3 morphology: {morphology}',
+        'Residual tumor: R{r}',
+        'Grade: G{g}',
+    ]
+}
+
+MORPHOLOGY = ['8140/3', '8500/3', '8520/3', '8070/3', '8010/3', '8480/3', '8720/3', '9680/3']
+
+
+def tnm_statement(rnd):
+    parts = [
+        rnd.choice(['', 'p', 'c', 'yp', 'rp']) + 'T' + rnd.choice(['1', '1a', '1b', '2', '2c', '3', '4b', 'is', 'X']),
+        rnd.choice(['', 'p', 'c']) + 'N' + rnd.choice(['0', '1', '1a', '2', '2b', '3', 'X'])
+    ]
+    if rnd.random() < 0.4:
+        parts[1] += ' (%d/%d)' % (rnd.randint(0, 5), rnd.randint(6, 30))
+    if rnd.random() < 0.7:
+        parts.append(rnd.choice(['', 'c', 'p']) + 'M' + rnd.choice(['0', '1', '1a', 'X']))
+    for prefix, values in [('G', '123'), ('L', '01'), ('V', '012'), ('Pn', '01'), ('R', '012')]:
+        if rnd.random() < 0.5:
+            parts.append(prefix + rnd.choice(values))
+    return rnd.choice([', ', ' ']).join(parts)
+
+
+def generate_report(rnd, language='de', code_density=0.2, length=2000):
+    """Generates one report of roughly length characters"""
+    sentences = []
+    size = 0
+    while size < length:
+        if rnd.random() < code_density:
+            template = rnd.choice(CODES[language])
+        else:
+            template = rnd.choice(FILLER[language])
+        sentence = template.format(
+            tnm=tnm_statement(rnd), morphology=rnd.choice(MORPHOLOGY), r=rnd.randint(0, 2), g=rnd.randint(1, 4),
+            size=rnd.randint(1, 12), grade=rnd.choice(['gut', 'mäßig', 'schlecht'] if language == 'de' else ['well', 'moderately', 'poorly']),
+            day=rnd.randint(1, 28), month=rnd.randint(1, 12), year=rnd.randint(1990, 2019), lab=round(rnd.uniform(3, 15), 1))
+        sentences.append(sentence)
+        size += len(sentence) + 1
+        if rnd.random() < 0.15:
+            sentences.append('\n')
+    return ' '.join(sentences)
+
+
+def generate_reports(n, language='de', code_density=0.2, length=2000, seed=0):
+    """Generates n reports deterministically for a given seed"""
+    rnd = random.Random(seed)
+    return [generate_report(rnd, language, code_density, length) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=10)
+    parser.add_argument('--language', choices=['de', 'en'], default='de')
+    parser.add_argument('--code-density', type=float, default=0.2)
+    parser.add_argument('--length', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for i, text in enumerate(generate_reports(args.docs, args.language, args.code_density, args.length, args.seed)):
+        print(json.dumps({'id': i, 'text': text}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
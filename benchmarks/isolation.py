@@ -0,0 +1,22 @@
+"""Helpers for running each benchmark configuration in a fresh process, so that load time and peak RSS are measured in isolation"""
+import multiprocessing
+import resource
+import sys
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the current process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_isolated(target, *args):
+    """Runs target(*args, queue) in a fresh (spawned) process and returns the result it puts into the queue"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    p = ctx.Process(target=target, args=args + (queue,))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
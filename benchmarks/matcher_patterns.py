@@ -0,0 +1,58 @@
+"""Compares the Matcher patterns of RuleTNMExtractor with and without token pre-classification
+
+Texts are tokenized once, then every matcher variant runs over the same Docs, so that only the matching cost is
+measured. The classifications of all variants are checked to be identical.
+
+Usage: python -m benchmarks.matcher_patterns [--docs 1000] [--language de] [--code-density 0.2]
+"""
+import argparse
+import itertools
+import json
+import time
+
+from benchmarks.generate import generate_reports
+from onconlp.classification.rulebased_tnm import RuleTNMExtractor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--language', choices=['de', 'en'], default='de')
+    parser.add_argument('--code-density', type=float, default=0.2)
+    parser.add_argument('--length', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    texts = generate_reports(args.docs, args.language, args.code_density, args.length, args.seed)
+    for allow_spaces, detect_parentheses in itertools.product([False, True], [True, False]):
+        extractors = {preclassify: RuleTNMExtractor(args.language, allow_spaces, detect_parentheses=detect_parentheses,
+                                                    tokenizer_only=True, prefilter=False, preclassify=preclassify)
+                      for preclassify in [False, True]}
+        docs = [extractors[False].nlp(text) for text in texts]
+        # Warm-up, also fills the token class caches
+        results = {preclassify: [repr(ex.transform_doc(doc)) for doc in docs] for preclassify, ex in extractors.items()}
+        if results[False] != results[True]:
+            raise Exception('Pre-classified patterns yield different results')
+
+        timings = {}
+        for preclassify, ex in extractors.items():
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                for doc in docs:
+                    ex.matcher(doc)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[preclassify] = best
+        print(json.dumps({
+            'allow_spaces': allow_spaces,
+            'detect_parentheses': detect_parentheses,
+            'regex_docs_per_s': round(len(docs) / timings[False], 1),
+            'preclassified_docs_per_s': round(len(docs) / timings[True], 1),
+            'speedup': round(timings[False] / timings[True], 2),
+        }))
+
+
+if __name__ == '__main__':
+    main()
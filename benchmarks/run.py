@@ -0,0 +1,161 @@
+"""Throughput benchmark for TNMExtractor and ICD_O_Extractor on synthetic reports
+
+Every extractor configuration runs in a fresh process, so that model load time and peak RSS are measured
+in isolation. Results are written as JSON; pass a previous result file to --compare to spot regressions.
+
+Usage: python -m benchmarks.run [--docs 1000] [--output benchmarks/results/current.json] [--compare old.json]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.generate import generate_reports
+from benchmarks.isolation import peak_rss_mb, run_isolated
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def create_extractor(extractor, options):
+    if extractor == 'tnm':
+        from onconlp.classification.tnm import TNMExtractor
+        return TNMExtractor(**options)
+    from onconlp.diagnosis.icd_o import ICD_O_Extractor
+    return ICD_O_Extractor(**options)
+
+
+def measure(extractor, options, settings, queue):
+    texts = generate_reports(settings['docs'], settings['language'], settings['code_density'], settings['length'], settings['seed'])
+    start = time.perf_counter()
+    ex = create_extractor(extractor, dict(options, language=settings['language']))
+    load_time = time.perf_counter() - start
+
+    # Warm-up, e.g. for lazily initialized tokenizer caches
+    for text in texts[:10]:
+        ex.transform(text)
+
+    latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        t = time.perf_counter()
+        ex.transform(text)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in ex.transform_batch(texts, batch_size=settings['batch_size']):
+        pass
+    batch_elapsed = time.perf_counter() - start
+
+    queue.put({
+        'extractor': extractor,
+        'options': options,
+        'load_time_s': round(load_time, 4),
+        'docs_per_s': round(len(texts) / elapsed, 1),
+        'batch_docs_per_s': round(len(texts) / batch_elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    })
+
+
+def configurations(engines, tokenizer_only):
+    for engine, allow_spaces, merge_matches, detect_parantheses in itertools.product(engines, [False, True], [False, True], [True, False]):
+        options = {'allow_spaces': allow_spaces, 'merge_matches': merge_matches, 'detect_parantheses': detect_parantheses, 'engine': engine}
+        if engine == 'spacy':
+            options['tokenizer_only'] = tokenizer_only
+        yield 'tnm', options
+    yield 'icd_o', {'tokenizer_only': tokenizer_only}
+
+
+def version_info():
+    try:
+        from importlib.metadata import version
+        package_version = version('onconlp')
+    except Exception:
+        package_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'version': package_version, 'commit': commit, 'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def result_key(result):
+    return result['extractor'], json.dumps(result['options'], sort_keys=True)
+
+
+def compare(previous, current, threshold):
+    """Prints relative changes per configuration and returns the number of regressions beyond threshold"""
+    old = {result_key(r): r for r in previous['results']}
+    regressions = 0
+    for r in current['results']:
+        o = old.get(result_key(r))
+        if not o:
+            continue
+        changes = []
+        for metric, higher_is_better in [('docs_per_s', True), ('batch_docs_per_s', True), ('p99_ms', False),
+                                         ('load_time_s', False), ('peak_rss_mb', False)]:
+            if not o.get(metric):
+                continue
+            change = (r[metric] - o[metric]) / o[metric]
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                flag = ' REGRESSION'
+                regressions += 1
+            changes.append('%s %+.1f%%%s' % (metric, change * 100, flag))
+        print('%s %s: %s' % (r['extractor'], r['options'], ', '.join(changes)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--language', choices=['de', 'en'], default='de')
+    parser.add_argument('--code-density', type=float, default=0.2)
+    parser.add_argument('--length', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--engines', nargs='+', choices=['spacy', 'regex'], default=['spacy', 'regex'])
+    parser.add_argument('--tokenizer-only', action='store_true')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Previous result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change reported as regression (default: 0.1)')
+    args = parser.parse_args()
+
+    settings = {k: getattr(args, k) for k in ['docs', 'language', 'code_density', 'length', 'seed', 'batch_size']}
+    results = []
+    for extractor, options in configurations(args.engines, args.tokenizer_only):
+        result = run_isolated(measure, extractor, options, settings)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    report = dict(version_info(), timestamp=datetime.datetime.now().isoformat(timespec='seconds'),
+                  settings=settings, results=results)
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                         datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to %s' % output, file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
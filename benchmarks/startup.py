@@ -0,0 +1,71 @@
+"""Compares the startup time of building extractors with loading them prebuilt from disk or from a pickle
+
+The extractors are saved once, then each path runs in a fresh process, like a new worker or a serverless cold start.
+For each path, the time to import the extractor module, the time until the extractor is ready and the time until the
+first text is transformed are reported. With 'lazy', the model is only loaded by the first call.
+
+Usage: python -m benchmarks.startup [--language de] [--tokenizer-only] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import pickle
+import tempfile
+import time
+
+from benchmarks.isolation import run_isolated
+
+TEXT = 'UICC-Klassifikation (8. Auflage, 2017): pT2, pN1 (2/22), G2, L1, V0, Pn1, R0. ICD-O: 8140/3'
+
+
+def extractor_class(extractor):
+    if extractor == 'tnm':
+        from onconlp.classification.tnm import TNMExtractor
+        return TNMExtractor
+    from onconlp.diagnosis.icd_o import ICD_O_Extractor
+    return ICD_O_Extractor
+
+
+def measure(extractor, options, mode, path, queue):
+    start = time.perf_counter()
+    cls = extractor_class(extractor)
+    imported = time.perf_counter() - start
+    if mode == 'build':
+        ex = cls(**options)
+    elif mode == 'lazy':
+        ex = cls(lazy=True, **options)
+    elif mode == 'from_disk':
+        ex = cls.from_disk(path)
+    else:
+        with open(path, 'rb') as f:
+            ex = pickle.load(f)
+    ready = time.perf_counter() - start
+    ex.transform(TEXT)
+    queue.put({'extractor': extractor, 'mode': mode, 'import_s': round(imported, 4), 'startup_s': round(ready, 4),
+               'first_call_s': round(time.perf_counter() - start, 4)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--language', default='de')
+    parser.add_argument('--tokenizer-only', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    options = {'language': args.language, 'tokenizer_only': args.tokenizer_only}
+    with tempfile.TemporaryDirectory() as tmp:
+        for extractor in ['tnm', 'icd_o']:
+            ex = extractor_class(extractor)(**options)
+            disk_path = os.path.join(tmp, extractor)
+            ex.to_disk(disk_path)
+            pickle_path = os.path.join(tmp, extractor + '.pkl')
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(ex, f)
+            for mode, path in [('build', None), ('lazy', None), ('from_disk', disk_path), ('pickle', pickle_path)]:
+                results = [run_isolated(measure, extractor, options, mode, path) for _ in range(args.repeat)]
+                best = min(results, key=lambda r: r['first_call_s'])
+                print(json.dumps(dict(best, tokenizer_only=args.tokenizer_only)))
+
+
+if __name__ == '__main__':
+    main()
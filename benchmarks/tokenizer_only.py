@@ -0,0 +1,60 @@
+"""Compares the full spaCy pipeline with the tokenizer-only mode
+
+Each configuration runs in a fresh process, so that model load time and peak RSS are measured in isolation.
+
+Usage: python -m benchmarks.tokenizer_only [--docs 2000] [--language de]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.isolation import peak_rss_mb, run_isolated
+
+TEXTS = [
+    "TNM (8. Aufl.): pT1b, pNX, L0, V0\nGrading: G2\n\nR-Klassifikation (lokal): R0 ",
+    "UICC-Klassifikation (8. Auflage, 2017) 16. pT2, pN1(2/22), G2, L1, V0, Pn1, R0 (lokal) ",
+    "Mikroskopie: Infiltrate eines mäßig differenzierten Adenokarzinoms. ICD-O: 8140/3",
+    "Entlassbrief: Patientin in gutem Allgemeinzustand entlassen. Keine weiteren Befunde.",
+]
+
+
+def _run(extractor, tokenizer_only, language, n_docs, queue):
+    start = time.perf_counter()
+    if extractor == 'tnm':
+        from onconlp.classification.tnm import TNMExtractor
+        ex = TNMExtractor(language, tokenizer_only=tokenizer_only)
+    else:
+        from onconlp.diagnosis.icd_o import ICD_O_Extractor
+        ex = ICD_O_Extractor(language, tokenizer_only=tokenizer_only)
+    load_time = time.perf_counter() - start
+
+    docs = [TEXTS[i % len(TEXTS)] for i in range(n_docs)]
+    start = time.perf_counter()
+    for text in docs:
+        ex.transform(text)
+    elapsed = time.perf_counter() - start
+    queue.put({
+        'extractor': extractor,
+        'tokenizer_only': tokenizer_only,
+        'load_time_s': round(load_time, 3),
+        'docs_per_s': round(n_docs / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--language', default='de')
+    args = parser.parse_args()
+
+    results = []
+    for extractor in ['tnm', 'icd_o']:
+        for tokenizer_only in [False, True]:
+            results.append(run_isolated(_run, extractor, tokenizer_only, args.language, args.docs))
+    for r in results:
+        print(json.dumps(r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""asyncio API for serving extractors without blocking the event loop
+
+All extractors are thread-safe: each holds a lock while it processes a text, which is shared by all extractors
+using the same spaCy model (see spacy_util.model_lock). Calls on extractors sharing a model therefore run one at a time,
+while the default executor runs calls on other extractors (and the regex engine) in parallel.
+ExtractorPool creates one extractor per worker instead. Its workers are processes for spaCy extractors, so that slow
+reports on one worker do not hold up requests on the others.
+
+Example:
+    pool = ExtractorPool(functools.partial(TNMExtractor, engine='regex'), max_workers=4)
+    tnms = await pool.atransform(text)
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import functools
+import os
+import threading
+import uuid
+
+__executor = None
+__executor_lock = threading.Lock()
+__max_workers = min(32, (os.cpu_count() or 1) + 4)
+__local = threading.local()
+
+
+def default_executor():
+    """Returns the executor used by the atransform methods of the extractors, with a bounded number of worker threads
+    (default: CPU count + 4, at most 32, see set_default_workers)"""
+    global __executor
+    with __executor_lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(max_workers=__max_workers, thread_name_prefix='onconlp')
+        return __executor
+
+
+def set_default_workers(max_workers):
+    """Sets the number of worker threads of the default executor, which is created again on next use"""
+    global __executor, __max_workers
+    with __executor_lock:
+        __max_workers = max_workers
+        if __executor is not None:
+            __executor.shutdown(wait=False)
+            __executor = None
+
+
+async def run(executor, func, *args):
+    """Runs func(*args) in executor (or the default executor) and waits for the result without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or default_executor(), func, *args)
+
+
+def _worker_extractor(key, factory):
+    # One extractor per pool and worker thread (or process)
+    extractors = getattr(__local, 'extractors', None)
+    if extractors is None:
+        extractors = __local.extractors = {}
+    if key not in extractors:
+        extractors[key] = factory()
+    return extractors[key]
+
+
+def _transform(key, factory, text):
+    return _worker_extractor(key, factory).transform(text)
+
+
+def _transform_batch(key, factory, texts, batch_size):
+    return list(_worker_extractor(key, factory).transform_batch(texts, batch_size))
+
+
+def _uses_spacy(factory):
+    # Only TNMExtractor with engine='regex' works without spaCy, whose model lock serializes threads
+    while isinstance(factory, functools.partial):
+        if factory.keywords.get('engine') == 'regex':
+            return False
+        factory = factory.func
+    return True
+
+
+class ExtractorPool():
+
+    def __init__(self, factory, max_workers=4, max_pending=None, processes=None):
+        """Creates a pool of workers with one extractor each
+
+        Arguments:
+            factory {callable} -- Creates an extractor, e.g. functools.partial(TNMExtractor, 'de'). Must be picklable if processes is set
+
+        Keyword Arguments:
+            max_workers {int} -- Number of worker threads or processes (default: {4})
+            max_pending {int} -- Maximum number of submitted calls, further calls wait without occupying the executor (default: {4 * max_workers})
+            processes {bool} -- Will workers be processes instead of threads? Needed for parallel spaCy processing, as threads share the GIL and the model lock (default: {True, unless factory is a partial with engine='regex'})
+        """
+        if processes is None:
+            processes = _uses_spacy(factory)
+        self.factory = factory
+        self.processes = processes
+        self.max_pending = max_pending or 4 * max_workers
+        self.executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=max_workers)
+        self.__key = uuid.uuid4().hex
+        self.__semaphore = None
+
+    def transform(self, text):
+        """Transforms text on a worker, blocking the calling thread"""
+        return self.executor.submit(_transform, self.__key, self.factory, text).result()
+
+    async def atransform(self, text):
+        async with self.__pending():
+            return await run(self.executor, _transform, self.__key, self.factory, text)
+
+    async def atransform_batch(self, texts, batch_size=1000):
+        """Transforms a list of texts on a single worker and returns the list of results"""
+        async with self.__pending():
+            return await run(self.executor, _transform_batch, self.__key, self.factory, list(texts), batch_size)
+
+    def __pending(self):
+        # Created on first use, so that it belongs to the running event loop
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_pending)
+        return self.__semaphore
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,161 @@
+from collections import OrderedDict, deque
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+
+
+@functools.lru_cache(maxsize=None)
+def rules_digest():
+    """Returns a hash of the package version, the TNM rule table and the bundled rule packs and code tables"""
+    from onconlp import __version__
+    from onconlp.classification.base_tnm import BaseTNMExtractor
+    digest = hashlib.sha256(__version__.encode('utf-8'))
+    digest.update(repr((BaseTNMExtractor._tnm_rules, BaseTNMExtractor._status_rules, BaseTNMExtractor._boundary)).encode('utf-8'))
+    directory = os.path.join(os.path.dirname(__file__), 'rulepacks')
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.json', '.tsv')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+class ResultCache():
+    """Content-addressed cache of extraction results, keyed by a hash of the extractor configuration and the text
+
+    Results are kept in a bounded in-memory LRU. If path is given, they are also stored in an SQLite file,
+    which can be shared between processes (e.g., several workers or consecutive runs).
+    Cached results are shared between all callers and must not be modified.
+    Keys include the package version and a hash of the bundled rules (see rules_digest), so that results stored by
+    another version are never returned.
+    """
+
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+        self.__db = None
+        self.__pid = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(config, text):
+        """Returns the cache key of a text for an extractor configuration (a tuple of options)"""
+        digest = hashlib.sha256(rules_digest().encode('ascii'))
+        digest.update(repr(config).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached result, or None if the key is not cached"""
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key]
+            if self.path:
+                row = self.__connection().execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                if row:
+                    result = pickle.loads(row[0])
+                    self.__remember(key, result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self.__lock:
+            self.__remember(key, result)
+            if self.path:
+                db = self.__connection()
+                with db:
+                    db.execute('INSERT OR REPLACE INTO results VALUES (?, ?)', (key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+
+    def transform(self, config, transform, text):
+        """Returns the cached result for text, or computes it with transform(text)"""
+        key = self.key(config, text)
+        result = self.get(key)
+        if result is None:
+            result = transform(text)
+            self.put(key, result)
+        return result
+
+    def transform_batch(self, config, transform_batch, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Yields results in input order, only passing texts that are not cached to transform_batch"""
+        if not as_tuples:
+            texts = ((text, None) for text in texts)
+        pending = deque() # (key, cached result or None, context) of all texts read so far, in input order
+
+        def misses():
+            for text, context in texts:
+                key = self.key(config, text)
+                result = self.get(key)
+                pending.append((key, result, context))
+                if result is None:
+                    yield text, key
+
+        def cached():
+            while pending and pending[0][1] is not None:
+                _, result, context = pending.popleft()
+                yield (result, context) if as_tuples else result
+
+        for result, key in transform_batch(misses(), batch_size, n_process, True):
+            yield from cached()
+            _, _, context = pending.popleft()
+            self.put(key, result)
+            yield (result, context) if as_tuples else result
+        yield from cached()
+
+    def clear(self):
+        """Removes all entries, including those on disk"""
+        with self.__lock:
+            self.__entries.clear()
+            if self.path:
+                db = self.__connection()
+                with db:
+                    db.execute('DELETE FROM results')
+
+    def reset(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __repr__(self):
+        return 'ResultCache (%d entries, %d hits, %d misses)' % \
+            (len(self.__entries), self.hits, self.misses)
+
+    def __remember(self, key, result):
+        self.__entries[key] = result
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def __connection(self):
+        # SQLite connections must not be shared with forked processes
+        if self.__pid != os.getpid():
+            self.__db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            with self.__db:
+                self.__db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)')
+            self.__pid = os.getpid()
+        return self.__db
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ResultCache__lock'] = None
+        state['_ResultCache__db'] = None
+        state['_ResultCache__pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.RLock()
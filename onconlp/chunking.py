@@ -0,0 +1,101 @@
+"""Processing of very long texts in overlapping chunks
+
+A text is split into consecutive regions at paragraph, sentence or word boundaries. Each region is processed
+together with a look-ahead of overlap characters, so that a match starting near the end of a region is still
+found completely. Every match is kept only from the chunk whose region it starts in, which yields the same
+candidates as processing the whole text, as long as no single match is longer than the overlap.
+
+After an edit, only a single chunk around the edited characters has to be processed again, see edit_window.
+"""
+from .match import TextSpan
+import regex as re
+
+# Preferred split points, tried in order: paragraphs, lines and sentences, any whitespace
+__boundaries = [re.compile(r'\n\s*\n\s*'), re.compile(r'(?:\n|(?<=[.;:!?]) )\s*'), re.compile(r'\s+')]
+
+
+def split_text(text, chunk_size, overlap=200):
+    """Returns (start, end, region_end) of chunks of at most chunk_size characters
+
+    Chunks cover the text with consecutive regions [start, region_end); text[region_end:end] is the look-ahead.
+    """
+    if chunk_size <= overlap:
+        raise Exception('chunk_size must be larger than overlap')
+    chunks = []
+    start = 0
+    while len(text) - start > chunk_size:
+        limit = start + chunk_size - overlap
+        region_end = __split_point(text, start + (chunk_size - overlap) // 2, limit) or limit
+        end = __split_point(text, region_end + overlap, start + chunk_size) or start + chunk_size
+        chunks.append((start, end, region_end))
+        start = region_end
+    chunks.append((start, len(text), len(text)))
+    return chunks
+
+
+def __split_point(text, lower, upper):
+    """Returns the end of the last, most preferred boundary between lower and upper, or None"""
+    for boundary in __boundaries:
+        split = None
+        for m in boundary.finditer(text, lower, upper):
+            split = m.end()
+        if split is not None:
+            return split
+    return None
+
+
+def find_matches(extractor, text, chunk_size, overlap=200, n_process=1):
+    """Finds (label, span) candidates of an extractor chunk by chunk, with spans relative to the whole text
+
+    The extractor has to provide find_matches_batch(texts, n_process=...), yielding (label, span) lists per text.
+    Chunks without any candidate are skipped if the extractor has a prefilter.
+    Candidates are ordered like the output of the spaCy Matcher, by end and start offset.
+    """
+    return __find_chunk_matches(extractor, text, split_text(text, chunk_size, overlap), n_process)
+
+
+def edit_window(text, start, end, overlap=200):
+    """Returns the chunk (start, end, region_end) to process again after text[start:end] was inserted (or the text was deleted at start)
+
+    Candidates starting before the region or at region_end and after are unaffected by the edit, as long as no single
+    match is longer than the overlap. The region starts at a boundary at least overlap characters before the edit.
+    """
+    lower = max(0, start - overlap)
+    window_start = __split_point(text, max(0, lower - overlap), lower) or max(0, lower - overlap)
+    region_end = min(len(text), end + overlap)
+    window_end = __split_point(text, region_end + overlap, region_end + 2 * overlap) or min(len(text), region_end + 2 * overlap)
+    return window_start, window_end, region_end
+
+
+def find_window_matches(extractor, text, window):
+    """Finds the candidates of a single chunk (start, end, region_end), e.g. from edit_window, like find_matches"""
+    return __find_chunk_matches(extractor, text, [window])
+
+
+def transform_batch(extractor, texts, chunk_size, overlap=200, batch_size=1000, n_process=1, as_tuples=False):
+    """Same as extractor.transform_batch, but texts longer than chunk_size are transformed with extractor.transform_chunked
+
+    Long texts are passed to transform_batch as empty texts and transformed chunk by chunk when their result is yielded,
+    so that results stay in input order.
+    """
+    if not as_tuples:
+        texts = ((text, None) for text in texts)
+    items = (('', (context, text)) if len(text) > chunk_size else (text, (context, None)) for text, context in texts)
+    for result, (context, long_text) in extractor.transform_batch(items, batch_size, n_process, as_tuples=True):
+        if long_text is not None:
+            result = extractor.transform_chunked(long_text, chunk_size, overlap)
+        yield (result, context) if as_tuples else result
+
+
+def __find_chunk_matches(extractor, text, chunks, n_process=1):
+    if extractor.prefilter:
+        chunks = [c for c in chunks if extractor.prefilter.pattern.search(text, c[0], c[1])]
+    candidates = {}
+    chunk_matches = extractor.find_matches_batch((text[start:end] for start, end, _ in chunks), n_process=n_process)
+    for (offset, _, region_end), matches in zip(chunks, chunk_matches):
+        for label, span in matches:
+            start = span.start_char + offset
+            if start < region_end:
+                end = span.end_char + offset
+                candidates[(end, start, label)] = TextSpan(span.text, start, end)
+    return [(label, candidates[(end, start, label)]) for end, start, label in sorted(candidates)]
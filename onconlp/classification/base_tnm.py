@@ -0,0 +1,293 @@
+from .tnm import TNMClassification, TNMMatch
+from .. import chunking
+from ..match import TextSpan
+from ..instrumentation import timed
+import heapq
+import regex as re
+
+
+class BaseTNMExtractor():
+    """Rule table and post-processing shared by the TNM extraction engines
+
+    Engines find candidate matches as (component, span) pairs, where span is a spaCy Span or any object
+    providing text, start_char and end_char, and hand them to classify in the order they were found.
+    Results only keep text and offsets of the spans, unless keep_spans is set.
+    """
+    keep_spans = False
+    stats = None
+    # Proximity grouping, see _group
+    max_gap = None
+    split_sentences = False
+    # Sentence-final punctuation followed by whitespace, or an empty line
+    sentence_boundary = re.compile(r'[.!?]\s|\n\s*\n')
+
+    _tnm_rules = {
+        'T': (r"[yra]{0,3}[upc]?T", r"([0-4][a-d]?|is|a|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
+        'N': (r"[yra]{0,3}[upc]?N", r"([0-3][a-d]?|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
+        'M': (r"[yra]{0,3}[upc]?M", r"([0-1][a-b]?|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
+        'L': (r"[uapc]?L", r"[0-1Xx]"),
+        'V': (r"[uapc]?V", r"[0-2Xx]"),
+        'Pn': (r"[uapc]?Pn", r"[0-1Xx]"),
+        'SX': (r"[uapc]?SX", r"[0-3Xx]"),
+        'R': (r"[uapc]?R", r"[0-2][ab]?"),
+        'G': (r"G", r"[1-4Xx]")
+    }
+
+    # Codes must not follow an ASCII letter or digit within their token
+    _boundary = r'(?<![A-Za-z0-9])'
+
+    # Status indicators (e.g., R-Status: 1) and the values allowed after them
+    _status_rules = {
+        'R': "^[0-2][ab]?",
+        'V': "^[0-2Xx]",
+        'Pn': "^[0-1Xx]",
+        'L': "^[0-1Xx]"
+    }
+
+    @classmethod
+    def token_patterns(cls):
+        """Returns the (code, axis) patterns searched in the text of a single token, with the component as group name
+
+        A token is a code if it ends with a complete code (e.g., pT1), and an axis if it ends with an axis only (e.g., pT).
+        """
+        code = cls._boundary + '(?:' + '|'.join('(?P<%s>%s%s$)' % (k, v[0], v[1]) for k, v in cls._tnm_rules.items()) + ')'
+        axis = cls._boundary + '(?:' + '|'.join('(?P<%s>%s$)' % (k, v[0]) for k, v in cls._tnm_rules.items()) + ')'
+        return code, axis
+
+    @staticmethod
+    def strip_lookahead(value):
+        """Removes the trailing lookahead from a value rule, e.g. ([0-4][a-d]?|is|a|X|x)(?=...)"""
+        return value.split('(?=')[0]
+
+    def candidate_pattern(self):
+        """Pattern found in every text in which the rules can match (and in some more)"""
+        patterns = [v[0] + self.strip_lookahead(v[1]) for v in self._tnm_rules.values()]
+        if self.allow_spaces:
+            patterns += [v[0] + ' ' for v in self._tnm_rules.values()]
+        patterns.append('(?:%s) ?-' % '|'.join(self._status_rules))
+        return '|'.join(patterns)
+
+    def transform_chunked(self, text, chunk_size, overlap=200, n_process=1):
+        """Transforms a long text in chunks of at most chunk_size characters, see onconlp.chunking"""
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
+            return []
+        if self.stats is not None:
+            self.stats.add_document()
+        matches = timed(self.stats, 'matcher', chunking.find_matches, self, text, chunk_size, overlap, n_process)
+        return self.classify(matches, text)
+
+    def transform_edit(self, text, results, offset, deleted, inserted, overlap=200):
+        """Updates the results of text after deleting deleted characters at offset and inserting inserted there
+
+        Only the text around the edit is matched again (see onconlp.chunking.edit_window), and only the classifications
+        from the one open at the edited region up to the first one starting at the same candidate as before are grouped again.
+
+        Returns:
+            (new text, new results)
+        """
+        if self.merge_matches:
+            raise Exception('Merged classifications cannot be updated by transform_edit')
+        if self.keep_spans:
+            raise Exception('Spans cannot be kept by transform_edit')
+        if offset < 0 or deleted < 0 or offset + deleted > len(text):
+            raise Exception('Invalid edit of %d characters at %d' % (deleted, offset))
+        text = text[:offset] + inserted + text[offset + deleted:]
+        shift = len(inserted) - deleted
+        window = chunking.edit_window(text, offset, offset + len(inserted), overlap)
+        if self.stats is not None:
+            self.stats.add_document()
+        candidates = timed(self.stats, 'matcher', chunking.find_window_matches, self, text, window)
+
+        # Grouping starts again with the classification before the first one that reaches into the window, which may be
+        # continued by the new candidates. Classifications are ordered by the end of their last candidate, as candidates
+        # are grouped in matching order, so all classifications before it can be found by binary search
+        lo, hi = 0, len(results)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__candidates(results[mid])[-1][1].end_char <= window[0]:
+                lo = mid + 1
+            else:
+                hi = mid
+        first = max(lo - 1, 0)
+
+        # Previous candidates starting before the region are unaffected by the edit, those starting at its end or after
+        # only move by shift. Grouping stops as soon as a classification starts at the same candidate as before
+        sync = {}
+
+        def previous_candidates():
+            for i in range(first, len(results)):
+                for j, (component, span) in enumerate(self.__candidates(results[i])):
+                    if span.start_char + shift >= window[2]:
+                        span = TextSpan(span.text, span.start_char + shift, span.end_char + shift)
+                        if j == 0:
+                            sync[span] = i
+                        yield component, span
+
+        # Candidates starting before the window end less than overlap characters after its start, so only the
+        # classifications up to there are searched for them
+        before = []
+        for i in range(first, len(results)):
+            classification = self.__candidates(results[i])
+            if classification[0][1].end_char >= window[0] + overlap:
+                break
+            before += [(component, span) for component, span in classification if span.start_char < window[0]]
+        # Candidates may end beyond the region, so the three streams are merged in matching order
+        merged = heapq.merge(before, candidates, previous_candidates(),
+                             key=lambda item: (item[1].end_char, item[1].start_char, item[0]))
+        grouped, stop = timed(self.stats, 'postprocess', self._group, merged, sync, text)
+        if stop is None:
+            return text, results[:first] + grouped
+        following = results[sync[stop]:]
+        return text, results[:first] + grouped + ([classification.shifted(shift) for classification in following] if shift else following)
+
+    def __candidates(self, classification):
+        """(component, span) of all candidates grouped into a classification in matching order
+
+        These include the candidates replaced by a longer one (e.g., N1 by N1 (2/14)), which are found again in its text.
+        """
+        matches = list(classification.values.items())
+        candidates = []
+        for (component, match), found in zip(matches, list(self.find_matches_batch(match.token for _, match in matches))):
+            candidates.append((component, TextSpan(match.token, match.start, match.end)))
+            candidates += [(component, TextSpan(span.text, match.start + span.start_char, match.start + span.end_char))
+                           for label, span in found if label == component and len(span.text) < len(match.token)]
+        return sorted(candidates, key=lambda item: (item[1].end_char, item[1].start_char, item[0]))
+
+    def classify(self, matches, text=None):
+        """Groups the candidates found in text and merges the classifications if merge_matches is set
+
+        text is only needed if split_sentences is set
+        """
+        results = timed(self.stats, 'postprocess', self.group, matches, text)
+        if self.merge_matches:
+            return timed(self.stats, 'merge', self.do_merge_matches, results)
+        return results
+
+    def group(self, matches, text=None):
+        """Groups (component, span) candidates into TNM classifications, see _group"""
+        return self._group(matches, text=text)[0]
+
+    def _group(self, matches, sync=(), text=None):
+        """Groups (component, span) candidates in matching order (i.e., by end offset) in a single pass
+
+        A new classification is started whenever a component repeats, and, for proximity grouping, if more than max_gap
+        characters lie between the current classification and the next candidate, or if split_sentences is set and a
+        sentence boundary (see sentence_boundary) lies in between. Only the gaps between candidates are scanned, so the
+        cost is linear in the number of candidates and the length of text. Stops before the first span in sync that
+        starts a new classification.
+
+        Returns:
+            (classifications, span in sync or None)
+        """
+        stats = self.stats
+        if self.split_sentences and text is None:
+            raise Exception('The text is needed to split classifications at sentence boundaries')
+        results = []
+        cur_result = TNMClassification()
+        # End of the last candidate of the current classification, None while it is empty
+        cur_end = None
+        stop = None
+        for tnmcomponent, span in matches:
+            start, end = span.start_char, span.end_char
+            if cur_end is not None and self.__separated(text, cur_end, start):
+                results.append(cur_result)
+                cur_result = TNMClassification()
+                cur_end = None
+                if stats is not None:
+                    stats.count('separated')
+            elif cur_result.hasvalue(tnmcomponent):
+                # Component already seen, so start new TNM expression unless the candidate extends the previous one
+                previous = getattr(cur_result, tnmcomponent)
+                if not (start <= previous.start and end >= previous.end):
+                    results.append(cur_result)
+                    cur_result = TNMClassification()
+                    cur_end = None
+                    if stats is not None:
+                        stats.count('split_repeated')
+            if span in sync and cur_end is None:
+                stop = span
+                break
+            cur_end = end if cur_end is None else max(cur_end, end)
+            match = re.match(
+                r'([yra]?)([yra]?)([yra]?)([upc]?)(.*)', span.text)
+            prefixes = []
+            for i in range(1, 5):
+                prefix = match.group(i)
+                if prefix:
+                    prefixes.append(prefix)
+            value = match.group(5)
+            details = {}
+            if self.detect_parentheses:
+                if tnmcomponent == 'N':
+                    details, value = self.add_details_n(value, details)
+                else:
+                    details, value = self.add_details(value, details)
+            value = self.normalize_value(value)
+            cur_result.setvalue(tnmcomponent, TNMMatch(
+                span, prefixes, value, details, self.keep_spans))
+        if not cur_result.empty():
+            results.append(cur_result)
+        if stats is not None:
+            for result in results:
+                for component in result.values:
+                    stats.add_match(component)
+        return results, stop
+
+    def __separated(self, text, end, start):
+        """Are the candidates ending at end and starting at start too far apart to belong to the same classification?"""
+        if self.max_gap is not None and start - end > self.max_gap:
+            return True
+        return self.split_sentences and start > end and self.sentence_boundary.search(text, end, start) is not None
+
+    def normalize_value(self, value):
+        m = re.match(r'(R|V|L|Pn)-Status.*(\d[ab]?)', value)
+        if m:
+            return m.group(1) + m.group(2)
+        return re.sub(' ', '', value)
+
+    __tnm_suffixes = r'is|mi|\d\-x|i\+|i\-|mol\-|mol\+|[a-d0-4mX]'
+    __suffix_separator = f'\s*,(?!\d)\s*|\s*(?<!\d),\s*|({__tnm_suffixes})\s+({__tnm_suffixes})'
+
+    def add_details(self, value, details):
+        # Any expression within braces
+        match = re.search(r'\((.*)\)', value)
+        if match:
+            other = match.group(1).strip()
+            if other:
+                split_list = re.split(self.__suffix_separator, other)
+                suffix_list = list(filter(None, split_list))
+                details['other'] = suffix_list
+            value = value[0:match.start()].strip()
+        return details, value
+
+    def add_details_n(self, value, details):
+        match = re.search(r'(\d+) ?\/ ?(\d+),?\s*', value)
+        if match:
+            details['lymphnodes_affected'] = int(match.group(1))
+            details['lymphnodes_examined'] = int(match.group(2))
+            value = value[:match.start()] + value[match.end():]
+        # Any expression within braces
+        return self.add_details(value, details)
+
+    def do_merge_matches(self, classifications):
+        """ Merge non-conflicting TNM matches"""
+        result = []
+        cur_tnm = None
+        for tnm in classifications:
+            if not cur_tnm:
+                cur_tnm = tnm
+                continue
+            merged = cur_tnm.merge(tnm)
+            if merged:
+                cur_tnm = merged
+            else:
+                if self.stats is not None:
+                    self.stats.count('rejected')
+                result.append(cur_tnm)
+                result.append(tnm)
+                cur_tnm = None
+        if cur_tnm:
+            result.append(cur_tnm)
+        return result
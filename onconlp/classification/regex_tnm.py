@@ -0,0 +1,189 @@
+from .base_tnm import BaseTNMExtractor
+from ..match import TextSpan
+from ..prefilter import Prefilter
+from ..instrumentation import timed
+import multiprocessing
+import regex as re
+
+
+class RegexTNMExtractor(BaseTNMExtractor):
+    """TNM extraction engine that scans the raw text instead of tokenizing it with spaCy
+
+    Only the whitespace-separated chunks of the text that may contain a code are split into tokens, the way the custom
+    tokenizer in RuleTNMExtractor splits them (see chunk_tokens), and the tokens are searched with the same patterns
+    (see BaseTNMExtractor.token_patterns). Ranges, parentheses and status indicators are matched on the raw text,
+    including the emoticon exceptions of the tokenizer that swallow a parenthesis (e.g., 8) in N0 (5/8)). Both engines
+    thus find the same matches in the same order, which is checked on generated reports with spliced-in edge cases
+    (see test_engine_parity). As the language defaults of the tokenizer are only approximated, this is not
+    guaranteed for unusual punctuation next to a code.
+    """
+
+    # Split off at the start of a chunk by the language defaults or the custom prefixes
+    __prefix = r'[§%=—–…,:;!?¿¡()\[\]{}<>_#*&"\'”“`‘´’‚„»«$£€¥\-/\\]|\+(?![0-9])|\.\.+'
+    # Split off within a chunk, except at its start (see RuleTNMExtractor.tokenizer_affixes)
+    __infix = r'[()*+,\-/]|(?<![Cc][0-9]{2})\.|(?<=[^\W_])[:<>=](?=[^\W\d_])'
+    # Split off at the end of a chunk
+    __suffix = r'[…,:;!?()\[\]{}<>#*&"\'”“`‘´’‚„»«.%]+$'
+    __token = r'[^\W_]+'
+    __range = r' ?[-/] ?[0-9Xxab](?![^\W_])'
+    # Closing parenthesis, unless it is joined with its neighbors by an emoticon exception (e.g., 8), :-) or ):)
+    __close = r"""(?<!(?<![^\W_])8)(?<!(?<![^\W_])8-)(?<![:;="])(?<![:;]-)(?<!:')(?<!:'-)(?<!:o)\)(?!-?:)"""
+    # Parentheses with at least one token, unless the opening one is part of an emoticon (e.g., (: or (-8)
+    __parentheses = r'\s*\((?![:;=]|-[:;8])(?=[^()]*[^()\s])(?:[^()]|(?!%s)\))*%s' % (__close, __close)
+
+    def __init__(self, allow_spaces=False, merge_matches=False, detect_parentheses=True, prefilter=True, keep_spans=False, stats=None,
+                 max_gap=None, split_sentences=False):
+        self.allow_spaces = allow_spaces
+        self.merge_matches = merge_matches
+        self.detect_parentheses = detect_parentheses
+        self.keep_spans = keep_spans
+        self.stats = stats
+        self.max_gap = max_gap
+        self.split_sentences = split_sentences
+        self.prefilter = Prefilter(self.candidate_pattern()) if prefilter else None
+
+        # Chunks that may contain a code (or an axis followed by a space)
+        candidates = [v[0] + self.strip_lookahead(v[1]) for v in self._tnm_rules.values()]
+        if allow_spaces:
+            candidates += [v[0] + ' ' for v in self._tnm_rules.values()]
+        self.candidate_re = re.compile('|'.join(candidates))
+        # Codes split off at the start of a chunk, e.g. ypT0 and N0 in ypT0N0M0 (the custom prefixes of the tokenizer)
+        self.prefix_code_re = re.compile('|'.join('(?P<%s>%s%s)' % (k, v[0], v[1]) for k, v in self._tnm_rules.items()))
+        self.prefix_re = re.compile(self.__prefix)
+        self.infix_re = re.compile(self.__infix)
+        self.suffix_re = re.compile(self.__suffix)
+        self.code_re, self.axis_re = (re.compile(pattern) for pattern in self.token_patterns())
+        self.range_re = re.compile(self.__range)
+        self.parentheses_re = re.compile(self.__parentheses)
+        self.token_re = re.compile(self.__token)
+
+        # The indicator must be a token of its own, and a colon is only split off if it is followed by a space
+        self.status_re = re.compile(r'(?<![^\W_])(?:' + '|'.join(
+            '(?P<%s>%s ?- ?(?i:status)(?![^\\W_]) ?(?:: )?(?=%s)%s)' % (k, k, affixes.lstrip('^'), self.__token)
+            for k, affixes in self._status_rules.items()) + ')')
+
+        if allow_spaces:
+            self.value_res = {k: re.compile(v[1]) for k, v in self._tnm_rules.items()}
+
+    def transform(self, text):
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
+            return []
+        if self.stats is not None:
+            self.stats.add_document()
+        return self.classify(timed(self.stats, 'matcher', self.find_matches, text), text)
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        if not as_tuples:
+            texts = ((text, None) for text in texts)
+        if n_process == 1:
+            for text, context in texts:
+                result = self.transform(text)
+                yield (result, context) if as_tuples else result
+            return
+        if n_process == -1:
+            n_process = multiprocessing.cpu_count()
+        with multiprocessing.Pool(n_process) as pool:
+            for result, context in pool.imap(self._transform_tuple, texts, chunksize=batch_size):
+                yield (result, context) if as_tuples else result
+
+    def transform_docs(self, docs, as_tuples=False):
+        """Extracts TNM classifications from the texts of spaCy Docs, whose tokens are not needed"""
+        if not as_tuples:
+            docs = ((doc, None) for doc in docs)
+        for doc, context in docs:
+            result = self.transform(doc.text)
+            yield (result, context) if as_tuples else result
+
+    def find_matches_batch(self, texts, batch_size=1000, n_process=1):
+        if n_process == 1:
+            yield from map(self.find_matches, texts)
+            return
+        if n_process == -1:
+            n_process = multiprocessing.cpu_count()
+        with multiprocessing.Pool(n_process) as pool:
+            yield from pool.imap(self.find_matches, texts)
+
+    def _transform_tuple(self, item):
+        text, context = item
+        return self.transform(text), context
+
+    def find_matches(self, text):
+        """Finds (component, span) candidates, ordered like the output of the spaCy Matcher"""
+        candidates = set()
+
+        def add(component, start, end):
+            candidates.add((end, start, component))
+            if self.detect_parentheses:
+                m = self.parentheses_re.match(text, end)
+                if m:
+                    candidates.add((m.end(), start, component))
+
+        pos = 0
+        m = self.candidate_re.search(text, pos)
+        while m:
+            chunk_start = m.start()
+            while chunk_start and not text[chunk_start - 1].isspace():
+                chunk_start -= 1
+            chunk_end = m.start()
+            while chunk_end < len(text) and not text[chunk_end].isspace():
+                chunk_end += 1
+            tokens = list(self.chunk_tokens(text, chunk_start, chunk_end))
+            for component, start, end in tokens:
+                if component:
+                    add(component, start, end)
+                    r = self.range_re.match(text, end)
+                    if r:
+                        candidates.add((r.end(), start, component))
+            if self.allow_spaces and tokens and text.startswith(' ', chunk_end):
+                _, start, end = tokens[-1]
+                axis = self.axis_re.search(text[start:end])
+                token = self.token_re.match(text, end + 1)
+                if axis and token and self.value_res[axis.lastgroup].search(token.group()):
+                    add(axis.lastgroup, start, token.end())
+            pos = chunk_end
+            m = self.candidate_re.search(text, pos)
+
+        for m in self.status_re.finditer(text):
+            add(m.lastgroup, m.start(), m.end())
+
+        return [(component, TextSpan(text[start:end], start, end)) for end, start, component in sorted(candidates)]
+
+    def chunk_tokens(self, text, start, end):
+        """Yields (component or None, start, end) of the tokens of the chunk text[start:end], split like the custom tokenizer does
+
+        Codes (e.g., ypT0 and N0 in ypT0N0M0) and punctuation are split off at the start, punctuation at the end, and the
+        rest is split at infixes. A token is a code if it ends with a complete code, e.g. ÄT1 or .N1 in pT2c.N1.
+        """
+        while start < end:
+            m = self.prefix_code_re.match(text, start, end)
+            if m:
+                yield m.lastgroup, start, m.end()
+            else:
+                m = self.prefix_re.match(text, start, end)
+                if not m:
+                    break
+                yield None, start, m.end()
+            start = m.end()
+        rest = text[start:end]
+        suffix = self.suffix_re.search(rest)
+        if suffix:
+            rest = rest[:suffix.start()]
+        pos = 0
+        for m in self.infix_re.finditer(rest):
+            # As in spaCy's tokenizer, an infix at the start stays part of the first token
+            if m.start() == 0:
+                continue
+            if m.start() > pos:
+                yield self.token_component(rest[pos:m.start()]), start + pos, start + m.start()
+            yield None, start + m.start(), start + m.end()
+            pos = m.end()
+        if pos < len(rest):
+            yield self.token_component(rest[pos:]), start + pos, start + len(rest)
+        if suffix:
+            yield None, start + len(rest), end
+
+    def token_component(self, token):
+        m = self.code_re.search(token)
+        return m.lastgroup if m else None
@@ -1,124 +1,184 @@
-from .tnm import TNMClassification, TNMMatch
-from ..spacy_util import load_spacy
-import spacy
+from .base_tnm import BaseTNMExtractor
+from ..spacy_util import load_spacy, create_tokenizer, pipe, model_lock, locked, nlp_to_bytes, restore_extractor, transform_docs
+from ..prefilter import Prefilter
+from ..instrumentation import timed, timed_iter, count_documents
 from spacy.matcher import Matcher
-from spacy.tokenizer import Tokenizer
+from spacy.tokens import Token
+import functools
 import regex as re
-import sys
-
-
-class RuleTNMExtractor():
-    __tnm_rules = {
-        'T': (r"[yra]{0,3}[upc]?T", r"([0-4][a-d]?|is|a|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
-        'N': (r"[yra]{0,3}[upc]?N", r"([0-3][a-d]?|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
-        'M': (r"[yra]{0,3}[upc]?M", r"([0-1][a-b]?|X|x)(?=(?:[^bdefghiklmnoqstvwxz]{0,3}[A-Z]|\s|$))"),
-        'L': (r"[uapc]?L", r"[0-1Xx]"),
-        'V': (r"[uapc]?V", r"[0-2Xx]"),
-        'Pn': (r"[uapc]?Pn", r"[0-1Xx]"),
-        'SX': (r"[uapc]?SX", r"[0-3Xx]"),
-        'R': (r"[uapc]?R", r"[0-2][ab]?"),
-        'G': (r"G", r"[1-4Xx]")
-    }
-
-    def __init__(self, language, allow_spaces=False, merge_matches=False, detect_parentheses=True):
-        self.allow_spaces = allow_spaces
-        self.merge_matches = merge_matches
-        self.detect_parentheses = detect_parentheses
-        self.nlp = load_spacy(language)
-        rules = self.nlp.Defaults.tokenizer_exceptions
 
-        infixes = list(self.nlp.Defaults.infixes)
-        infixes.append(r'[\(\)-/]')
-        infixes = spacy.util.compile_infix_regex(tuple(infixes)).finditer
 
-        prefixes = list(self.nlp.Defaults.prefixes)
-        prefixes.extend(list([v[0] + v[1] for v in self.__tnm_rules.values()]))
-        prefixes.append(r'[-/"§\$&\\]')
-        prefixes = spacy.util.compile_prefix_regex(tuple(prefixes)).search
-
-        suffixes = list(self.nlp.Defaults.suffixes)
-        suffixes = spacy.util.compile_suffix_regex(tuple(suffixes)).search
+class RuleTNMExtractor(BaseTNMExtractor):
 
-        self.nlp.tokenizer = Tokenizer(self.nlp.vocab,
-                                       rules=rules,
-                                       prefix_search=prefixes,
-                                       suffix_search=suffixes,
-                                       infix_finditer=infixes
-                                       )
+    def __init__(self, language, allow_spaces=False, merge_matches=False, detect_parentheses=True, tokenizer_only=False, nlp=None, prefilter=True,
+                 keep_spans=False, preclassify=True, stats=None, max_gap=None, split_sentences=False):
+        """If nlp is given, its (shared) tokenizer is used as is, and the language options are ignored
 
-        self.matcher = Matcher(self.nlp.vocab)
+        If preclassify is set, the patterns match on the token attributes tnm_code and tnm_axis (see register_token_classes)
+        instead of evaluating the regular expressions of all rules on every token. Both variants yield the same matches.
+        """
+        self.allow_spaces = allow_spaces
+        self.merge_matches = merge_matches
+        self.detect_parentheses = detect_parentheses
+        self.keep_spans = keep_spans
+        self.stats = stats
+        self.max_gap = max_gap
+        self.split_sentences = split_sentences
+        # Needed to rebuild the extractor around an unpickled pipeline
+        self.options = {'allow_spaces': allow_spaces, 'merge_matches': merge_matches, 'detect_parentheses': detect_parentheses,
+                        'prefilter': prefilter, 'keep_spans': keep_spans, 'preclassify': preclassify, 'max_gap': max_gap,
+                        'split_sentences': split_sentences}
+        self.prefilter = Prefilter(self.candidate_pattern()) if prefilter else None
+        if nlp is None:
+            self.nlp = load_spacy(language, tokenizer_only)
+            self.nlp.tokenizer = create_tokenizer(self.nlp, *self.tokenizer_affixes())
+        else:
+            self.nlp = nlp
+        # Held while processing texts, as the vocab may be shared with other extractors
+        self.lock = model_lock(self.nlp)
+
+        self.preclassify = preclassify
+        if preclassify:
+            self.register_token_classes()
+        self.__matcher = None
+
+    @property
+    def matcher(self):
+        """Matcher with the patterns of all rules, created on first use"""
+        if self.__matcher is None:
+            matcher = Matcher(self.nlp.vocab)
+            self.add_patterns(matcher)
+            self.__matcher = matcher
+        return self.__matcher
+
+    def pattern_pieces(self):
+        """Returns the token patterns shared by the rules, matching pre-classified tokens if preclassify is set
+
+        Returns:
+            (code, axis, space, in_parentheses, range_separator, range_value), where code and axis map a rule (component,
+            (axis, value) regexes) to the pattern of a complete code and of an axis only
+        """
+        if self.preclassify:
+            return (lambda k, v: {"_": {"tnm_code": k}},
+                    lambda k, v: {"_": {"tnm_axis": k}},
+                    {"IS_SPACE": True, "OP": "*"},
+                    {"TEXT": {"NOT_IN": ['(', ')']}, "OP": "+"},
+                    {"TEXT": {"IN": ['-', '/']}},
+                    {"TEXT": {"IN": list('0123456789Xxab')}})
+        return (lambda k, v: {"TEXT": {"REGEX": self._boundary + v[0] + v[1] + '$'}},
+                lambda k, v: {"TEXT": {"REGEX": self._boundary + v[0] + '$'}},
+                {"TEXT": {"REGEX": r'\s'}, "OP": "*"},
+                {"TEXT": {"REGEX": r'[^\(\)]'}, "OP": "+"},
+                {"TEXT": {"REGEX": r'^[-/]$'}},
+                {"TEXT": {"REGEX": r'^[0-9Xxab]$'}})
+
+    def add_patterns(self, matcher, prefix=''):
+        """Adds the patterns of all rules to matcher, labeled with the component prefixed by prefix (e.g., to share it with other rules)"""
+        code, axis, space, in_parentheses, range_separator, range_value = self.pattern_pieces()
 
         def add_rule(k, v):
-            if allow_spaces:
+            if self.allow_spaces:
                 # Multi-token version (e.g., spaces betw. T 1 instead of T1)
-                self.matcher.add(
-                    k,
+                matcher.add(
+                    prefix + k,
                     [
                         [
-                            {"TEXT": {"REGEX": '(?<![A-Za-z0-9])' + v[0] + '$'}},
+                            axis(k, v),
                             {"TEXT": {"REGEX": v[1]}}
                         ]
                     ]
                 )
                 if self.detect_parentheses:
-                    self.matcher.add(
-                        k,
+                    matcher.add(
+                        prefix + k,
                         [[
-                        {"TEXT": {"REGEX": '(?<![A-Za-z0-9])' + v[0] + '$'}},
+                        axis(k, v),
                         {"TEXT": {"REGEX": v[1]}},
-                        {"TEXT": {"REGEX": r'\s'}, "OP": "*"},
+                        space,
                         {"TEXT": '('},
-                        {"TEXT": {"REGEX": r'[^\(\)]'}, "OP": "+"},
+                        in_parentheses,
                         {"TEXT": ')'}
                     ]])
             # Single-token version
 
             pattern = \
                 [
-                    {
-                        "TEXT":
-                            {
-                                "REGEX": '(?<![A-Za-z0-9])' + v[0] + v[1] + '$'
-                            }
-                    }
+                    code(k, v)
                 ]
 
-            self.matcher.add(
-                k,
+            matcher.add(
+                prefix + k,
                 [pattern]
             )
 
-            self.matcher.add(k,  # None,
+            matcher.add(prefix + k,  # None,
                              [[
-                                 {"TEXT": {"REGEX": '(?<![A-Za-z0-9])' + v[0] + v[1] + '$'}},
-                                 {"TEXT": {"REGEX": r'^[-/]$'}},
-                                 {"TEXT": {"REGEX": r'^[0-9Xxab]$'}},
+                                 code(k, v),
+                                 range_separator,
+                                 range_value,
                              ]]
                              )
             if self.detect_parentheses:
-                self.matcher.add(k,
+                matcher.add(prefix + k,
                                  [[
-                                     {"TEXT": {
-                                         "REGEX": '(?<![A-Za-z0-9])' + v[0] + v[1] + '$'}},
-                                     {"TEXT": {"REGEX": r'\s'}, "OP": "*"},
+                                     code(k, v),
+                                     space,
                                      {"TEXT": '('},
-                                     {"TEXT": {"REGEX": r'[^\(\)]'}, "OP": "+"},
+                                     in_parentheses,
                                      {"TEXT": ')'}
                                  ]]
                                  )
 
-        for k, v in self.__tnm_rules.items():
+        for k, v in self._tnm_rules.items():
             add_rule(k, v)
 
         # Special cases
-        self.add_special_cases()
+        self.add_special_cases(matcher, prefix)
+
+    def __reduce__(self):
+        # The configured tokenizer and the vocab are pickled, the matcher is rebuilt from the rules
+        return (restore_extractor, (type(self), self.options) + nlp_to_bytes(self.nlp) + (self.stats,))
+
+    @classmethod
+    def register_token_classes(cls):
+        """Registers the token attributes tnm_code and tnm_axis, unless they are registered already
+
+        tnm_code is the component of a token that is a complete code (e.g., 'T' for pT1), tnm_axis the component of
+        a token that only names the axis (e.g., 'T' for pT, followed by the value after a space), and '' otherwise.
+        Each attribute is computed with a single regular expression combining all rules, cached per token text.
+        The attributes are global and the same for all extractors, so only the first extractor registers them, and their
+        caches are kept across extractors.
+        """
+        if Token.has_extension('tnm_code') and Token.has_extension('tnm_axis'):
+            return
+        code_re, axis_re = (re.compile(pattern) for pattern in cls.token_patterns())
+
+        def token_class(pattern):
+            @functools.lru_cache(maxsize=100000)
+            def search(text):
+                m = pattern.search(text)
+                return m.lastgroup if m else ''
+            return lambda token: search(token.text)
+
+        Token.set_extension('tnm_code', getter=token_class(code_re), force=True)
+        Token.set_extension('tnm_axis', getter=token_class(axis_re), force=True)
+
+    @classmethod
+    def tokenizer_affixes(cls):
+        """Custom (prefixes, infixes, suffixes) added to the language defaults of the tokenizer"""
+        prefixes = [v[0] + v[1] for v in cls._tnm_rules.values()]
+        prefixes.append(r'[-/"§\$&\\]')
+        # Dots are split off except after C and two digits, so that topography codes (e.g., C50.9) stay intact for rule packs
+        return prefixes, [r'[\(\)*+,\-/]', r'(?<![Cc][0-9]{2})\.'], []
 
-    def add_special_cases(self):
-        self.add_status_indicator()
+    def add_special_cases(self, matcher, prefix=''):
+        self.add_status_indicator(matcher, prefix)
+
+    def add_status_indicator(self, matcher, prefix=''):
+        space, in_parentheses = self.pattern_pieces()[2:4]
 
-    def add_status_indicator(self):
         def add(key, affixes):
-            self.matcher.add(key,
+            matcher.add(prefix + key,
                              [[
                                  {"TEXT": key},
                                  {"TEXT": "-"},
@@ -128,106 +188,52 @@ class RuleTNMExtractor():
                              ]]
                              )
             if self.detect_parentheses:
-                self.matcher.add(key,
+                matcher.add(prefix + key,
                                  [[
                                      {"TEXT": key},
                                      {"TEXT": "-"},
                                      {"LOWER": "status"},
                                      {"TEXT": ":", "OP": "?"},
                                      {"TEXT": {"REGEX": affixes}},
-                                     {"TEXT": {"REGEX": r'\s'}, "OP": "*"},
+                                     space,
                                      {"TEXT": '('},
-                                     {"TEXT": {"REGEX": r'[^\(\)]'}, "OP": "+"},
+                                     in_parentheses,
                                      {"TEXT": ')'}
                                  ]]
                                  )
 
-        add('R', "^[0-2][ab]?")
-        add('V', "^[0-2Xx]")
-        add('Pn', "^[0-1Xx]")
-        add('L', "^[0-1Xx]")
+        for key, affixes in self._status_rules.items():
+            add(key, affixes)
 
     def transform(self, text):
-        doc = self.nlp(text)
-        matches = self.matcher(doc)
-        results = []
-        cur_result = TNMClassification()
-        for match_id, start, end in matches:
-            span = doc[start:end]  # The matched span
-            tnmcomponent = self.nlp.vocab[match_id].text
-            match = re.match(
-                r'([yra]?)([yra]?)([yra]?)([upc]?)(.*)', span.text)
-            prefixes = []
-            for i in range(1, 5):
-                prefix = match.group(i)
-                if prefix:
-                    prefixes.append(prefix)
-            value = match.group(5)
-            # Component already seen, so start new TNM expression
-            if cur_result.hasvalue(tnmcomponent) and \
-                    not TNMMatch(span, None, value, None).contains(getattr(cur_result, tnmcomponent)):
-                results.append(cur_result)
-                cur_result = TNMClassification()
-            details = {}
-            if self.detect_parentheses:
-                if tnmcomponent == 'N':
-                    details, value = self.add_details_n(value, details)
-                else:
-                    details, value = self.add_details(value, details)
-            value = self.normalize_value(value)
-            cur_result.setvalue(tnmcomponent, TNMMatch(
-                span, prefixes, value, details))
-        if not cur_result.empty():
-            results.append(cur_result)
-        if self.merge_matches:
-            return self.do_merge_matches(results)
-        return results
-
-    def normalize_value(self, value):
-        m = re.match(r'(R|V|L|Pn)-Status.*(\d[ab]?)', value)
-        if m:
-            return m.group(1) + m.group(2)
-        return re.sub(' ', '', value)
-
-    __tnm_suffixes = r'is|mi|\d\-x|i\+|i\-|mol\-|mol\+|[a-d0-4mX]'
-    __suffix_separator = f'\s*,(?!\d)\s*|\s*(?<!\d),\s*|({__tnm_suffixes})\s+({__tnm_suffixes})'
-
-    def add_details(self, value, details):
-        # Any expression within braces
-        match = re.search(r'\((.*)\)', value)
-        if match:
-            other = match.group(1).strip()
-            if other:
-                split_list = re.split(self.__suffix_separator, other)
-                suffix_list = list(filter(None, split_list))
-                details['other'] = suffix_list
-            value = value[0:match.start()].strip()
-        return details, value
-
-    def add_details_n(self, value, details):
-        match = re.search(r'(\d+) ?\/ ?(\d+),?\s*', value)
-        if match:
-            details['lymphnodes_affected'] = int(match.group(1))
-            details['lymphnodes_examined'] = int(match.group(2))
-            value = value[:match.start()] + value[match.end():]
-        # Any expression within braces
-        return self.add_details(value, details)
-
-    def do_merge_matches(self, classifications):
-        """ Merge non-conflicting TNM matches"""
-        result = []
-        cur_tnm = None
-        for tnm in classifications:
-            if not cur_tnm:
-                cur_tnm = tnm
-                continue
-            merged = cur_tnm.merge(tnm)
-            if merged:
-                cur_tnm = merged
-            else:
-                result.append(cur_tnm)
-                result.append(tnm)
-                cur_tnm = None
-        if cur_tnm:
-            result.append(cur_tnm)
-        return result
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
+            return []
+        with self.lock:
+            doc = timed(self.stats, 'tokenizer', self.nlp, text)
+            if self.stats is not None:
+                self.stats.add_document(len(doc))
+            return self.transform_doc(doc)
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        docs = timed_iter(self.stats, 'tokenizer', pipe(self.nlp, texts, batch_size, n_process, as_tuples, self.prefilter))
+        results = ((self.transform_doc(doc) if doc is not None else [], context)
+                   for doc, context in count_documents(self.stats, docs))
+        for result, context in locked(results, self.lock):
+            yield (result, context) if as_tuples else result
+
+    def transform_docs(self, docs, as_tuples=False):
+        """Extracts TNM classifications from Docs created by another pipeline, retokenizing only around candidates (see spacy_util.align_tokens)"""
+        return transform_docs(self, docs, self.candidate_pattern(), list, as_tuples)
+
+    def transform_doc(self, doc):
+        return self.classify(timed(self.stats, 'matcher', self.doc_matches, doc), doc.text)
+
+    def doc_matches(self, doc):
+        """Returns the (component, span) candidates found by the matcher"""
+        return [(self.nlp.vocab[match_id].text, doc[start:end]) for match_id, start, end in self.matcher(doc)]
+
+    def find_matches_batch(self, texts, batch_size=1000, n_process=1):
+        matches = (self.doc_matches(doc) for doc, _ in pipe(self.nlp, texts, batch_size, n_process))
+        return locked(matches, self.lock)
@@ -1,24 +1,29 @@
 class TNMClassification:
     
     __keyset = ['T', 'N', 'M', 'L', 'V', 'Pn', 'SX', 'R', 'G']
+    __slots__ = __keyset + ['merged']
 
     def __init__(self):
-        self.values = {}
         self.merged = False
         for key in self.__keyset:
             setattr(self, key, None)
 
+    @property
+    def values(self):
+        """Dict of all components that are set"""
+        return {key: getattr(self, key) for key in self.__keyset if getattr(self, key) is not None}
+
     def hasvalue(self, key):
         self.__checkkey(key)
-        return key in self.values
+        return getattr(self, key) is not None
 
     def setvalue(self, key, value):
         self.__checkkey(key)
-        if key in self.values and not value.contains(self.values[key]):
+        current = getattr(self, key)
+        if current is not None and not value.contains(current):
             raise Exception('Property %s can only be written once' % key)
         if not value:
             return
-        self.values[key] = value
         setattr(self, key, value)
 
     def __checkkey(self, key):
@@ -26,12 +31,25 @@ class TNMClassification:
             raise Exception('Invalid key %s' % key)
 
     def empty(self):
-        return len(self.values) == 0
+        return all(getattr(self, key) is None for key in self.__keyset)
+
+    def shifted(self, offset):
+        """Returns a copy with all matches moved by offset, see Match.shifted"""
+        shifted = TNMClassification()
+        shifted.merged = self.merged
+        for key, match in self.values.items():
+            setattr(shifted, key, match.shifted(offset))
+        return shifted
 
     def __repr__(self):
-        res = [ ('%s: %s' % (key, self.values[key])) for key in self.__keyset if self.hasvalue(key)]
+        res = [ ('%s: %s' % (key, getattr(self, key))) for key in self.__keyset if self.hasvalue(key)]
         return 'TNM(%s)' % ', '.join(res)
 
+    def to_dict(self):
+        res = {key: getattr(self, key).to_dict() for key in self.__keyset if self.hasvalue(key)}
+        res['merged'] = self.merged
+        return res
+
     def merge(self, other_classification):
         merged = TNMClassification()
         merged.merged = True
@@ -48,10 +66,18 @@ class TNMClassification:
         return merged
 
 from onconlp.match import Match
+from onconlp.columnar import ColumnarResults
+from onconlp import aio, chunking, streaming
+from onconlp.spacy_util import read_docbin
+import json
+import os
+import threading
 
 class TNMMatch(Match):
-    def __init__(self, span, prefix, value, details):
-        super(TNMMatch, self).__init__(span, value)
+    __slots__ = ('prefix', 'details')
+
+    def __init__(self, span, prefix, value, details, keep_span=False):
+        super(TNMMatch, self).__init__(span, value, keep_span)
         self.prefix = prefix
         self.details = details
 
@@ -59,6 +85,12 @@ class TNMMatch(Match):
         return 'TNM-Match (%s | %s | %s, %d, %d)' % \
             (self.prefix, self.value, self.details, self.start, self.end)
 
+    def to_dict(self):
+        res = super(TNMMatch, self).to_dict()
+        res['prefix'] = self.prefix
+        res['details'] = self.details
+        return res
+
     def merge(self, other):
         if other is None:
             return self
@@ -74,11 +106,11 @@ class TNMMatch(Match):
             else:
                 return other
 
-from onconlp.classification import rulebased_tnm
-
 class TNMExtractor:
 
-    def __init__(self, language='de', allow_spaces=False, merge_matches=False, detect_parantheses=True):
+    def __init__(self, language='de', allow_spaces=False, merge_matches=False, detect_parantheses=True, tokenizer_only=False, engine='spacy', prefilter=True,
+                 keep_spans=False, cache=None, chunk_size=None, chunk_overlap=200, stats=None, nlp=None, lazy=False, max_gap=None,
+                 split_sentences=False):
         """Creates the TNM extractor
         
         Keyword Arguments:
@@ -86,8 +118,230 @@ class TNMExtractor:
             allow_spaces {bool} -- Are spaces inbetween allowed? Example: 'T 1' instead of 'T1' (default: {False})
             merge_matches {bool} -- Will multiple matches within the same string be merged, if possible without conflict? (default: {False})
             detect_parantheses {bool} -- Will parantheses after TNM parts be detected and analyzed? Example: N1 (2/3) (default: {True})
+            tokenizer_only {bool} -- Will only the tokenizer be run, skipping tagger, parser, NER, etc.? The extracted classifications are the same, as only tokens are matched (default: {False})
+            engine {str} -- 'spacy' matches the rules on spaCy tokens, 'regex' scans the raw text without loading a spaCy model. The results are the same on typical reports, but not guaranteed to be identical, see RegexTNMExtractor (default: {'spacy'})
+            prefilter {bool} -- Will texts without any possible TNM code be skipped after a quick scan? Counts are available via the prefilter property (default: {True})
+            keep_spans {bool} -- Will matches keep their spaCy span (and thereby the whole Doc) alive? Otherwise, only text and offsets are kept (default: {False})
+            cache {ResultCache} -- Cache for the results of repeated texts, which may be shared with other extractors. Results are cached per engine and options (default: {None})
+            chunk_size {int} -- Texts longer than this are split into chunks by transform, transform_batch and iter_transform (see transform_chunked), e.g. to stay below spaCy's max_length (default: {None})
+            chunk_overlap {int} -- Characters by which chunks overlap, which must exceed the length of the longest TNM expression (default: {200})
+            stats {Stats} -- Collects timing and counters of the extraction stages, see onconlp.instrumentation (default: {None})
+            nlp {Language} -- Pipeline with the extractor's tokenizer (e.g., saved with to_disk) used instead of loading a model, ignored by the regex engine (default: {None})
+            lazy {bool} -- Will importing spaCy and loading the model be deferred until the extractor is first used? (default: {False})
+            max_gap {int} -- Maximum number of characters between the parts of a classification, e.g. to keep far apart codes of follow-up tables separate. By default, a new classification only starts when a component repeats (default: {None})
+            split_sentences {bool} -- Will classifications end at sentence boundaries (sentence-final punctuation followed by whitespace, or an empty line)? (default: {False})
+        """
+        if cache is not None and keep_spans:
+            raise Exception('Results with spaCy spans cannot be cached')
+        if engine not in ['spacy', 'regex']:
+            raise Exception('Invalid engine %s' % engine)
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._config = ('tnm', engine, language, allow_spaces, merge_matches, detect_parantheses, max_gap, split_sentences)
+        # Saved by to_disk
+        self._options = {'language': language, 'allow_spaces': allow_spaces, 'merge_matches': merge_matches, 'detect_parantheses': detect_parantheses,
+                         'tokenizer_only': tokenizer_only, 'engine': engine, 'prefilter': prefilter, 'keep_spans': keep_spans,
+                         'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap, 'max_gap': max_gap, 'split_sentences': split_sentences}
+        self.__nlp = nlp
+        self.__stats = stats
+        self.__impl = None
+        self.__lock = threading.Lock()
+        if not lazy:
+            self.__create_impl()
+
+    def __create_impl(self):
+        # Engines depend on the classes above, so they are imported here to avoid circular imports. This also keeps
+        # importing this module fast, as spaCy is only imported with the spaCy engine
+        o = self._options
+        if o['engine'] == 'spacy':
+            from onconlp.classification import rulebased_tnm
+            self.__impl = rulebased_tnm.RuleTNMExtractor(o['language'], o['allow_spaces'], o['merge_matches'], o['detect_parantheses'],
+                                                         o['tokenizer_only'], self.__nlp, prefilter=o['prefilter'], keep_spans=o['keep_spans'],
+                                                         stats=self.__stats, max_gap=o['max_gap'], split_sentences=o['split_sentences'])
+        else:
+            from onconlp.classification import regex_tnm
+            self.__impl = regex_tnm.RegexTNMExtractor(o['allow_spaces'], o['merge_matches'], o['detect_parantheses'], o['prefilter'],
+                                                      o['keep_spans'], self.__stats, o['max_gap'], o['split_sentences'])
+        self.__nlp = None
+
+    @property
+    def _impl(self):
+        # Created on first use if the extractor is lazy
+        if self.__impl is None:
+            with self.__lock:
+                if self.__impl is None:
+                    self.__create_impl()
+        return self.__impl
+
+    @property
+    def loaded(self):
+        """Is the underlying extractor (and its spaCy model) loaded? Only false for lazy extractors that were not used yet"""
+        return self.__impl is not None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_TNMExtractor__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def to_disk(self, path):
+        """Saves the options and, for the spaCy engine, the configured tokenizer and vocab to a directory
+
+        Loading with from_disk skips building the tokenizer and, with tokenizer_only, reading the model. Extractors can also be pickled.
         """
-        self._impl = rulebased_tnm.RuleTNMExtractor(language, allow_spaces, merge_matches, detect_parantheses)
+        os.makedirs(path, exist_ok=True)
+        if self._options['engine'] == 'spacy':
+            self._impl.nlp.to_disk(os.path.join(path, 'nlp'))
+        with open(os.path.join(path, 'onconlp.json'), 'w') as f:
+            json.dump(self._options, f, indent=2)
+
+    @classmethod
+    def from_disk(cls, path, **kwargs):
+        """Loads an extractor saved with to_disk. Options that are not saved (cache, stats) can be passed as keyword arguments"""
+        with open(os.path.join(path, 'onconlp.json')) as f:
+            options = json.load(f)
+        options.update(kwargs)
+        if options['engine'] == 'spacy' and options.get('nlp') is None:
+            from onconlp.spacy_util import load_saved
+            options['nlp'] = load_saved(os.path.join(path, 'nlp'))
+        return cls(**options)
+
+    @property
+    def prefilter(self):
+        """The prefilter with its counts of processed and skipped documents, or None if disabled"""
+        return self._impl.prefilter
+
+    @property
+    def stats(self):
+        """The Stats object collecting timing and counters, or None if disabled"""
+        return self._impl.stats if self.loaded else self.__stats
 
     def transform(self, text):
-        return self._impl.transform(text)
\ No newline at end of file
+        if self.cache is not None:
+            return self.cache.transform(self._config, self._transform, text)
+        return self._transform(text)
+
+    def _transform(self, text):
+        if self.chunk_size and len(text) > self.chunk_size:
+            return self._impl.transform_chunked(text, self.chunk_size, self.chunk_overlap)
+        return self._impl.transform(text)
+
+    async def atransform(self, text, executor=None):
+        """Same as transform, but runs in executor without blocking the event loop (default: a shared worker thread, see onconlp.aio)"""
+        return await aio.run(executor, self.transform, text)
+
+    async def atransform_batch(self, texts, batch_size=1000, executor=None, n_process=1):
+        """Same as transform_batch, but runs in executor without blocking the event loop and returns a list"""
+        return await aio.run(executor, lambda: list(self.transform_batch(texts, batch_size, n_process)))
+
+    def transform_chunked(self, text, chunk_size=None, overlap=None, n_process=1):
+        """Extracts TNM classifications from a long text, which is split into chunks at paragraph, sentence or word boundaries
+
+        Offsets refer to the whole text, and the results are the same as for transform, as long as no TNM expression is longer than the overlap.
+
+        Keyword Arguments:
+            chunk_size {int} -- Maximum length of a chunk (default: {chunk_size of the extractor, or 100000})
+            overlap {int} -- Characters by which chunks overlap (default: {chunk_overlap of the extractor})
+            n_process {int} -- Number of processes the chunks are distributed to (default: {1})
+        """
+        return self._impl.transform_chunked(text, chunk_size or self.chunk_size or 100000,
+                                            self.chunk_overlap if overlap is None else overlap, n_process)
+
+    def transform_edit(self, text, results, offset, deleted, inserted):
+        """Updates the TNM classifications of text after an edit, matching only the text around it again
+
+        The results are the same as for transforming the edited text, as long as no TNM expression is longer than chunk_overlap.
+        The time taken depends on the size of the edit, not on the length of the text. Not supported with merge_matches or keep_spans.
+
+        Arguments:
+            text {str} -- Text before the edit
+            results {list} -- TNM classifications of text, e.g. from transform or a previous transform_edit (not modified)
+            offset {int} -- Position of the edit
+            deleted {int} -- Number of characters deleted at offset
+            inserted {str} -- Text inserted at offset
+
+        Returns:
+            (edited text, list of TNM classifications)
+        """
+        return self._impl.transform_edit(text, results, offset, deleted, inserted, self.chunk_overlap)
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts TNM classifications from a stream of texts using spaCy's nlp.pipe
+
+        Arguments:
+            texts {iterable} -- Texts, or (text, context) tuples if as_tuples is set
+
+        Keyword Arguments:
+            batch_size {int} -- Number of texts buffered per batch (default: {1000})
+            n_process {int} -- Number of processes used for tokenization (default: {1})
+            as_tuples {bool} -- Are texts (text, context) tuples, e.g. with document ids? If so, (result, context) tuples are yielded (default: {False})
+
+        Texts longer than chunk_size are transformed with transform_chunked.
+
+        Yields:
+            Lists of TNM classifications in input order
+        """
+        if self.cache is not None:
+            return self.cache.transform_batch(self._config, self._transform_batch, texts, batch_size, n_process, as_tuples)
+        return self._transform_batch(texts, batch_size, n_process, as_tuples)
+
+    def _transform_batch(self, texts, batch_size, n_process, as_tuples):
+        if self.chunk_size:
+            return chunking.transform_batch(self._impl, texts, self.chunk_size, self.chunk_overlap, batch_size, n_process, as_tuples)
+        return self._impl.transform_batch(texts, batch_size, n_process, as_tuples)
+
+    def iter_transform(self, texts, batch_size=100, n_process=1, max_in_flight=None, as_tuples=False):
+        """Yields (id, list of TNM classifications) tuples of a stream of texts as soon as they are ready, with bounded memory
+
+        Texts are read lazily and at most max_in_flight documents are in flight, also across worker processes (see onconlp.streaming).
+
+        Keyword Arguments:
+            batch_size {int} -- Number of texts per batch (default: {100})
+            n_process {int} -- Number of worker processes, -1 for all CPUs; results are then yielded as batches complete (default: {1})
+            max_in_flight {int} -- Maximum number of documents read but not yet yielded (default: {2 * n_process * batch_size})
+            as_tuples {bool} -- Are texts (text, id) tuples? Otherwise, the id is the position of the text (default: {False})
+        """
+        return streaming.iter_transform(self, texts, batch_size, n_process, max_in_flight, as_tuples)
+
+    def transform_docs(self, docs, as_tuples=False):
+        """Extracts TNM classifications from spaCy Docs created by another pipeline, e.g. read from a DocBin
+
+        The Docs are not tokenized again: only tokens around possible TNM expressions that differ from the custom tokenizer
+        are merged or split (see spacy_util.align_tokens), so that the results are the same as for their texts.
+        Results are not cached.
+
+        Arguments:
+            docs {iterable} -- Docs, or (doc, context) tuples if as_tuples is set
+
+        Yields:
+            Lists of TNM classifications in input order, or (result, context) tuples if as_tuples is set
+        """
+        return self._impl.transform_docs(docs, as_tuples)
+
+    def transform_docbin(self, paths, as_tuples=False):
+        """Extracts TNM classifications from the Docs of one or more DocBin files, see transform_docs
+
+        If as_tuples is set, (result, (path, index)) tuples are yielded.
+        """
+        nlp = getattr(self._impl, 'nlp', None)
+        results = self.transform_docs(read_docbin(paths, nlp.vocab if nlp is not None else None), as_tuples=True)
+        return results if as_tuples else (result for result, _ in results)
+
+    def transform_columns(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts TNM classifications from a stream of texts into columns with one row per match
+
+        Arguments and keyword arguments are the same as for transform_batch. If as_tuples is set, the contexts are stored in doc_ids.
+
+        Returns:
+            ColumnarResults, which can be converted with to_numpy, to_arrow or to_pandas
+        """
+        results = ColumnarResults()
+        if not as_tuples:
+            texts = ((text, None) for text in texts)
+        for result, context in self.transform_batch(texts, batch_size, n_process, as_tuples=True):
+            results.add_document(tnm=result, doc_id=context)
+        return results
\ No newline at end of file
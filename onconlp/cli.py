@@ -0,0 +1,239 @@
+"""Command-line runner for extracting TNM classifications and ICD-O codes from a corpus
+
+Example:
+    onconlp reports.jsonl --output results.jsonl --workers 4
+
+Results are written as JSON lines with the document id and the character offsets of all matches.
+Progress is checkpointed next to the output file, so that an interrupted run resumes where it stopped. Resuming is refused
+if the input has changed since (path, size or modification time).
+Output files ending in .parquet, .sqlite or .db are written in bulk with one row per match instead (see onconlp.sinks),
+without checkpoints; an existing output file is then only overwritten with --restart.
+With --workers, documents are distributed to worker processes in batches (see onconlp.streaming), and results are
+still written in input order.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+from onconlp import streaming
+
+
+def read_corpus(path, fmt=None, text_field='text', id_field='id'):
+    """Yields (text, id) tuples from a JSONL file, a CSV file or a directory of .txt files
+
+    Documents are always read in the same order, which is required for resuming from a checkpoint.
+    """
+    if fmt is None:
+        if os.path.isdir(path):
+            fmt = 'txt'
+        elif path.endswith('.csv'):
+            fmt = 'csv'
+        else:
+            fmt = 'jsonl'
+    if fmt == 'txt':
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.txt'):
+                    file_path = os.path.join(root, name)
+                    with open(file_path, encoding='utf-8') as f:
+                        yield f.read(), os.path.relpath(file_path, path)
+    elif fmt == 'csv':
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline='', encoding='utf-8') as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                yield row[text_field], row.get(id_field, i)
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    yield record[text_field], record.get(id_field, i)
+    else:
+        raise Exception('Invalid corpus format %s' % fmt)
+
+
+def to_json(result):
+    """Converts extraction results (lists and dicts of result objects) into JSON-serializable structures"""
+    if isinstance(result, list):
+        return [to_json(r) for r in result]
+    if isinstance(result, dict):
+        return {k: to_json(v) for k, v in result.items()}
+    return result.to_dict()
+
+
+def input_identity(path):
+    """Returns the absolute path, size and modification time of an input file, or of the .txt files of a directory"""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    files = 0
+    size = 0
+    mtime = 0
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            if name.endswith('.txt'):
+                stat = os.stat(os.path.join(root, name))
+                files += 1
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime_ns)
+    return {'path': os.path.abspath(path), 'files': files, 'size': size, 'mtime': mtime}
+
+
+class Checkpoint():
+    """Number of processed documents and the matching size of the output file, for a given input (see input_identity)"""
+
+    def __init__(self, path, input_path):
+        self.path = path
+        self.input = input_identity(input_path)
+
+    def load(self):
+        """Returns the (documents, offset) to resume from; raises an exception if the checkpoint was written for another input"""
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('input') != self.input:
+            raise Exception('Checkpoint %s was written for another or a modified input, use --restart to start over' % self.path)
+        return state['documents'], state['offset']
+
+    def save(self, documents, offset, done=False):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'documents': documents, 'offset': offset, 'done': done, 'input': self.input}, f)
+        os.replace(tmp_path, self.path)
+
+
+class CombinedExtractor():
+    """Runs several extractors on the same texts and merges their results into one dict per text
+
+    Arguments:
+        extractors {list} -- (key, extractor) tuples; results are stored under key, or merged into the dict if key is None
+    """
+
+    def __init__(self, extractors):
+        self.extractors = extractors
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        texts = list(texts) if as_tuples else [(text, None) for text in texts]
+        results = [{} for _ in texts]
+        for key, extractor in self.extractors:
+            for merged, (result, _) in zip(results, extractor.transform_batch(texts, batch_size, n_process, as_tuples=True)):
+                merged.update(result if key is None else {key: result})
+        return zip(results, (context for _, context in texts)) if as_tuples else iter(results)
+
+
+def create_runner(args):
+    """Returns a function that maps a stream of (text, id) tuples to (id, result dict) tuples in input order"""
+    cache = None
+    if args.cache:
+        from onconlp.cache import ResultCache
+        cache = ResultCache(path=args.cache)
+    tnm_options = {'language': args.language, 'allow_spaces': args.allow_spaces, 'merge_matches': args.merge_matches,
+                   'detect_parantheses': not args.no_parentheses, 'tokenizer_only': args.tokenizer_only, 'cache': cache,
+                   'max_gap': args.max_gap, 'split_sentences': args.split_sentences}
+    chunk_options = {'chunk_size': args.chunk_size, 'chunk_overlap': args.chunk_overlap}
+
+    if args.rule_packs and args.engine != 'spacy':
+        raise Exception('Rule packs require the spaCy engine')
+    if args.rule_packs and args.chunk_size:
+        raise Exception('Rule packs cannot be combined with --chunk-size')
+    # The extractors are run separately if long texts are split into chunks, which the pipeline does not support
+    if (set(args.extractors) == {'tnm', 'icd-o'} and args.engine == 'spacy' and not args.chunk_size) or args.rule_packs:
+        from onconlp.pipeline import OncoPipeline
+        extractor = OncoPipeline(rule_packs=args.rule_packs, drop_invalid=args.drop_invalid, **tnm_options)
+    else:
+        extractors = []
+        if 'tnm' in args.extractors:
+            from onconlp.classification.tnm import TNMExtractor
+            extractors.append(('tnm', TNMExtractor(engine=args.engine, **tnm_options, **chunk_options)))
+        if 'icd-o' in args.extractors:
+            from onconlp.diagnosis.icd_o import ICD_O_Extractor
+            extractors.append((None, ICD_O_Extractor(args.language, args.tokenizer_only, cache=cache, drop_invalid=args.drop_invalid,
+                                                     **chunk_options)))
+        extractor = CombinedExtractor(extractors)
+    return lambda items: streaming.iter_transform(extractor, items, args.batch_size, args.workers, as_tuples=True, ordered=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='onconlp', description=__doc__.splitlines()[0])
+    parser.add_argument('input', help='JSONL file, CSV file or directory of .txt files')
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'txt'], help='Input format (default: derived from the input path)')
+    parser.add_argument('--text-field', default='text', help='JSON field or CSV column with the text (default: text)')
+    parser.add_argument('--id-field', default='id', help='JSON field or CSV column with the document id (default: id, falls back to the line number)')
+    parser.add_argument('--output', '-o', default='-', help='Output JSONL, Parquet (.parquet) or SQLite (.sqlite, .db) file (default: stdout)')
+    parser.add_argument('--extractors', nargs='+', choices=['tnm', 'icd-o'], default=['tnm', 'icd-o'])
+    parser.add_argument('--language', default='de')
+    parser.add_argument('--engine', choices=['spacy', 'regex'], default='spacy', help='TNM engine (default: spacy)')
+    parser.add_argument('--allow-spaces', action='store_true')
+    parser.add_argument('--merge-matches', action='store_true')
+    parser.add_argument('--no-parentheses', action='store_true')
+    parser.add_argument('--tokenizer-only', action='store_true')
+    parser.add_argument('--max-gap', type=int, help='Maximum number of characters between the parts of a TNM classification')
+    parser.add_argument('--split-sentences', action='store_true', help='End TNM classifications at sentence boundaries')
+    parser.add_argument('--rule-packs', nargs='+', default=[], help='JSON or YAML rule packs with further entities, matched in the same pass as TNM and ICD-O')
+    parser.add_argument('--drop-invalid', action='store_true', help='Leave out invalid ICD-O codes (histology types missing from the bundled table are kept)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each with its own copy of the extractors, '
+                        '-1 for all CPUs (default: 1)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, help='Texts longer than this are processed in overlapping chunks, e.g. to stay below spaCy\'s max_length')
+    parser.add_argument('--chunk-overlap', type=int, default=200, help='Characters by which chunks overlap (default: 200)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint)')
+    parser.add_argument('--checkpoint-every', type=int, default=10000, help='Documents between checkpoints (default: 10000)')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over, or overwrite an existing '
+                        'Parquet or SQLite output')
+    parser.add_argument('--cache', help='SQLite file caching results of repeated texts across runs')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    run = create_runner(args)
+    corpus = read_corpus(args.input, args.format, args.text_field, args.id_field)
+
+    if args.output == '-':
+        for doc_id, result in run(corpus):
+            sys.stdout.write(json.dumps({'id': doc_id, **to_json(result)}, ensure_ascii=False) + '\n')
+        return 0
+
+    if args.output.endswith(('.parquet', '.sqlite', '.db')):
+        from onconlp.sinks import open_sink
+        if os.path.exists(args.output):
+            if not args.restart:
+                raise Exception('Output %s already exists, use --restart to overwrite it' % args.output)
+            os.remove(args.output)
+        with open_sink(args.output) as sink:
+            documents = sink.write_pairs(run(corpus))
+        print('Processed %d documents' % documents, file=sys.stderr)
+        return 0
+
+    checkpoint = Checkpoint(args.checkpoint or args.output + '.checkpoint', args.input)
+    documents, offset = (0, 0) if args.restart else checkpoint.load()
+    if documents:
+        print('Resuming after %d documents' % documents, file=sys.stderr)
+        corpus = itertools.islice(corpus, documents, None)
+
+    mode = 'r+b' if offset and os.path.exists(args.output) else 'wb'
+    with open(args.output, mode) as out:
+        # Drop results written after the last checkpoint
+        out.seek(offset)
+        out.truncate()
+        for doc_id, result in run(corpus):
+            out.write((json.dumps({'id': doc_id, **to_json(result)}, ensure_ascii=False) + '\n').encode('utf-8'))
+            documents += 1
+            if documents % args.checkpoint_every == 0:
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save(documents, out.tell())
+        out.flush()
+        os.fsync(out.fileno())
+        checkpoint.save(documents, out.tell(), done=True)
+    print('Processed %d documents' % documents, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Columnar output of extraction results for a whole batch of documents
+
+Results are flattened into one row per match and stored in parallel arrays, so that a corpus can be loaded
+into pandas or Arrow without keeping a TNMClassification object per match alive. Numeric columns are
+stdlib arrays, which numpy and pyarrow wrap without copying.
+"""
+from array import array
+
+
+class ColumnarResults():
+    """Parallel columns with one row per match
+
+    Columns:
+        doc -- Position of the document in the input
+        classification -- Index of the TNM classification within the document, or of the match among the ICD-O codes of its axis
+        component -- Index into components, e.g. 0 for T, 9 for an ICD-O morphology and 10 for a topography code
+        start, end -- Character offsets of the match
+        value -- Normalized value, e.g. 'T2' or '8140/3'
+        prefix_<p> -- 1 if the TNM prefix p (y, r, a, u, p, c) is present, else 0
+        lymphnodes_affected, lymphnodes_examined -- Lymph node counts of N matches, -1 if not given
+    """
+    components = ['T', 'N', 'M', 'L', 'V', 'Pn', 'SX', 'R', 'G', 'morphology', 'topography']
+    prefixes = ['y', 'r', 'a', 'u', 'p', 'c']
+
+    def __init__(self):
+        self.doc = array('q')
+        self.classification = array('q')
+        self.component = array('b')
+        self.start = array('q')
+        self.end = array('q')
+        self.value = []
+        self.prefix_flags = {p: array('b') for p in self.prefixes}
+        self.lymphnodes_affected = array('q')
+        self.lymphnodes_examined = array('q')
+        # Context of each document if results were created from (text, context) tuples, e.g. document ids
+        self.doc_ids = []
+        self.documents = 0
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return 'ColumnarResults(%d documents, %d matches)' % (self.documents, len(self))
+
+    def __add_row(self, doc, classification, component, match, prefixes=(), details=None):
+        self.doc.append(doc)
+        self.classification.append(classification)
+        self.component.append(self.components.index(component))
+        self.start.append(match.start)
+        self.end.append(match.end)
+        self.value.append(match.value)
+        for p, flags in self.prefix_flags.items():
+            flags.append(p in prefixes)
+        details = details or {}
+        self.lymphnodes_affected.append(details.get('lymphnodes_affected', -1))
+        self.lymphnodes_examined.append(details.get('lymphnodes_examined', -1))
+
+    def add_document(self, tnm=(), icd_o=None, doc_id=None):
+        """Appends the TNM classifications and the ICD-O result dict of the next document"""
+        doc = self.documents
+        self.documents += 1
+        self.doc_ids.append(doc_id)
+        for i, classification in enumerate(tnm):
+            for component in self.components[:-2]:
+                match = getattr(classification, component)
+                if match is not None:
+                    self.__add_row(doc, i, component, match, match.prefix or (), match.details)
+        if icd_o:
+            for axis in self.components[-2:]:
+                for i, match in enumerate(icd_o.get('icd-o', {}).get(axis, [])):
+                    self.__add_row(doc, i, axis, match)
+
+    def columns(self):
+        """Returns a dict of column name -> array (or list for value)"""
+        res = {
+            'doc': self.doc,
+            'classification': self.classification,
+            'component': self.component,
+            'start': self.start,
+            'end': self.end,
+            'value': self.value,
+        }
+        for p, flags in self.prefix_flags.items():
+            res['prefix_' + p] = flags
+        res['lymphnodes_affected'] = self.lymphnodes_affected
+        res['lymphnodes_examined'] = self.lymphnodes_examined
+        return res
+
+    def to_dict(self):
+        """Returns a dict of column name -> list, with component names instead of indices"""
+        res = {k: list(v) for k, v in self.columns().items()}
+        res['component'] = [self.components[c] for c in self.component]
+        return res
+
+    def to_numpy(self):
+        """Returns a dict of column name -> numpy array (requires numpy)"""
+        import numpy as np
+        res = {}
+        for k, v in self.columns().items():
+            if isinstance(v, array):
+                # Shares memory with the array, which must not be appended to afterwards
+                res[k] = np.frombuffer(v, dtype=v.typecode) if len(v) else np.zeros(0, dtype=v.typecode)
+            else:
+                res[k] = np.array(v, dtype=object)
+        return res
+
+    def to_arrow(self):
+        """Returns a pyarrow Table with component as dictionary-encoded column (requires pyarrow)"""
+        import pyarrow as pa
+        columns = {k: pa.array(v) for k, v in self.to_numpy().items() if k != 'value'}
+        columns['value'] = pa.array(self.value, type=pa.string())
+        columns['component'] = pa.DictionaryArray.from_arrays(columns['component'], pa.array(self.components))
+        return pa.table({k: columns[k] for k in self.columns()})
+
+    def to_pandas(self):
+        """Returns a pandas DataFrame with component as categorical column (requires pandas)"""
+        import pandas as pd
+        columns = self.to_numpy()
+        columns['component'] = pd.Categorical.from_codes(columns['component'], categories=self.components)
+        return pd.DataFrame(columns)
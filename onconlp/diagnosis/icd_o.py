@@ -1,9 +1,206 @@
-from onconlp.diagnosis import rulebased_icd_o
+from onconlp.columnar import ColumnarResults
+from onconlp import aio, chunking, streaming
+from onconlp.spacy_util import read_docbin
+import json
+import os
+import threading
 
 class ICD_O_Extractor:
 
-    def __init__(self, language='de'):
-        self._impl = rulebased_icd_o.RuleICD_O_Extractor(language)
+    def __init__(self, language='de', tokenizer_only=False, prefilter=True, keep_spans=False, cache=None, chunk_size=None, chunk_overlap=200, stats=None,
+                 nlp=None, lazy=False, drop_invalid=False):
+        """Creates the ICD-O extractor
+
+        Keyword Arguments:
+            language {str} -- Language String (important for tokenization) (default: {'de'})
+            tokenizer_only {bool} -- Will only the tokenizer be run, skipping tagger, parser, NER, etc.? The extracted codes are the same, as only tokens are matched (default: {False})
+            prefilter {bool} -- Will texts without any possible ICD-O code be skipped after a quick scan? Counts are available via the prefilter property (default: {True})
+            keep_spans {bool} -- Will matches keep their spaCy span (and thereby the whole Doc) alive? Otherwise, only text and offsets are kept (default: {False})
+            cache {ResultCache} -- Cache for the results of repeated texts, which may be shared with other extractors (default: {None})
+            chunk_size {int} -- Texts longer than this are split into chunks by transform, transform_batch and iter_transform (see transform_chunked) (default: {None})
+            chunk_overlap {int} -- Characters by which chunks overlap (default: {200})
+            stats {Stats} -- Collects timing and counters of the extraction stages, see onconlp.instrumentation (default: {None})
+            nlp {Language} -- Pipeline with the extractor's tokenizer (e.g., saved with to_disk) used instead of loading a model (default: {None})
+            lazy {bool} -- Will importing spaCy and loading the model be deferred until the extractor is first used? (default: {False})
+            drop_invalid {bool} -- Will invalid codes (e.g., dates or lab values like 1234/5) be left out? Otherwise, they are kept with valid=False. Histology types missing from the bundled table are always kept (default: {False})
+        """
+        if cache is not None and keep_spans:
+            raise Exception('Results with spaCy spans cannot be cached')
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._config = ('icd-o', language, drop_invalid)
+        # Saved by to_disk
+        self._options = {'language': language, 'tokenizer_only': tokenizer_only, 'prefilter': prefilter, 'keep_spans': keep_spans,
+                         'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap, 'drop_invalid': drop_invalid}
+        self.__nlp = nlp
+        self.__stats = stats
+        self.__impl = None
+        self.__lock = threading.Lock()
+        if not lazy:
+            self.__create_impl()
+
+    def __create_impl(self):
+        # Imported here, so that importing this module does not import spaCy
+        from onconlp.diagnosis import rulebased_icd_o
+        o = self._options
+        self.__impl = rulebased_icd_o.RuleICD_O_Extractor(o['language'], o['tokenizer_only'], self.__nlp, prefilter=o['prefilter'],
+                                                          keep_spans=o['keep_spans'], stats=self.__stats, drop_invalid=o['drop_invalid'])
+        self.__nlp = None
+
+    @property
+    def _impl(self):
+        # Created on first use if the extractor is lazy
+        if self.__impl is None:
+            with self.__lock:
+                if self.__impl is None:
+                    self.__create_impl()
+        return self.__impl
+
+    @property
+    def loaded(self):
+        """Is the underlying extractor (and its spaCy model) loaded? Only false for lazy extractors that were not used yet"""
+        return self.__impl is not None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_ICD_O_Extractor__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def to_disk(self, path):
+        """Saves the options and the configured tokenizer and vocab to a directory, see TNMExtractor.to_disk"""
+        os.makedirs(path, exist_ok=True)
+        self._impl.nlp.to_disk(os.path.join(path, 'nlp'))
+        with open(os.path.join(path, 'onconlp.json'), 'w') as f:
+            json.dump(self._options, f, indent=2)
+
+    @classmethod
+    def from_disk(cls, path, **kwargs):
+        """Loads an extractor saved with to_disk. Options that are not saved (cache, stats) can be passed as keyword arguments"""
+        with open(os.path.join(path, 'onconlp.json')) as f:
+            options = json.load(f)
+        options.update(kwargs)
+        if options.get('nlp') is None:
+            from onconlp.spacy_util import load_saved
+            options['nlp'] = load_saved(os.path.join(path, 'nlp'))
+        return cls(**options)
+
+    @property
+    def prefilter(self):
+        """The prefilter with its counts of processed and skipped documents, or None if disabled"""
+        return self._impl.prefilter
+
+    @property
+    def stats(self):
+        """The Stats object collecting timing and counters, or None if disabled"""
+        return self._impl.stats if self.loaded else self.__stats
 
     def transform(self, text):
-        return self._impl.transform(text)
\ No newline at end of file
+        if self.cache is not None:
+            return self.cache.transform(self._config, self._transform, text)
+        return self._transform(text)
+
+    def _transform(self, text):
+        if self.chunk_size and len(text) > self.chunk_size:
+            return self._impl.transform_chunked(text, self.chunk_size, self.chunk_overlap)
+        return self._impl.transform(text)
+
+    async def atransform(self, text, executor=None):
+        """Same as transform, but runs in executor without blocking the event loop (default: a shared worker thread, see onconlp.aio)"""
+        return await aio.run(executor, self.transform, text)
+
+    async def atransform_batch(self, texts, batch_size=1000, executor=None, n_process=1):
+        """Same as transform_batch, but runs in executor without blocking the event loop and returns a list"""
+        return await aio.run(executor, lambda: list(self.transform_batch(texts, batch_size, n_process)))
+
+    def transform_chunked(self, text, chunk_size=None, overlap=None, n_process=1):
+        """Extracts ICD-O codes from a long text, which is split into chunks at paragraph, sentence or word boundaries
+
+        Keyword Arguments:
+            chunk_size {int} -- Maximum length of a chunk (default: {chunk_size of the extractor, or 100000})
+            overlap {int} -- Characters by which chunks overlap (default: {chunk_overlap of the extractor})
+            n_process {int} -- Number of processes the chunks are distributed to (default: {1})
+        """
+        return self._impl.transform_chunked(text, chunk_size or self.chunk_size or 100000,
+                                            self.chunk_overlap if overlap is None else overlap, n_process)
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts ICD-O codes from a stream of texts using spaCy's nlp.pipe
+
+        Arguments:
+            texts {iterable} -- Texts, or (text, context) tuples if as_tuples is set
+
+        Keyword Arguments:
+            batch_size {int} -- Number of texts buffered per batch (default: {1000})
+            n_process {int} -- Number of processes used for tokenization (default: {1})
+            as_tuples {bool} -- Are texts (text, context) tuples, e.g. with document ids? If so, (result, context) tuples are yielded (default: {False})
+
+        Texts longer than chunk_size are transformed with transform_chunked.
+
+        Yields:
+            ICD-O result dicts in input order
+        """
+        if self.cache is not None:
+            return self.cache.transform_batch(self._config, self._transform_batch, texts, batch_size, n_process, as_tuples)
+        return self._transform_batch(texts, batch_size, n_process, as_tuples)
+
+    def _transform_batch(self, texts, batch_size, n_process, as_tuples):
+        if self.chunk_size:
+            return chunking.transform_batch(self._impl, texts, self.chunk_size, self.chunk_overlap, batch_size, n_process, as_tuples)
+        return self._impl.transform_batch(texts, batch_size, n_process, as_tuples)
+
+    def iter_transform(self, texts, batch_size=100, n_process=1, max_in_flight=None, as_tuples=False):
+        """Yields (id, result dict) tuples of a stream of texts as soon as they are ready, with bounded memory
+
+        Texts are read lazily and at most max_in_flight documents are in flight, also across worker processes (see onconlp.streaming).
+
+        Keyword Arguments:
+            batch_size {int} -- Number of texts per batch (default: {100})
+            n_process {int} -- Number of worker processes, -1 for all CPUs; results are then yielded as batches complete (default: {1})
+            max_in_flight {int} -- Maximum number of documents read but not yet yielded (default: {2 * n_process * batch_size})
+            as_tuples {bool} -- Are texts (text, id) tuples? Otherwise, the id is the position of the text (default: {False})
+        """
+        return streaming.iter_transform(self, texts, batch_size, n_process, max_in_flight, as_tuples)
+
+    def transform_docs(self, docs, as_tuples=False):
+        """Extracts ICD-O codes from spaCy Docs created by another pipeline, e.g. read from a DocBin
+
+        The Docs are not tokenized again: only tokens around possible codes that differ from the custom tokenizer
+        are merged or split (see spacy_util.align_tokens), so that the results are the same as for their texts.
+        Results are not cached.
+
+        Arguments:
+            docs {iterable} -- Docs, or (doc, context) tuples if as_tuples is set
+
+        Yields:
+            ICD-O result dicts in input order, or (result, context) tuples if as_tuples is set
+        """
+        return self._impl.transform_docs(docs, as_tuples)
+
+    def transform_docbin(self, paths, as_tuples=False):
+        """Extracts ICD-O codes from the Docs of one or more DocBin files, see transform_docs
+
+        If as_tuples is set, (result, (path, index)) tuples are yielded.
+        """
+        nlp = getattr(self._impl, 'nlp', None)
+        results = self.transform_docs(read_docbin(paths, nlp.vocab if nlp is not None else None), as_tuples=True)
+        return results if as_tuples else (result for result, _ in results)
+
+    def transform_columns(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts ICD-O codes from a stream of texts into columns with one row per match
+
+        Arguments and keyword arguments are the same as for transform_batch. If as_tuples is set, the contexts are stored in doc_ids.
+
+        Returns:
+            ColumnarResults, which can be converted with to_numpy, to_arrow or to_pandas
+        """
+        results = ColumnarResults()
+        if not as_tuples:
+            texts = ((text, None) for text in texts)
+        for result, context in self.transform_batch(texts, batch_size, n_process, as_tuples=True):
+            results.add_document(icd_o=result, doc_id=context)
+        return results
\ No newline at end of file
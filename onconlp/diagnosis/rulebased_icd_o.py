@@ -1,54 +1,88 @@
-import spacy
 from spacy.matcher import Matcher
-from spacy.tokenizer import Tokenizer
-from onconlp.spacy_util import load_spacy
-from onconlp.match import Match
-import regex as re
+from onconlp.spacy_util import load_spacy, create_tokenizer, pipe, model_lock, locked, nlp_to_bytes, restore_extractor, transform_docs
+from onconlp.rulepacks import load_rule_pack
+from onconlp.prefilter import Prefilter
+from onconlp import chunking
+from onconlp.instrumentation import timed, timed_iter, count_documents
 
 
 class RuleICD_O_Extractor():
-    
-    def __init__(self, language):
-        self.nlp = load_spacy(language)
 
-        custom_infixes = ['/']
-        all_prefixes_re = spacy.util.compile_prefix_regex(tuple(list(self.nlp.Defaults.prefixes) + custom_infixes))
+    # Patterns, tokenizer affixes and normalizers, see onconlp/rulepacks/icd_o.json
+    rules = load_rule_pack('icd_o')
+    # Found in every text that contains a morphology or topography code
+    candidate_pattern = rules.candidate_pattern
 
-        infix_re = spacy.util.compile_infix_regex(tuple(list(self.nlp.Defaults.infixes) + custom_infixes))
-
-        suffix_re = spacy.util.compile_suffix_regex(tuple(list(self.nlp.Defaults.suffixes) + custom_infixes))   
-
-        self.nlp.tokenizer = Tokenizer(self.nlp.vocab, self.nlp.Defaults.tokenizer_exceptions,
-                        prefix_search = all_prefixes_re.search, 
-                        infix_finditer = infix_re.finditer, 
-                        suffix_search = suffix_re.search,
-                        token_match=None)
+    def __init__(self, language, tokenizer_only=False, nlp=None, prefilter=True, keep_spans=False, stats=None, drop_invalid=False):
+        """If nlp is given, its (shared) tokenizer is used as is, and the language options are ignored"""
+        self.keep_spans = keep_spans
+        self.stats = stats
+        self.drop_invalid = drop_invalid
+        # Needed to rebuild the extractor around an unpickled pipeline
+        self.options = {'prefilter': prefilter, 'keep_spans': keep_spans, 'drop_invalid': drop_invalid}
+        self.prefilter = Prefilter(self.candidate_pattern) if prefilter else None
+        if nlp is None:
+            self.nlp = load_spacy(language, tokenizer_only)
+            self.nlp.tokenizer = create_tokenizer(self.nlp, *self.tokenizer_affixes())
+        else:
+            self.nlp = nlp
+        # Held while processing texts, as the vocab may be shared with other extractors
+        self.lock = model_lock(self.nlp)
         
         self.matcher = Matcher(self.nlp.vocab)
+        self.rules.add_patterns(self.matcher)
 
-        self.matcher.add('morphology',
-                         [[
-                             {"TEXT": {"REGEX" : r'^\d\d\d\d$'}},
-                             {"TEXT": {"REGEX" : r'\s'}, "OP" : "*"},
-                             {"TEXT": '/'},
-                             {"TEXT": {"REGEX" : r'\s'}, "OP" : "*"},
-                             {"TEXT": {"REGEX" : r'\d'}},
-                        ]]
-        )
-        
+    def __reduce__(self):
+        # The configured tokenizer and the vocab are pickled, the matcher is rebuilt
+        return (restore_extractor, (type(self), self.options) + nlp_to_bytes(self.nlp) + (self.stats,))
+
+    @classmethod
+    def tokenizer_affixes(cls):
+        """Custom (prefixes, infixes, suffixes) added to the language defaults of the tokenizer"""
+        return cls.rules.tokenizer_affixes()
 
     def transform(self, text):
-        morphology = []
-        doc = self.nlp(text)        
-        matches = self.matcher(doc)
-        for match_id, start, end in matches:
-            span = doc[start:end]  # The matched span
-            match_type = self.nlp.vocab[match_id].text
-            assert match_type == 'morphology' # Only one type right now
-            morphology.append(Match(span, re.sub(r'\s', '', span.text)))
-        if morphology:
-            return {'icd-o' : {
-                'morphology' : morphology
-            }}
-        else:
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
+            return {}
+        with self.lock:
+            doc = timed(self.stats, 'tokenizer', self.nlp, text)
+            if self.stats is not None:
+                self.stats.add_document(len(doc))
+            return self.transform_doc(doc)
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        docs = timed_iter(self.stats, 'tokenizer', pipe(self.nlp, texts, batch_size, n_process, as_tuples, self.prefilter))
+        results = ((self.transform_doc(doc) if doc is not None else {}, context)
+                   for doc, context in count_documents(self.stats, docs))
+        for result, context in locked(results, self.lock):
+            yield (result, context) if as_tuples else result
+
+    def transform_chunked(self, text, chunk_size, overlap=200, n_process=1):
+        """Transforms a long text in chunks of at most chunk_size characters, see onconlp.chunking"""
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
             return {}
+        if self.stats is not None:
+            self.stats.add_document()
+        return self.to_result(timed(self.stats, 'matcher', chunking.find_matches, self, text, chunk_size, overlap, n_process))
+
+    def transform_docs(self, docs, as_tuples=False):
+        """Extracts ICD-O codes from Docs created by another pipeline, retokenizing only around candidates (see spacy_util.align_tokens)"""
+        return transform_docs(self, docs, self.candidate_pattern, dict, as_tuples)
+
+    def transform_doc(self, doc):
+        return self.to_result(timed(self.stats, 'matcher', self.doc_matches, doc))
+
+    def doc_matches(self, doc):
+        """Returns the (match type, span) candidates found by the matcher"""
+        return [(self.nlp.vocab[match_id].text, doc[start:end]) for match_id, start, end in self.matcher(doc)]
+
+    def find_matches_batch(self, texts, batch_size=1000, n_process=1):
+        matches = (self.doc_matches(doc) for doc, _ in pipe(self.nlp, texts, batch_size, n_process))
+        return locked(matches, self.lock)
+
+    def to_result(self, matches):
+        return self.rules.to_result(matches, self.keep_spans, self.stats, self.drop_invalid)
@@ -0,0 +1,153 @@
+"""Optional timing and counters for the extraction stages
+
+Pass a Stats object to an extractor to collect:
+    time -- Wall time per stage: 'tokenizer' (nlp(text), i.e. only the tokenizer if tokenizer_only is set, or aligning the tokens of given Docs),
+            'matcher' (finding candidates), 'postprocess' (grouping, details and normalization) and 'merge' (merge_matches)
+    counts -- 'documents', 'skipped' (by the prefilter), 'tokens', 'split_repeated' (classifications ended because a component
+              repeats, e.g. between 'pT1 N0, pT1 M1', which is the usual case, not an ambiguity), 'separated' (classifications
+              split by max_gap or split_sentences), 'rejected' (merges rejected because of conflicting values), 'invalid'
+              (codes dropped by drop_invalid), 'unknown' (codes neither confirmed nor rejected by their lookup), 'retokenized' (tokens of given Docs merged or split, see spacy_util.align_tokens)
+    matches -- Number of matches per component
+
+Exporters are called with the Stats object at most every interval seconds, e.g. PrometheusExporter.
+Without a Stats object, the extractors only check for None, so that the overhead is negligible.
+With multiple worker processes, only the work done in the calling process is counted.
+"""
+from collections import Counter, defaultdict
+import os
+import threading
+import time
+
+
+class Stats():
+
+    def __init__(self, exporters=(), interval=60.0):
+        self.exporters = list(exporters)
+        self.interval = interval
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.time = defaultdict(float)
+            self.counts = Counter()
+            self.matches = Counter()
+            self.__last_export = time.monotonic()
+
+    def add_time(self, stage, seconds):
+        with self.__lock:
+            self.time[stage] += seconds
+
+    def count(self, name, n=1):
+        with self.__lock:
+            self.counts[name] += n
+
+    def add_match(self, component):
+        with self.__lock:
+            self.matches[component] += 1
+
+    def add_document(self, tokens=0, skipped=False):
+        with self.__lock:
+            self.counts['documents'] += 1
+            self.counts['tokens'] += tokens
+            if skipped:
+                self.counts['skipped'] += 1
+            due = self.exporters and time.monotonic() - self.__last_export >= self.interval
+        if due:
+            self.export()
+
+    def export(self):
+        """Calls all exporters with the current stats"""
+        with self.__lock:
+            self.__last_export = time.monotonic()
+        for exporter in self.exporters:
+            exporter(self)
+
+    def to_dict(self):
+        with self.__lock:
+            return {'time': dict(self.time), 'counts': dict(self.counts), 'matches': dict(self.matches)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_Stats__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __repr__(self):
+        stages = ', '.join('%s: %.3fs' % (stage, t) for stage, t in self.time.items())
+        return 'Stats (%d documents, %d matches, %s)' % (self.counts['documents'], sum(self.matches.values()), stages)
+
+
+def timed(stats, stage, func, *args):
+    """Returns func(*args), adding its wall time to stage if stats is not None"""
+    if stats is None:
+        return func(*args)
+    start = time.perf_counter()
+    result = func(*args)
+    stats.add_time(stage, time.perf_counter() - start)
+    return result
+
+
+def timed_iter(stats, stage, iterable):
+    """Iterates, adding the time spent in the iterable (but not in the consumer) to stage if stats is not None"""
+    if stats is None:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            stats.add_time(stage, time.perf_counter() - start)
+            return
+        stats.add_time(stage, time.perf_counter() - start)
+        yield item
+
+
+def count_documents(stats, docs):
+    """Counts documents and tokens of (doc, context) tuples as yielded by spacy_util.pipe, where doc is None if skipped"""
+    if stats is None:
+        yield from docs
+        return
+    for doc, context in docs:
+        stats.add_document(len(doc) if doc is not None else 0, doc is None)
+        yield doc, context
+
+
+class PrometheusExporter():
+    """Writes the stats in the Prometheus text format to a file, e.g. for the textfile collector of the node exporter"""
+
+    def __init__(self, path, prefix='onconlp', labels=None):
+        self.path = path
+        self.prefix = prefix
+        self.labels = labels or {}
+
+    def __call__(self, stats):
+        values = stats.to_dict()
+        lines = []
+
+        def metric(name, help, samples):
+            name = '%s_%s' % (self.prefix, name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s counter' % name)
+            for labels, value in samples:
+                labels = dict(self.labels, **labels)
+                label_str = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in sorted(labels.items()))
+                lines.append('%s%s %s' % (name, '{%s}' % label_str if label_str else '', repr(float(value))))
+
+        metric('stage_seconds_total', 'Wall time per extraction stage', [({'stage': s}, t) for s, t in sorted(values['time'].items())])
+        for name, help in [('documents', 'Number of documents'), ('skipped', 'Number of documents skipped by the prefilter'),
+                           ('tokens', 'Number of tokens')]:
+            metric('%s_total' % name, help, [({}, values['counts'].get(name, 0))])
+        metric('matches_total', 'Number of matches per component', [({'component': c}, n) for c, n in sorted(values['matches'].items())])
+        metric('groupings_total', 'TNM groupings split by a repeated component, separated or rejected',
+               [({'outcome': o}, values['counts'].get(o, 0)) for o in ['split_repeated', 'separated', 'rejected']])
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
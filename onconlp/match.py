@@ -1,14 +1,55 @@
 class Match():
-    def __init__(self, span, value):
-        self.span = span
+    __slots__ = ('span', 'token', 'value', 'start', 'end', 'label', 'valid')
+
+    def __init__(self, span, value, keep_span=False, label=None, valid=None):
+        """Only text and offsets of the span are kept, unless keep_span is set (a spaCy Span keeps its whole Doc alive)
+
+        label and valid are set for values looked up in a code table (e.g., 'Breast, NOS' for C50.9), else None,
+        also for values the table neither confirms nor rejects
+        """
+        self.span = span if keep_span else None
         self.token = span.text
         self.value = value
-        self.start = span[0].idx
-        self.end = span[0].idx + len(span.text)
+        self.start = span.start_char
+        self.end = span.end_char
+        self.label = label
+        self.valid = valid
     
     def contains(self, other):
         return self.start <= other.start and self.end >= other.end
 
+    def shifted(self, offset):
+        """Returns a copy with start and end moved by offset (e.g., after an edit in front of the match), without the span"""
+        match = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                setattr(match, name, getattr(self, name))
+        match.span = None
+        match.start += offset
+        match.end += offset
+        return match
+
+    def to_dict(self):
+        res = {'token': self.token, 'value': self.value, 'start': self.start, 'end': self.end}
+        if self.valid is not None:
+            res['label'] = self.label
+            res['valid'] = self.valid
+        return res
+
     def __repr__(self):
         return 'Match (%s, %d, %d)' % \
-            (self.value, self.start, self.end) 
\ No newline at end of file
+            (self.value, self.start, self.end) 
+
+
+class TextSpan():
+    """Minimal stand-in for a spaCy Span, used by engines that match on raw text"""
+    __slots__ = ('text', 'start_char', 'end_char')
+
+    def __init__(self, text, start_char, end_char):
+        self.text = text
+        self.start_char = start_char
+        self.end_char = end_char
+
+    def __repr__(self):
+        return 'TextSpan (%s, %d, %d)' % \
+            (self.text, self.start_char, self.end_char)
@@ -0,0 +1,149 @@
+from onconlp.spacy_util import load_spacy, create_tokenizer, pipe, model_lock, locked
+from onconlp.rulepacks import load_rule_pack
+from onconlp.prefilter import Prefilter
+from onconlp.columnar import ColumnarResults
+from onconlp import aio
+from onconlp.instrumentation import timed, timed_iter, count_documents
+
+
+class OncoPipeline:
+
+    def __init__(self, language='de', allow_spaces=False, merge_matches=False, detect_parantheses=True, tokenizer_only=False, prefilter=True,
+                 keep_spans=False, cache=None, stats=None, rule_packs=(), drop_invalid=False, max_gap=None, split_sentences=False):
+        """Creates a pipeline that extracts TNM classifications, ICD-O codes and the entities of further rule packs in a single pass
+
+        The model is loaded once, the tokenizer combines the custom affixes of all rules, and a single Matcher finds the
+        candidates of all rules.
+
+        Keyword Arguments:
+            language {str} -- Language String (important for tokenization) (default: {'de'})
+            allow_spaces {bool} -- Are spaces inbetween allowed? Example: 'T 1' instead of 'T1' (default: {False})
+            merge_matches {bool} -- Will multiple TNM matches within the same string be merged, if possible without conflict? (default: {False})
+            detect_parantheses {bool} -- Will parantheses after TNM parts be detected and analyzed? Example: N1 (2/3) (default: {True})
+            tokenizer_only {bool} -- Will only the tokenizer be run, skipping tagger, parser, NER, etc.? (default: {False})
+            prefilter {bool} -- Will texts without any possible TNM or ICD-O code be skipped after a quick scan? (default: {True})
+            keep_spans {bool} -- Will matches keep their spaCy span (and thereby the whole Doc) alive? Otherwise, only text and offsets are kept (default: {False})
+            cache {ResultCache} -- Cache for the results of repeated texts, which may be shared with other extractors (default: {None})
+            stats {Stats} -- Collects timing and counters of the extraction stages, see onconlp.instrumentation (default: {None})
+            rule_packs {list} -- Further rule packs as names of bundled ones, paths of JSON or YAML files or dicts, see onconlp.rulepacks (default: {()})
+            drop_invalid {bool} -- Will codes rejected by the lookup of a rule pack (e.g., ICD-O codes missing from the ICD-O-3 table) be left out? (default: {False})
+            max_gap {int} -- Maximum number of characters between the parts of a TNM classification, see TNMExtractor (default: {None})
+            split_sentences {bool} -- Will TNM classifications end at sentence boundaries? (default: {False})
+        """
+        if cache is not None and keep_spans:
+            raise Exception('Results with spaCy spans cannot be cached')
+        self.cache = cache
+        self.stats = stats
+        self.keep_spans = keep_spans
+        self.drop_invalid = drop_invalid
+        self.rule_packs = [load_rule_pack(p) for p in ['icd_o'] + list(rule_packs)]
+        names = [pack.name for pack in self.rule_packs]
+        if len(set(names)) < len(names):
+            raise Exception('Rule pack names must be unique: %s' % ', '.join(names))
+        self._config = (('pipeline', language, allow_spaces, merge_matches, detect_parantheses, drop_invalid, max_gap, split_sentences)
+                        + tuple((pack.name, pack.digest) for pack in self.rule_packs))
+        # Imported here, so that importing this module does not import spaCy
+        from onconlp.classification.rulebased_tnm import RuleTNMExtractor
+        from spacy.matcher import Matcher
+        self.nlp = load_spacy(language, tokenizer_only)
+        prefixes, infixes, suffixes = [], [], []
+        for p, i, s in [RuleTNMExtractor.tokenizer_affixes()] + [pack.tokenizer_affixes() for pack in self.rule_packs]:
+            prefixes += p
+            infixes += i
+            suffixes += s
+        self.nlp.tokenizer = create_tokenizer(self.nlp, prefixes, infixes, suffixes)
+        self.lock = model_lock(self.nlp)
+
+        # Only used for grouping the TNM candidates, its own matcher is never created
+        self.tnm = RuleTNMExtractor(language, allow_spaces, merge_matches, detect_parantheses, nlp=self.nlp, prefilter=False,
+                                    keep_spans=keep_spans, stats=stats, max_gap=max_gap, split_sentences=split_sentences)
+        # Labels are prefixed by 'tnm:' or the name of the rule pack
+        self.matcher = Matcher(self.nlp.vocab)
+        self.tnm.add_patterns(self.matcher, 'tnm:')
+        for pack in self.rule_packs:
+            pack.add_patterns(self.matcher, pack.name + ':')
+        self.prefilter = None
+        candidate_patterns = [self.tnm.candidate_pattern()] + [pack.candidate_pattern for pack in self.rule_packs]
+        # Texts can only be skipped if every rule pack has a candidate pattern
+        if prefilter and None not in candidate_patterns:
+            self.prefilter = Prefilter('|'.join('(?:%s)' % pattern for pattern in candidate_patterns))
+
+    def transform(self, text):
+        """Returns a dict with the list of TNM classifications under 'tnm', plus the ICD-O results under 'icd-o' and the results of further rule packs (if any)"""
+        if self.cache is not None:
+            return self.cache.transform(self._config, self._transform, text)
+        return self._transform(text)
+
+    def _transform(self, text):
+        if self.prefilter and not self.prefilter(text):
+            if self.stats is not None:
+                self.stats.add_document(skipped=True)
+            return {'tnm': []}
+        with self.lock:
+            doc = timed(self.stats, 'tokenizer', self.nlp, text)
+            if self.stats is not None:
+                self.stats.add_document(len(doc))
+            return self.transform_doc(doc)
+
+    async def atransform(self, text, executor=None):
+        """Same as transform, but runs in executor without blocking the event loop (default: a shared worker thread, see onconlp.aio)"""
+        return await aio.run(executor, self.transform, text)
+
+    async def atransform_batch(self, texts, batch_size=1000, executor=None, n_process=1):
+        """Same as transform_batch, but runs in executor without blocking the event loop and returns a list"""
+        return await aio.run(executor, lambda: list(self.transform_batch(texts, batch_size, n_process)))
+
+    def transform_batch(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts TNM classifications and ICD-O codes from a stream of texts using spaCy's nlp.pipe
+
+        Arguments:
+            texts {iterable} -- Texts, or (text, context) tuples if as_tuples is set
+
+        Keyword Arguments:
+            batch_size {int} -- Number of texts buffered per batch (default: {1000})
+            n_process {int} -- Number of processes used for tokenization (default: {1})
+            as_tuples {bool} -- Are texts (text, context) tuples, e.g. with document ids? If so, (result, context) tuples are yielded (default: {False})
+
+        Yields:
+            Result dicts in input order
+        """
+        if self.cache is not None:
+            return self.cache.transform_batch(self._config, self._transform_batch, texts, batch_size, n_process, as_tuples)
+        return self._transform_batch(texts, batch_size, n_process, as_tuples)
+
+    def _transform_batch(self, texts, batch_size, n_process, as_tuples):
+        docs = timed_iter(self.stats, 'tokenizer', pipe(self.nlp, texts, batch_size, n_process, as_tuples, self.prefilter))
+        results = ((self.transform_doc(doc) if doc is not None else {'tnm': []}, context)
+                   for doc, context in count_documents(self.stats, docs))
+        for result, context in locked(results, self.lock):
+            yield (result, context) if as_tuples else result
+
+    def transform_columns(self, texts, batch_size=1000, n_process=1, as_tuples=False):
+        """Extracts TNM classifications and ICD-O codes from a stream of texts into columns with one row per match
+
+        Arguments and keyword arguments are the same as for transform_batch. If as_tuples is set, the contexts are stored in doc_ids.
+
+        Returns:
+            ColumnarResults, which can be converted with to_numpy, to_arrow or to_pandas
+        """
+        results = ColumnarResults()
+        if not as_tuples:
+            texts = ((text, None) for text in texts)
+        for result, context in self.transform_batch(texts, batch_size, n_process, as_tuples=True):
+            results.add_document(result['tnm'], result, doc_id=context)
+        return results
+
+    def transform_doc(self, doc):
+        matches = self.doc_matches(doc)
+        result = {'tnm': self.tnm.classify(matches.get('tnm', []), doc.text)}
+        for pack in self.rule_packs:
+            result.update(pack.to_result(matches.get(pack.name, []), self.keep_spans, self.stats, self.drop_invalid))
+        return result
+
+    def doc_matches(self, doc):
+        """Returns the (label, span) candidates of all rules in a single pass, as dict 'tnm' or rule pack name -> list"""
+        matches = {}
+        for match_id, start, end in timed(self.stats, 'matcher', self.matcher, doc):
+            name, label = self.nlp.vocab[match_id].text.split(':', 1)
+            matches.setdefault(name, []).append((label, doc[start:end]))
+        return matches
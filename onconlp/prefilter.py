@@ -0,0 +1,41 @@
+import regex as re
+import threading
+
+
+class Prefilter():
+    """Decides in a single pass over the raw text whether a document can contain any match at all
+
+    The pattern has to match (at least) every text in which the extractor could find something,
+    so that skipping the remaining texts never changes the results.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = re.compile(pattern)
+        self.documents = 0
+        self.skipped = 0
+        self.__lock = threading.Lock()
+
+    def __call__(self, text):
+        accepted = self.pattern.search(text) is not None
+        with self.__lock:
+            self.documents += 1
+            if not accepted:
+                self.skipped += 1
+        return accepted
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_Prefilter__lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def reset(self):
+        self.documents = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return 'Prefilter (%d documents, %d skipped)' % \
+            (self.documents, self.skipped)
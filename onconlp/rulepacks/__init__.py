@@ -0,0 +1,188 @@
+"""Declarative rule packs with token patterns, tokenizer affixes and normalizers for new entities
+
+A rule pack is a JSON document (or YAML, if PyYAML is installed), e.g. the bundled icd_o.json:
+
+    {
+        "name": "icd-o",
+        "candidate_pattern": "\\d\\d\\d\\d\\s*/",
+        "affixes": {"prefixes": ["/"], "infixes": ["/"], "suffixes": ["/"]},
+        "entities": {
+            "morphology": {
+                "patterns": [[{"TEXT": {"REGEX": "^\\d\\d\\d\\d$"}}, ...]],
+                "normalizers": ["remove_whitespace"],
+                "lookup": {"name": "icd_o3", "axis": "morphology"}
+            },
+            "topography": {...}
+        }
+    }
+
+patterns -- spaCy Matcher patterns per entity
+normalizers -- Names of registered normalizers (see register_normalizer), or dicts with the name and further arguments,
+               e.g. {"name": "replace", "pattern": "\\D", "repl": ""}. The value of a match is its text after applying them in order
+lookup -- Name of a registered lookup (see register_lookup), or a dict with the name and further arguments (optional).
+          It resolves the value to a label, which is set on the Match with valid=True, to None, i.e. valid=False, or to
+          unknown if the value can neither be confirmed nor rejected (label and valid stay None, the match is kept)
+affixes -- Regular expressions added to the prefixes, infixes and suffixes of the tokenizer (optional)
+candidate_pattern -- Regular expression found in every text in which the patterns can match, used for skipping texts (optional)
+
+Results are dicts {name: {entity: [Match, ...]}}, e.g. {'icd-o': {'morphology': [...]}}, which are empty without matches.
+With drop_invalid, matches rejected by their lookup are left out (e.g., dates or lab values shaped like a code).
+OncoPipeline compiles any number of rule packs and the TNM rules into a single tokenizer and Matcher.
+"""
+from onconlp.match import Match
+import functools
+import hashlib
+import json
+import os
+import regex as re
+
+normalizers = {}
+lookups = {}
+# Returned by lookups for values that are neither confirmed nor rejected, e.g. histology types missing from a partial table
+unknown = object()
+
+
+def register_normalizer(name):
+    """Decorator registering a function normalizer(value, **arguments) -> value under name"""
+    def register(func):
+        normalizers[name] = func
+        return func
+    return register
+
+
+@register_normalizer('remove_whitespace')
+def remove_whitespace(value):
+    return re.sub(r'\s', '', value)
+
+
+@register_normalizer('strip')
+def strip(value):
+    return value.strip()
+
+
+@register_normalizer('upper')
+def upper(value):
+    return value.upper()
+
+
+@register_normalizer('lower')
+def lower(value):
+    return value.lower()
+
+
+@register_normalizer('replace')
+def replace(value, pattern, repl=''):
+    return re.sub(pattern, repl, value)
+
+
+def register_lookup(name):
+    """Decorator registering a function lookup(value, **arguments) -> label, None or unknown under name"""
+    def register(func):
+        lookups[name] = func
+        return func
+    return register
+
+
+@register_lookup('icd_o3')
+def icd_o3(value, axis, table=None, strict=False):
+    """Looks up a topography or morphology code in the bundled ICD-O-3 table, or the TSV file table
+
+    Morphology codes with an unlisted histology type are unknown, unless strict is set (for a complete table).
+    """
+    from onconlp.rulepacks.icd_o3 import load_table
+    return load_table(table).validate(axis, value, strict)
+
+
+class RulePack():
+
+    def __init__(self, rules):
+        """Creates a rule pack from a parsed JSON or YAML document, see the module documentation"""
+        self.name = rules['name']
+        # Identifies the rules, e.g. in the cache keys of OncoPipeline
+        self.digest = hashlib.sha256(json.dumps(rules, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+        if ':' in self.name or self.name == 'tnm':
+            raise Exception('Invalid rule pack name %s' % self.name)
+        self.candidate_pattern = rules.get('candidate_pattern')
+        affixes = rules.get('affixes', {})
+        self.affixes = tuple(list(affixes.get(k, [])) for k in ['prefixes', 'infixes', 'suffixes'])
+        self.patterns = {}
+        self.normalizers = {}
+        self.lookups = {}
+        for entity, spec in rules['entities'].items():
+            self.patterns[entity] = spec['patterns']
+            self.normalizers[entity] = [self.__function(normalizers, 'normalizer', n) for n in spec.get('normalizers', [])]
+            if spec.get('lookup'):
+                self.lookups[entity] = self.__function(lookups, 'lookup', spec['lookup'])
+
+    @staticmethod
+    def __function(registry, kind, spec):
+        if isinstance(spec, str):
+            spec = {'name': spec}
+        spec = dict(spec)
+        name = spec.pop('name')
+        if name not in registry:
+            raise Exception('Unknown %s %s' % (kind, name))
+        return functools.partial(registry[name], **spec)
+
+    def tokenizer_affixes(self):
+        """Custom (prefixes, infixes, suffixes) added to the language defaults of the tokenizer"""
+        return self.affixes
+
+    def add_patterns(self, matcher, prefix=''):
+        """Adds the patterns of all entities to matcher, labeled with the entity prefixed by prefix"""
+        for entity, patterns in self.patterns.items():
+            matcher.add(prefix + entity, patterns)
+
+    def normalize(self, entity, text):
+        for normalizer in self.normalizers[entity]:
+            text = normalizer(text)
+        return text
+
+    def to_result(self, matches, keep_spans=False, stats=None, drop_invalid=False):
+        """Converts (entity, span) candidates into the result dict of the rule pack
+
+        Keyword Arguments:
+            drop_invalid {bool} -- Leave out matches whose value is rejected by the lookup of their entity (default: {False})
+        """
+        entities = {}
+        for entity, span in matches:
+            value = self.normalize(entity, span.text)
+            label, valid = None, None
+            lookup = self.lookups.get(entity)
+            if lookup is not None:
+                label = lookup(value)
+                if label is unknown:
+                    label = None
+                    if stats is not None:
+                        stats.count('unknown')
+                else:
+                    valid = label is not None
+                if valid is False and drop_invalid:
+                    if stats is not None:
+                        stats.count('invalid')
+                    continue
+            entities.setdefault(entity, []).append(Match(span, value, keep_spans, label, valid))
+            if stats is not None:
+                stats.add_match(entity)
+        return {self.name: entities} if entities else {}
+
+    def __repr__(self):
+        return 'RulePack (%s: %s)' % (self.name, ', '.join(self.patterns))
+
+
+def load_rule_pack(source):
+    """Returns a RulePack for a bundled rule pack (e.g., 'icd_o'), the path of a JSON or YAML file, a parsed document or a RulePack"""
+    if isinstance(source, RulePack):
+        return source
+    if isinstance(source, dict):
+        return RulePack(source)
+    path = source
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(__file__), source + '.json')
+        if not os.path.exists(path):
+            raise Exception('Unknown rule pack %s' % source)
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return RulePack(yaml.safe_load(f))
+        return RulePack(json.load(f))
@@ -0,0 +1,90 @@
+"""ICD-O-3 code table for validating topography (e.g., C50.9) and morphology codes (e.g., 8140/3)
+
+The bundled icd_o3.tsv lists all topography codes, but only the common histology types of the morphology axis. Following
+the matrix principle of ICD-O-3, a morphology code is valid if its histology type is listed and its behavior code is one of
+0, 1, 2, 3, 6 and 9. Well-formed codes (8000/0 to 9999/9) with a histology type missing from the table are unknown rather
+than invalid, see validate. Other tables with the same columns (axis, code, label) can be loaded by path, e.g. a complete
+licensed edition.
+
+The codes are indexed by their number (C50.9 -> 509, 8140 -> 140), so that a lookup is a single array access. Each table is
+parsed once per process.
+"""
+from onconlp.rulepacks import unknown
+from array import array
+import functools
+import os
+import regex as re
+
+behaviors = {'0': 'benign', '1': 'uncertain whether benign or malignant', '2': 'in situ', '3': 'malignant',
+             '6': 'metastatic', '9': 'malignant, uncertain whether primary or metastatic'}
+
+
+class CodeTable():
+
+    topography_pattern = re.compile(r'C(\d\d)\.?(\d)')
+    morphology_pattern = re.compile(r'([89]\d\d\d)/(\d)')
+
+    def __init__(self, path):
+        self.path = path
+        self.labels = []
+        self.topography_index = array('h', [-1]) * 1000
+        self.histology_index = array('h', [-1]) * 2000
+        with open(path, encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                axis, code, label = line.rstrip('\r\n').split('\t')
+                if axis == 'topography':
+                    m = self.topography_pattern.fullmatch(code)
+                    index, pos = self.topography_index, int(m[1]) * 10 + int(m[2])
+                elif axis == 'morphology':
+                    index, pos = self.histology_index, int(code) - 8000
+                else:
+                    raise Exception('Unknown axis %s in %s' % (axis, path))
+                index[pos] = len(self.labels)
+                self.labels.append(label)
+
+    def topography(self, code):
+        """Returns the label of a topography code (e.g., 'Breast, NOS' for C50.9), or None if it does not exist"""
+        m = self.topography_pattern.fullmatch(code)
+        if not m:
+            return None
+        label = self.topography_index[int(m[1]) * 10 + int(m[2])]
+        return self.labels[label] if label >= 0 else None
+
+    def morphology(self, code):
+        """Returns the label of the histology type of a morphology code (e.g., 'Adenocarcinoma, NOS' for 8140/3),
+        or None if it does not exist"""
+        m = self.morphology_pattern.fullmatch(code)
+        if not m or m[2] not in behaviors:
+            return None
+        label = self.histology_index[int(m[1]) - 8000]
+        return self.labels[label] if label >= 0 else None
+
+    def validate(self, axis, code, strict=False):
+        """Returns the label of a code, None if it is invalid, or unknown for a well-formed morphology code whose histology
+        type is not listed (unless strict is set, e.g. for a complete table)"""
+        label = self.lookup(axis, code)
+        if label is None and axis == 'morphology' and not strict:
+            m = self.morphology_pattern.fullmatch(code)
+            if m and m[2] in behaviors:
+                return unknown
+        return label
+
+    def lookup(self, axis, code):
+        if axis == 'topography':
+            return self.topography(code)
+        if axis == 'morphology':
+            return self.morphology(code)
+        raise Exception('Unknown axis %s' % axis)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return 'CodeTable (%s, %d codes)' % (self.path, len(self))
+
+
+@functools.lru_cache(maxsize=None)
+def load_table(path=None):
+    """Returns the CodeTable of a TSV file, by default the bundled icd_o3.tsv, parsing each file only once"""
+    return CodeTable(path or os.path.join(os.path.dirname(__file__), 'icd_o3.tsv'))
@@ -0,0 +1,218 @@
+"""HTTP server for extracting TNM classifications and ICD-O codes, which groups concurrent requests into micro-batches
+
+Example:
+    onconlp-server --port 8080 --max-batch-size 64 --max-wait 0.005
+    curl -d '{"text": "pT1 pN0 M0"}' http://localhost:8080/tnm
+
+Endpoints:
+    POST /<extractor> -- {"text": ...} returns the result, {"texts": [...]} a list of results (extractor: tnm, icd-o)
+    GET /stats -- Number of documents and batches processed per extractor
+    GET /health -- Liveness check
+"""
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+
+from onconlp.cli import to_json
+
+
+class MicroBatcher():
+    """Collects texts submitted from many threads and transforms them in batches on a single worker thread
+
+    A batch is processed as soon as it holds max_batch_size texts, or max_wait seconds after its first text arrived.
+    If a batch fails, its texts are transformed one by one, so that only the failing ones get the error.
+    """
+
+    def __init__(self, transform_batch, max_batch_size=32, max_wait=0.01):
+        self.transform_batch = transform_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.documents = 0
+        self.batches = 0
+        self.__queue = queue.Queue()
+        self.__worker = threading.Thread(target=self.__run, name='onconlp-batcher', daemon=True)
+        self.__worker.start()
+
+    def submit(self, text):
+        """Returns a Future for the result of text"""
+        future = Future()
+        self.__queue.put((text, future))
+        return future
+
+    def transform(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def close(self):
+        self.__queue.put(None)
+        self.__worker.join()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.__queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.__process(batch)
+                    return
+                batch.append(item)
+            self.__process(batch)
+
+    def __process(self, batch):
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if batch:
+            self.__transform(batch)
+
+    def __transform(self, batch):
+        try:
+            results = list(self.transform_batch([text for text, _ in batch], batch_size=len(batch)))
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                for item in batch:
+                    self.__transform([item])
+            return
+        self.documents += len(batch)
+        self.batches += 1
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def __repr__(self):
+        return 'MicroBatcher (%d documents, %d batches)' % (self.documents, self.batches)
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    # Set by create_server: dict of endpoint name -> MicroBatcher
+    batchers = {}
+    timeout_s = 60
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.__respond(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self.__respond(200, {name: {'documents': b.documents, 'batches': b.batches} for name, b in self.batchers.items()})
+        else:
+            self.__respond(404, {'error': 'Unknown path %s' % self.path})
+
+    def do_POST(self):
+        batcher = self.batchers.get(self.path.strip('/'))
+        if batcher is None:
+            self.__respond(404, {'error': 'Unknown extractor %s' % self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            texts = self.__texts(request)
+        except (ValueError, KeyError, TypeError) as e:
+            self.__respond(400, {'error': 'Invalid request: %s' % e})
+            return
+        try:
+            futures = [batcher.submit(text) for text in texts]
+            results = [to_json(f.result(self.timeout_s)) for f in futures]
+            self.__respond(200, results if 'texts' in request else results[0])
+        except Exception as e:
+            self.__respond(500, {'error': str(e)})
+
+    @staticmethod
+    def __texts(request):
+        """Returns the texts of a request, which must be {"text": str} or {"texts": [str, ...]}"""
+        if not isinstance(request, dict):
+            raise TypeError('expected a JSON object')
+        if 'texts' in request:
+            texts = request['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise TypeError('texts must be a list of strings')
+            return texts
+        if not isinstance(request['text'], str):
+            raise TypeError('text must be a string')
+        return [request['text']]
+
+    def __respond(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(extractors, host='127.0.0.1', port=8080, max_batch_size=32, max_wait=0.01):
+    """Creates a ThreadingHTTPServer for a dict of endpoint name -> extractor (e.g., {'tnm': TNMExtractor()})
+
+    TNM results are returned as list of classifications, ICD-O results as dict, both converted with to_dict.
+    Call serve_forever to start it, and shutdown and server_close to stop it.
+    """
+    batchers = {name: MicroBatcher(ex.transform_batch, max_batch_size, max_wait) for name, ex in extractors.items()}
+    handler = type('Handler', (ExtractionHandler,), {'batchers': batchers})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.batchers = batchers
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='onconlp-server', description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--extractors', nargs='+', choices=['tnm', 'icd-o'], default=['tnm', 'icd-o'])
+    parser.add_argument('--language', default='de')
+    parser.add_argument('--engine', choices=['spacy', 'regex'], default='spacy', help='TNM engine (default: spacy)')
+    parser.add_argument('--allow-spaces', action='store_true')
+    parser.add_argument('--merge-matches', action='store_true')
+    parser.add_argument('--no-parentheses', action='store_true')
+    parser.add_argument('--tokenizer-only', action='store_true')
+    parser.add_argument('--max-gap', type=int, help='Maximum number of characters between the parts of a TNM classification')
+    parser.add_argument('--split-sentences', action='store_true', help='End TNM classifications at sentence boundaries')
+    parser.add_argument('--drop-invalid', action='store_true', help='Leave out invalid ICD-O codes (histology types missing from the bundled table are kept)')
+    parser.add_argument('--cache', help='SQLite file caching results of repeated texts across requests and restarts')
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Maximum number of requests per batch (default: 32)')
+    parser.add_argument('--max-wait', type=float, default=0.01, help='Seconds a request waits for others to join its batch (default: 0.01)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = None
+    if args.cache:
+        from onconlp.cache import ResultCache
+        cache = ResultCache(path=args.cache)
+    extractors = {}
+    if 'tnm' in args.extractors:
+        from onconlp.classification.tnm import TNMExtractor
+        extractors['tnm'] = TNMExtractor(args.language, args.allow_spaces, args.merge_matches, not args.no_parentheses,
+                                         args.tokenizer_only, engine=args.engine, max_gap=args.max_gap,
+                                         split_sentences=args.split_sentences, cache=cache)
+    if 'icd-o' in args.extractors:
+        from onconlp.diagnosis.icd_o import ICD_O_Extractor
+        extractors['icd-o'] = ICD_O_Extractor(args.language, args.tokenizer_only, cache=cache, drop_invalid=args.drop_invalid)
+    server = create_server(extractors, args.host, args.port, args.max_batch_size, args.max_wait)
+    print('Serving %s on http://%s:%d' % (', '.join(extractors), args.host, args.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for batcher in server.batchers.values():
+            batcher.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
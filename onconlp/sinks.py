@@ -0,0 +1,171 @@
+"""Bulk sinks writing extraction results to Parquet or SQLite with one row per match
+
+Rows are buffered and written in bulk (Parquet row groups, SQLite executemany in one transaction per batch), so that
+writing keeps up with extraction on large corpora. Both sinks share the same schema:
+
+    doc_id -- Document id (context of a (text, id) tuple), as string
+    classification -- Index of the TNM classification within the document, or of the match among the matches of its entity
+    component -- TNM component (e.g., 'T', 'Pn') or entity of a rule pack (e.g., 'morphology', 'topography')
+    start, end -- Character offsets of the match
+    value -- Normalized value, e.g. 'T2' or '8140/3'
+    prefixes -- TNM prefixes concatenated, e.g. 'yp', else ''
+    details -- Details of a TNM match or label and validity of a looked up code as JSON, e.g. '{"lymphnodes_affected": 2}', else NULL
+    lymphnodes_affected, lymphnodes_examined -- Lymph node counts of N matches, else NULL
+
+Example:
+    with SQLiteSink('results.sqlite') as sink:
+        sink.write_batch(extractor.transform_batch(read_corpus('reports.jsonl'), as_tuples=True))
+
+    # iter_transform yields (id, result) tuples instead
+    with ParquetSink('results.parquet') as sink:
+        sink.write_pairs(iter_transform(extractor, read_corpus('reports.jsonl'), n_process=4, as_tuples=True))
+"""
+import json
+import sqlite3
+
+columns = ['doc_id', 'classification', 'component', 'start', 'end', 'value', 'prefixes', 'details',
+           'lymphnodes_affected', 'lymphnodes_examined']
+
+
+def to_rows(result, doc_id):
+    """Returns the rows of the result of one document: a list of TNM classifications or a result dict
+    ({'tnm': [...], 'icd-o': {'morphology': [...]}, ...}, as returned by ICD_O_Extractor and OncoPipeline)"""
+    doc_id = None if doc_id is None else str(doc_id)
+    rows = []
+    if isinstance(result, dict):
+        tnm = result.get('tnm', ())
+        packs = [entities for name, entities in result.items() if name != 'tnm']
+    else:
+        tnm, packs = result, []
+    for i, classification in enumerate(tnm):
+        for component, match in classification.values.items():
+            details = match.details or {}
+            rows.append((doc_id, i, component, match.start, match.end, match.value, ''.join(match.prefix or ()),
+                         json.dumps(details, sort_keys=True) if details else None,
+                         details.get('lymphnodes_affected'), details.get('lymphnodes_examined')))
+    for entities in packs:
+        for entity, matches in entities.items():
+            for i, match in enumerate(matches):
+                details = json.dumps({'label': match.label, 'valid': match.valid}) if match.valid is not None else None
+                rows.append((doc_id, i, entity, match.start, match.end, match.value, '', details, None, None))
+    return rows
+
+
+class Sink():
+    """Base class of the sinks, buffering rows until batch_size rows are complete"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.buffer = []
+        self.documents = 0
+        self.rows = 0
+
+    def write(self, result, doc_id=None):
+        """Writes the result of one document"""
+        self.buffer += to_rows(result, doc_id)
+        self.documents += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_batch(self, results):
+        """Writes (result, doc_id) tuples, e.g. from transform_batch(..., as_tuples=True); returns the number of documents written"""
+        n = 0
+        for result, doc_id in results:
+            self.write(result, doc_id)
+            n += 1
+        return n
+
+    def write_pairs(self, pairs):
+        """Writes (doc_id, result) tuples, e.g. from iter_transform; returns the number of documents written"""
+        return self.write_batch((result, doc_id) for doc_id, result in pairs)
+
+    def flush(self):
+        """Writes all buffered rows"""
+        if self.buffer:
+            self._write_rows(self.buffer)
+            self.rows += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return '%s (%s, %d documents, %d rows)' % (type(self).__name__, self.path, self.documents, self.rows)
+
+
+class ParquetSink(Sink):
+
+    def __init__(self, path, row_group_size=100000, compression='snappy'):
+        """Writes rows to a Parquet file, one row group per row_group_size rows (requires pyarrow)
+
+        Keyword Arguments:
+            row_group_size {int} -- Number of rows buffered per row group (default: {100000})
+            compression {str} -- Parquet compression codec (default: {'snappy'})
+        """
+        super().__init__(row_group_size)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.path = path
+        self.pa = pa
+        self.schema = pa.schema([('doc_id', pa.string()), ('classification', pa.int32()), ('component', pa.string()),
+                                 ('start', pa.int64()), ('end', pa.int64()), ('value', pa.string()), ('prefixes', pa.string()),
+                                 ('details', pa.string()), ('lymphnodes_affected', pa.int32()), ('lymphnodes_examined', pa.int32())])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def _write_rows(self, rows):
+        arrays = [self.pa.array(column, type=field.type) for column, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=len(rows))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+class SQLiteSink(Sink):
+
+    def __init__(self, path, table='matches', batch_size=50000):
+        """Writes rows to a table of an SQLite database, inserting batch_size rows per transaction
+
+        The table is created if it does not exist, an index on doc_id is created when the sink is closed.
+
+        Keyword Arguments:
+            table {str} -- Name of the table (default: {'matches'})
+            batch_size {int} -- Number of rows buffered per transaction (default: {50000})
+        """
+        super().__init__(batch_size)
+        if not table.isidentifier():
+            raise Exception('Invalid table name %s' % table)
+        self.path = path
+        self.table = table
+        self.db = sqlite3.connect(path)
+        # Rows are committed in large transactions, of which at most the last is lost on a crash
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS %s (doc_id TEXT, classification INTEGER, component TEXT, start INTEGER, '
+                            '"end" INTEGER, value TEXT, prefixes TEXT, details TEXT, lymphnodes_affected INTEGER, '
+                            'lymphnodes_examined INTEGER)' % table)
+        self.insert = 'INSERT INTO %s VALUES (%s)' % (table, ', '.join('?' * len(columns)))
+
+    def _write_rows(self, rows):
+        with self.db:
+            self.db.executemany(self.insert, rows)
+
+    def close(self):
+        super().close()
+        with self.db:
+            self.db.execute('CREATE INDEX IF NOT EXISTS %s_doc_id ON %s (doc_id)' % (self.table, self.table))
+        self.db.close()
+
+
+def open_sink(path, **kwargs):
+    """Returns a ParquetSink for a .parquet file, else a SQLiteSink"""
+    if path.endswith('.parquet'):
+        return ParquetSink(path, **kwargs)
+    return SQLiteSink(path, **kwargs)
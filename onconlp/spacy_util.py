@@ -1,10 +1,272 @@
-import spacy
+# spaCy is imported by the functions using it, so that importing this module (e.g., for set_max_models) stays fast
+from collections import OrderedDict, deque
+from onconlp.instrumentation import timed
+import bisect
+import copy
+import regex as re
+import threading
+import weakref
 
-def load_spacy(language):
+def load_spacy(language, tokenizer_only=False):
+    """Loads a spaCy pipeline for a language code (e.g., 'de') or a model name
+
+    Models are cached process-wide: each call returns a shallow copy of the cached pipeline, which shares
+    vocab and weights with all other copies, but may get its own tokenizer. A cached model is reference counted
+    and only becomes evictable (see set_max_models) once all copies are garbage collected or released.
+
+    spaCy pipelines are not thread-safe, as processing a text may add strings to the shared vocab. All copies of a
+    cached model therefore share a lock, see model_lock.
+
+    If tokenizer_only is set, all trained components (tagger, parser, NER, ...) are excluded at load time.
+    For known language codes, a blank language object is created instead, which skips reading the model entirely.
+    """
+    key = (__languages.get(language, language), tokenizer_only)
+    with __lock:
+        if key in __models:
+            __models.move_to_end(key)
+        else:
+            __models[key] = [__load(language, tokenizer_only), 0, threading.RLock()]
+        entry = __models[key]
+        entry[1] += 1
+        nlp = copy.copy(entry[0])
+        __releases[nlp] = weakref.finalize(nlp, __release, key)
+        __locks[nlp] = entry[2]
+        __evict()
+    return nlp
+
+def load_saved(path):
+    """Loads a pipeline saved with nlp.to_disk, including its custom tokenizer"""
+    import spacy
+    return spacy.load(path)
+
+def nlp_to_bytes(nlp):
+    """Returns (config, data) from which nlp_from_bytes restores the pipeline, including its custom tokenizer"""
+    return nlp.config.to_str(), nlp.to_bytes()
+
+def nlp_from_bytes(config, data):
+    import spacy
+    config = spacy.util.load_config_from_str(config)
+    nlp = spacy.util.get_lang_class(config['nlp']['lang']).from_config(config)
+    return nlp.from_bytes(data)
+
+def restore_extractor(cls, options, config, data, stats=None):
+    """Unpickles a rule-based extractor around its pickled pipeline, see RuleTNMExtractor.__reduce__"""
+    return cls(None, nlp=nlp_from_bytes(config, data), stats=stats, **options)
+
+def release_spacy(nlp):
+    """Releases a pipeline returned by load_spacy before it is garbage collected"""
+    release = __releases.pop(nlp, None)
+    if release:
+        release()
+
+def model_lock(nlp):
+    """Returns the lock to hold while processing texts with nlp, which is shared by all pipelines sharing its vocab"""
+    with __lock:
+        if nlp not in __locks:
+            __locks[nlp] = threading.RLock()
+        return __locks[nlp]
+
+def locked(iterable, lock):
+    """Iterates while holding lock, which is released between items"""
+    it = iter(iterable)
+    while True:
+        with lock:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+def set_max_models(max_models):
+    """Sets how many models are kept in the cache. Least recently used models are evicted first, models in use never"""
+    global __max_models
+    with __lock:
+        __max_models = max_models
+        __evict()
+
+def cached_models():
+    """Returns a dict (model, tokenizer_only) -> number of pipelines currently using the cached model"""
+    with __lock:
+        return {key: entry[1] for key, entry in __models.items()}
+
+def __load(language, tokenizer_only):
+    import spacy
+    if tokenizer_only and language in __languages:
+        return spacy.blank(language)
     spacy_lang = __languages.get(language, language)
+    if tokenizer_only:
+        return spacy.load(spacy_lang, exclude=__pipeline_components)
     return spacy.load(spacy_lang)
 
+def __release(key):
+    with __lock:
+        if key in __models:
+            __models[key][1] -= 1
+            __evict()
+
+def __evict():
+    idle = [key for key, entry in __models.items() if entry[1] == 0]
+    while len(__models) > __max_models and idle:
+        del __models[idle.pop(0)]
+
+def create_tokenizer(nlp, prefixes=(), infixes=(), suffixes=()):
+    """Creates a tokenizer from the language defaults of nlp, extended by custom affix patterns"""
+    import spacy
+    from spacy.tokenizer import Tokenizer
+    prefix_re = spacy.util.compile_prefix_regex(tuple(list(nlp.Defaults.prefixes) + list(prefixes)))
+    infix_re = spacy.util.compile_infix_regex(tuple(list(nlp.Defaults.infixes) + list(infixes)))
+    suffix_re = spacy.util.compile_suffix_regex(tuple(list(nlp.Defaults.suffixes) + list(suffixes)))
+    return Tokenizer(nlp.vocab,
+                     rules=nlp.Defaults.tokenizer_exceptions,
+                     prefix_search=prefix_re.search,
+                     suffix_search=suffix_re.search,
+                     infix_finditer=infix_re.finditer
+                     )
+
+def pipe(nlp, texts, batch_size=1000, n_process=1, as_tuples=False, accept=None):
+    """Streams texts through nlp.pipe and yields (doc, context) tuples in input order
+
+    If as_tuples is set, texts are expected to be (text, context) tuples, e.g. (text, document id).
+    Otherwise, the context is always None.
+    If accept is given, only texts for which accept(text) is true are processed, (None, context) is yielded for all others.
+    """
+    if not as_tuples:
+        texts = ((text, None) for text in texts)
+    if accept is None:
+        return nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process)
+    return __pipe_accepted(nlp, texts, batch_size, n_process, accept)
+
+def __pipe_accepted(nlp, texts, batch_size, n_process, accept):
+    pending = deque() # (accepted, context) of all texts read by nlp.pipe so far, in input order
+
+    def accepted_texts():
+        for text, context in texts:
+            accepted = accept(text)
+            pending.append((accepted, context))
+            if accepted:
+                yield text, context
+
+    for doc, context in nlp.pipe(accepted_texts(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        while not pending[0][0]:
+            yield None, pending.popleft()[1]
+        pending.popleft()
+        yield doc, context
+    while pending:
+        yield None, pending.popleft()[1]
+
+def read_docbin(paths, vocab=None):
+    """Yields (doc, (path, index)) tuples of the Docs in one or more DocBin files, reading one file at a time
+
+    The strings of the Docs are added to vocab (default: a new Vocab), usually the vocab of the extractor.
+    """
+    from spacy.tokens import DocBin
+    if vocab is None:
+        from spacy.vocab import Vocab
+        vocab = Vocab()
+    for path in [paths] if isinstance(paths, str) else paths:
+        for i, doc in enumerate(DocBin().from_disk(path).get_docs(vocab)):
+            yield doc, (path, i)
+
+# Extends a candidate over a following value in parentheses or a few words, e.g. N1 (2/14) or R - Status: 0
+__candidate_tail = re.compile(r'\S*(?:\s*\([^()]*\)\S*|(?:\s+\S+){1,3})?')
+
+def align_tokens(doc, tokenizer, candidate_pattern):
+    """Retokenizes a Doc created by another tokenizer where the rules could match, so that they find the same matches
+
+    Only the words around matches of candidate_pattern are tokenized again with tokenizer. Where the tokens of the Doc
+    differ, they are merged (retokenizer.merge) or split (retokenizer.split) into the expected ones, the rest of the Doc
+    is left as it is. Tokens containing whitespace are never split. Returns the number of merged and split tokens.
+    """
+    text = doc.text
+    regions = []
+    for m in re.finditer(candidate_pattern, text):
+        start = m.start()
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        end = __candidate_tail.match(text, m.start()).end()
+        if regions and start <= regions[-1][1]:
+            regions[-1][1] = max(end, regions[-1][1])
+        else:
+            regions.append([start, end])
+    if not regions:
+        return 0
+
+    starts = [token.idx for token in doc]
+    expected, actual = [], set()
+    for start, end in regions:
+        # The tokens of the Doc overlapping the region are tokenized again as a whole
+        first, last = bisect.bisect_right(starts, start) - 1, bisect.bisect_left(starts, end)
+        offset = doc[first].idx
+        actual.update((t.idx, t.idx + len(t)) for t in doc[first:last])
+        expected += [(offset + t.idx, offset + t.idx + len(t)) for t in tokenizer(text[offset:doc[last - 1].idx + len(doc[last - 1])])
+                     if not t.is_space and (not expected or offset + t.idx >= expected[-1][1])]
+    if actual.issuperset(expected):
+        return 0
+
+    # Tokens are merged where an expected token spans several of them, then split into the expected tokens
+    merges = []
+    for start, end in expected:
+        first, last = bisect.bisect_right(starts, start) - 1, bisect.bisect_left(starts, end)
+        if last - first > 1:
+            if merges and first < merges[-1][1]:
+                merges[-1][1] = max(last, merges[-1][1])
+            else:
+                merges.append([first, last])
+    if merges:
+        with doc.retokenize() as retokenizer:
+            for first, last in merges:
+                retokenizer.merge(doc[first:last])
+        starts = [token.idx for token in doc]
+
+    parts = OrderedDict()
+    for start, end in expected:
+        parts.setdefault(bisect.bisect_right(starts, start) - 1, []).append((start, end))
+    splits = 0
+    with doc.retokenize() as retokenizer:
+        for i, spans in parts.items():
+            token = doc[i]
+            contiguous = all(spans[k][1] == spans[k + 1][0] for k in range(len(spans) - 1))
+            if len(spans) > 1 and contiguous and spans[0][0] == token.idx and spans[-1][1] == token.idx + len(token):
+                # All parts are attached to the last one, which takes the head of the token
+                n = len(spans)
+                head = token.head if token.head.i != token.i else (token, n - 1)
+                retokenizer.split(token, [text[start:end] for start, end in spans], [(token, n - 1)] * (n - 1) + [head])
+                splits += 1
+    return len(merges) + splits
+
+def transform_docs(extractor, docs, candidate_pattern, empty, as_tuples=False):
+    """Yields the results of extractor.transform_doc for Docs created by another pipeline, see align_tokens
+
+    Docs rejected by the prefilter of extractor are skipped, yielding empty() instead.
+    """
+    stats = extractor.stats
+    if not as_tuples:
+        docs = ((doc, None) for doc in docs)
+    for doc, context in docs:
+        if extractor.prefilter and not extractor.prefilter(doc.text):
+            if stats is not None:
+                stats.add_document(skipped=True)
+            result = empty()
+        else:
+            with extractor.lock:
+                retokenized = timed(stats, 'tokenizer', align_tokens, doc, extractor.nlp.tokenizer, candidate_pattern)
+                if stats is not None:
+                    stats.add_document(len(doc))
+                    stats.count('retokenized', retokenized)
+                result = extractor.transform_doc(doc)
+        del doc
+        yield (result, context) if as_tuples else result
+
 __languages = {
         'de' : 'de_core_news_sm',
         'en' : 'en_core_web_sm'
-}
\ No newline at end of file
+}
+
+__max_models = 4
+__models = OrderedDict()
+__releases = weakref.WeakKeyDictionary()
+__locks = weakref.WeakKeyDictionary()
+__lock = threading.RLock()
+
+__pipeline_components = ['tok2vec', 'transformer', 'tagger', 'morphologizer', 'parser', 'senter',
+                         'attribute_ruler', 'lemmatizer', 'ner', 'entity_ruler', 'entity_linker', 'textcat']
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Streaming API for corpora larger than memory, with a bounded number of documents in flight
+
+iter_transform reads the texts lazily in batches of batch_size and yields (id, result) tuples as soon as a batch is done.
+At most max_in_flight documents are between being read and being yielded; no further texts are read until results have been
+consumed (backpressure), so that memory stays flat regardless of the size of the corpus and of how slowly results are consumed.
+spaCy Docs never leave the process that created them and are released as soon as their results are built.
+
+With n_process > 1, batches are distributed to worker processes, each with its own copy of the extractor, and yielded in the
+order in which they complete, or in input order if ordered is set. Statistics and in-memory caches are then kept per worker.
+
+Example:
+    for doc_id, tnms in TNMExtractor().iter_transform(read_corpus('reports.jsonl'), as_tuples=True, n_process=4):
+        ...
+"""
+import itertools
+import multiprocessing
+import queue
+
+__worker = None
+
+
+def _init_worker(extractor):
+    global __worker
+    __worker = extractor
+
+
+def _transform_worker_batch(batch):
+    return transform_batch(__worker, batch)
+
+
+def transform_batch(extractor, batch):
+    """Returns the [(id, result), ...] of a list of (text, id) tuples"""
+    return [(doc_id, result) for result, doc_id in extractor.transform_batch(batch, len(batch), as_tuples=True)]
+
+
+def batches(texts, batch_size, as_tuples=False):
+    """Yields lists of at most batch_size (text, id) tuples, reading texts only as far as needed; ids are input positions unless as_tuples is set"""
+    items = iter(texts if as_tuples else ((text, i) for i, text in enumerate(texts)))
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_transform(extractor, texts, batch_size=100, n_process=1, max_in_flight=None, as_tuples=False, ordered=False):
+    """Yields (id, result) tuples of a stream of texts, transformed with transform_batch of extractor
+
+    Arguments:
+        extractor -- TNMExtractor or ICD_O_Extractor, pickled to every worker with n_process > 1
+        texts {iterable} -- Texts, or (text, id) tuples if as_tuples is set; consumed lazily
+
+    Keyword Arguments:
+        batch_size {int} -- Number of texts per batch (default: {100})
+        n_process {int} -- Number of worker processes, -1 for all CPUs (default: {1})
+        max_in_flight {int} -- Maximum number of documents read but not yet yielded, at least batch_size (default: {2 * n_process * batch_size})
+        as_tuples {bool} -- Are texts (text, id) tuples? Otherwise, the id is the position of the text in the stream (default: {False})
+        ordered {bool} -- Yield results in input order with n_process > 1? Batches completed early then count as in flight until yielded (default: {False})
+    """
+    if n_process == -1:
+        n_process = multiprocessing.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 2 * n_process * batch_size
+    if max_in_flight < batch_size:
+        raise Exception('max_in_flight (%d) must be at least batch_size (%d)' % (max_in_flight, batch_size))
+    stream = batches(texts, batch_size, as_tuples)
+    if n_process == 1:
+        for batch in stream:
+            yield from transform_batch(extractor, batch)
+        return
+
+    done = queue.Queue()
+    # Results of batches completed before an earlier one, by position, if ordered
+    pending = {}
+    with multiprocessing.Pool(n_process, initializer=_init_worker, initargs=(extractor,)) as pool:
+        in_flight = 0
+        submitted = 0
+        position = 0
+        exhausted = False
+        while True:
+            while not exhausted and in_flight + batch_size <= max_in_flight:
+                batch = next(stream, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                in_flight += len(batch)
+                pool.apply_async(_transform_worker_batch, (batch,),
+                                 callback=lambda results, i=submitted, n=len(batch): done.put((i, n, results)), error_callback=done.put)
+                submitted += 1
+                del batch
+            if not in_flight:
+                return
+            completed = done.get()
+            if isinstance(completed, BaseException):
+                raise completed
+            i, n, results = completed
+            if ordered:
+                pending[i] = (n, results)
+                ready = []
+                while position in pending:
+                    ready.append(pending.pop(position))
+                    position += 1
+            else:
+                ready = [(n, results)]
+            for n, results in ready:
+                in_flight -= n
+                yield from results
+            del ready, results
@@ -1,11 +1,15 @@
+import re
 import setuptools
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
+with open("onconlp/__init__.py", "r") as fh:
+    version = re.search(r"__version__ = '(.*)'", fh.read()).group(1)
+
 setuptools.setup(
     name="onconlp",
-    version="0.1.1",
+    version=version,
     author="Florian Borchert",
     author_email="florian.borchert@hpi.de",
     description="A simple library for medical information extraction from free-text",
@@ -13,10 +17,14 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://gitlab.hpi.de/florian.borchert/onconlp",
     packages=setuptools.find_packages(),
+    package_data={'onconlp': ['rulepacks/*.json', 'rulepacks/*.tsv']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
     ],
+    entry_points={
+        'console_scripts': ['onconlp=onconlp.cli:main', 'onconlp-server=onconlp.server:main'],
+    },
     install_requires=[
         'nose2',
         'regex',
@@ -24,6 +32,11 @@ setuptools.setup(
         'de_core_news_sm @ https://github.com/explosion/spacy-models/releases/download/de_core_news_sm-3.0.0/de_core_news_sm-3.0.0.tar.gz',
         'en_core_web_sm @ https://github.com/explosion/spacy-models/releases/download/en_core_web_sm-3.0.0/en_core_web_sm-3.0.0.tar.gz'
     ],
+    extras_require={
+        'columnar': ['numpy', 'pyarrow', 'pandas'],
+        'parquet': ['pyarrow'],
+        'yaml': ['pyyaml'],
+    },
     python_requires='>=3.6',
 )
 
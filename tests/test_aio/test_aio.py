@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from onconlp import aio
+from onconlp.aio import ExtractorPool
+from onconlp.classification.tnm import TNMExtractor
+
+
+class TestAsyncAPI(unittest.TestCase):
+
+    texts = ['pT1 pN1 (5/13)', 'Kein Befund', 'ypT0N0M0', 'cT4 cN2 cM0 G3']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.extractor = TNMExtractor(engine='regex')
+        cls.expected = [repr(cls.extractor.transform(text)) for text in cls.texts]
+
+    def test_atransform(self):
+        async def run():
+            return await asyncio.gather(*[self.extractor.atransform(text) for text in self.texts])
+        self.assertEqual([repr(r) for r in asyncio.run(run())], self.expected)
+
+    def test_atransform_batch(self):
+        results = asyncio.run(self.extractor.atransform_batch(self.texts))
+        self.assertEqual([repr(r) for r in results], self.expected)
+        results = asyncio.run(self.extractor.atransform_batch(self.texts, batch_size=2, n_process=2))
+        self.assertEqual([repr(r) for r in results], self.expected)
+
+    def test_default_executor(self):
+        self.assertGreater(aio.default_executor()._max_workers, 1)
+
+    def test_threads(self):
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(self.extractor.transform, self.texts * 50))
+        self.assertEqual([repr(r) for r in results], self.expected * 50)
+
+    def test_pool(self):
+        with ExtractorPool(functools.partial(TNMExtractor, engine='regex'), max_workers=2, max_pending=3) as pool:
+            async def run():
+                return await asyncio.gather(*[pool.atransform(text) for text in self.texts * 5])
+            self.assertEqual([repr(r) for r in asyncio.run(run())], self.expected * 5)
+            self.assertEqual([repr(r) for r in asyncio.run(pool.atransform_batch(self.texts))], self.expected)
+            self.assertEqual(repr(pool.transform(self.texts[0])), self.expected[0])
+            self.assertFalse(pool.processes)
+
+    def test_pool_workers(self):
+        with ExtractorPool(functools.partial(TNMExtractor, engine='spacy')) as pool:
+            self.assertTrue(pool.processes)
+
+    def test_process_pool(self):
+        with ExtractorPool(functools.partial(TNMExtractor, engine='regex'), max_workers=2, processes=True) as pool:
+            async def run():
+                return await asyncio.gather(*[pool.atransform(text) for text in self.texts])
+            self.assertEqual([repr(r) for r in asyncio.run(run())], self.expected)
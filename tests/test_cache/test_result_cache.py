@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+from onconlp.cache import ResultCache, rules_digest
+from onconlp.classification.tnm import TNMExtractor
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_transform(self):
+        cache = ResultCache()
+        extractor = TNMExtractor(engine='regex', cache=cache)
+        first = extractor.transform('pT1 pN1 (5/13)')
+        self.assertIs(extractor.transform('pT1 pN1 (5/13)'), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_configuration_in_key(self):
+        cache = ResultCache()
+        default = TNMExtractor(engine='regex', cache=cache)
+        spaces = TNMExtractor(engine='regex', allow_spaces=True, cache=cache)
+        self.assertEqual(len(default.transform('T 1')), 0)
+        self.assertEqual(len(spaces.transform('T 1')), 1)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_engine_in_key(self):
+        cache = ResultCache()
+        TNMExtractor(engine='regex', cache=cache).transform('pT1')
+        self.assertNotEqual(TNMExtractor(engine='regex', lazy=True)._config, TNMExtractor(lazy=True)._config)
+        self.assertEqual(cache.misses, 1)
+
+    def test_version_in_key(self):
+        key = ResultCache.key(('tnm',), 'pT1')
+        self.assertEqual(ResultCache.key(('tnm',), 'pT1'), key)
+        rules_digest.cache_clear()
+        with unittest.mock.patch('onconlp.__version__', '0.0.0'):
+            self.assertNotEqual(ResultCache.key(('tnm',), 'pT1'), key)
+        rules_digest.cache_clear()
+        self.assertEqual(ResultCache.key(('tnm',), 'pT1'), key)
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        for key in ['a', 'b', 'a', 'c']:
+            if cache.get(key) is None:
+                cache.put(key, [key])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), ['a'])
+        self.assertIsNone(cache.get('b'))
+
+    def test_transform_batch(self):
+        cache = ResultCache()
+        extractor = TNMExtractor(engine='regex', cache=cache)
+        uncached = TNMExtractor(engine='regex')
+        texts = [('pT1', 1), ('Kein Befund', 2), ('pT1', 3), ('cN2', 4)]
+        extractor.transform('cN2')
+        results = list(extractor.transform_batch(texts, batch_size=2, as_tuples=True))
+        self.assertEqual([context for _, context in results], [1, 2, 3, 4])
+        self.assertEqual([repr(r) for r, _ in results], [repr(r) for r, _ in uncached.transform_batch(texts, as_tuples=True)])
+        # Duplicates within a batch only hit if the first one was processed before the second is read
+        self.assertIn(cache.hits, [1, 2])
+        self.assertEqual(cache.hits + cache.misses, 5)
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite')
+            TNMExtractor(engine='regex', cache=ResultCache(path=path)).transform('ypT0N0M0')
+            cache = ResultCache(path=path)
+            result = TNMExtractor(engine='regex', cache=cache).transform('ypT0N0M0')
+            self.assertEqual((cache.disk_hits, cache.misses), (1, 0))
+            self.assertEqual(result[0].T.value, 'T0')
+            cache.clear()
+            self.assertIsNone(cache.get(ResultCache.key(('tnm',), 'ypT0N0M0')))
+
+    def test_keep_spans(self):
+        with self.assertRaises(Exception):
+            TNMExtractor(engine='regex', keep_spans=True, cache=ResultCache())
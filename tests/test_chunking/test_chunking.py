@@ -0,0 +1,39 @@
+import unittest
+from onconlp import chunking
+
+
+class TestChunking(unittest.TestCase):
+
+    text = ('Befund vom 12.03.2020.\n\nMikroskopie: Adenokarzinom. Tumorklassifikation: pT2 pN1 (3/14) M0\n'
+            'Keine Lymphgefäßinvasion. R0, G2. ' * 20)
+
+    def test_split_text(self):
+        chunks = chunking.split_text(self.text, 200, 50)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1:], (len(self.text), len(self.text)))
+        for (start, end, region_end), following in zip(chunks, chunks[1:]):
+            self.assertLessEqual(end - start, 200)
+            self.assertGreaterEqual(end - region_end, 0)
+            self.assertEqual(following[0], region_end)
+            # Regions start after a boundary, so no token is cut
+            self.assertTrue(self.text[region_end - 1].isspace())
+
+    def test_split_short_text(self):
+        self.assertEqual(chunking.split_text('pT1', 200, 50), [(0, 3, 3)])
+
+    def test_split_without_boundaries(self):
+        chunks = chunking.split_text('x' * 500, 200, 50)
+        self.assertEqual([c[0] for c in chunks], [0, 150, 300])
+
+    def test_edit_window(self):
+        start, end, region_end = chunking.edit_window(self.text, 1000, 1010, 50)
+        self.assertLessEqual(start, 950)
+        self.assertTrue(self.text[start - 1].isspace())
+        self.assertEqual(region_end, 1060)
+        self.assertGreaterEqual(end, region_end + 50)
+        self.assertEqual(chunking.edit_window('pT1 N0', 2, 3, 50), (0, 6, 6))
+
+    def test_overlap(self):
+        with self.assertRaises(Exception):
+            chunking.split_text(self.text, 50, 50)
@@ -1,10 +1,22 @@
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
 import unittest
 from onconlp.classification.tnm import TNMExtractor
+from onconlp.classification.rulebased_tnm import RuleTNMExtractor
+from benchmarks.generate import generate_reports
 
 
 class TestTNMExtractor(unittest.TestCase):
 
-    extractor = TNMExtractor()
+    engine = 'spacy'
+    extractor = TNMExtractor(lazy=True)
+
+    def create_extractor(self, **kwargs):
+        return TNMExtractor(engine=self.engine, **kwargs)
 
     def assertNull(self, obj, all_but):
         for p in ['T', 'N', 'M', 'L', 'V', 'Pn', 'SX', 'R', 'G']:
@@ -92,7 +104,7 @@ class TestTNMExtractor(unittest.TestCase):
                 0, len(term))
 
     def test_no_parantheses(self):
-        extractor = TNMExtractor(detect_parantheses=False)
+        extractor = self.create_extractor(detect_parantheses=False)
         tnms = extractor.transform('N0(i-)')
         self.assertEqual(len(tnms), 1)
         tnm = tnms[0]
@@ -497,7 +509,7 @@ class TestTNMExtractor(unittest.TestCase):
         tnms = self.extractor.transform(text)
         self.assertEqual(len(tnms), 0)
 
-        ex = TNMExtractor(language='de', allow_spaces=True)
+        ex = self.create_extractor(language='de', allow_spaces=True)
         tnms = ex.transform(text)
         self.assertEqual(len(tnms), 1)
         tnm = tnms[0]
@@ -522,7 +534,7 @@ class TestTNMExtractor(unittest.TestCase):
         self.assertIsNone(tnm.R)
         self.assertFalse(tnm.merged)
 
-        ex = TNMExtractor(language='de', merge_matches=True)
+        ex = self.create_extractor(language='de', merge_matches=True)
         tnms = ex.transform(text)
         tnm = tnms[0]
         self.assertEqual(len(tnms), 1)
@@ -550,6 +562,210 @@ class TestTNMExtractor(unittest.TestCase):
         tnm = tnms[0]
         self.check_match(tnm.T, 'pT1a/b', ['p'], 'T1a/b', {}, 0, 6)
 
+    def test_tokenizer_boundaries(self):
+        # Dots are split off after codes
+        tnms = self.extractor.transform("pT1.5 cm")
+        self.assertEqual(len(tnms), 1)
+        self.check_match(tnms[0].T, 'pT1', ['p'], 'T1', {}, 0, 3)
+
+        # Codes are searched within their token, so a preceding non-ASCII letter is part of the match
+        tnms = self.extractor.transform("ÄT1 T1é")
+        self.assertEqual(len(tnms), 1)
+        self.assertEqual((tnms[0].T.start, tnms[0].T.end), (0, 3))
+
+        # 8) is an emoticon exception of the tokenizer, so there are no parentheses after N0
+        tnms = self.extractor.transform("N0 (5/8)")
+        self.assertEqual(len(tnms), 1)
+        self.check_match(tnms[0].N, 'N0', [], 'N0', {}, 0, 2)
+
+        # Colons are only split off before a space
+        self.assertEqual(len(self.extractor.transform("R-Status:1")), 0)
+
+    def test_tokenizer_only(self):
+        ex = TNMExtractor(tokenizer_only=True)
+        for text in ['UICC-Klassifikation (8. Auflage, 2017) 16. pT2, pN1(2/22), G2, L1, V0, Pn1, R0 (lokal) ',
+                     'ypT0N0M0', '8. R-Status 1 (intraparenchymatöser Absetzungsrand)']:
+            self.assertEqual(repr(ex.transform(text)), repr(self.extractor.transform(text)), text)
+
+    def test_prefilter(self):
+        ex = self.create_extractor()
+        texts = ['Entlassbrief ohne Befund', 'pT1 pN1 (5/13)', 'Laborwerte: Hb 12,1 g/dl', 'R - Status 1', 'Grading: G2']
+        self.assertEqual([len(tnms) for tnms in ex.transform_batch(texts, batch_size=2)], [0, 1, 0, 1, 1])
+        self.assertEqual(ex.prefilter.documents, 5)
+        self.assertEqual(ex.prefilter.skipped, 2)
+        unfiltered = self.create_extractor(prefilter=False)
+        self.assertIsNone(unfiltered.prefilter)
+        for text in texts:
+            self.assertEqual(repr(ex.transform(text)), repr(unfiltered.transform(text)), text)
+        self.assertEqual(ex.prefilter.skipped, 4)
+
+    def test_transform_batch(self):
+        texts = ['pT1 pN1 (5/13)', 'Kein Befund', 'cT4 cN2 cM0 G3']
+        results = list(self.extractor.transform_batch(texts, batch_size=2))
+        self.assertEqual(len(results), 3)
+        self.check_match(results[0][0].N, 'pN1 (5/13)', ['p'], 'N1',
+                         {'lymphnodes_affected': 5, 'lymphnodes_examined': 13}, 4, 14)
+        self.assertEqual(results[1], [])
+        self.check_match(results[2][0].G, 'G3', [], 'G3', {}, 12, 14)
+
+    def test_transform_docs(self):
+        import spacy
+        from spacy.tokens import Doc, DocBin
+        texts = ['Tumorklassifikation: ypT2 pN1(3/14) M0, L0 V1 Pn0 R - Status: 1', 'Kein Befund', 'cT4cN2 cM0 (G3)']
+        nlp = spacy.blank('en')
+        # Tokenized only at spaces, and by the default English tokenizer
+        docs = [Doc(nlp.vocab, words=text.split(' '), spaces=[True] * text.count(' ') + [False]) for text in texts]
+        docs += [nlp(text) for text in texts]
+        expected = [repr(self.extractor.transform(text)) for text in texts] * 2
+        self.assertEqual([repr(r) for r in self.extractor.transform_docs(docs)], expected)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reports.spacy')
+            DocBin(docs=docs).to_disk(path)
+            results = list(self.extractor.transform_docbin(path, as_tuples=True))
+        self.assertEqual([repr(r) for r, _ in results], expected)
+        self.assertEqual(results[4][1], (path, 4))
+
+    def test_transform_chunked(self):
+        text = ('Befund vom 12.03.2020.\n\nTumorklassifikation: ypT2 pN1 (3/14) M0, L0 V1 Pn0 R - Status: 1\n'
+                'Keine weiteren Auffälligkeiten. pT1a, G2. ' * 30)
+        expected = repr(self.extractor.transform(text))
+        for chunk_size in [150, 500, 5000]:
+            self.assertEqual(repr(self.extractor.transform_chunked(text, chunk_size, 100)), expected, chunk_size)
+        self.assertEqual(repr(self.create_extractor(chunk_size=300, chunk_overlap=100).transform(text)), expected)
+
+    def test_transform_batch_chunked(self):
+        long_text = ('Befund vom 12.03.2020.\n\nTumorklassifikation: ypT2 pN1 (3/14) M0, L0 V1 Pn0 R - Status: 1\n'
+                     'Keine weiteren Auffälligkeiten. pT1a, G2. ' * 30)
+        texts = ['pT1 pN1 (5/13)', long_text, 'Kein Befund', long_text]
+        expected = [repr(self.extractor.transform(text)) for text in texts]
+        extractor = self.create_extractor(chunk_size=300, chunk_overlap=100)
+        self.assertEqual([repr(r) for r in extractor.transform_batch(texts, batch_size=2)], expected)
+        results = list(extractor.transform_batch([(text, i) for i, text in enumerate(texts)], as_tuples=True))
+        self.assertEqual([(repr(r), i) for r, i in results], [(r, i) for i, r in enumerate(expected)])
+        self.assertEqual([repr(r) for _, r in extractor.iter_transform(texts, batch_size=3)], expected)
+
+    def test_transform_edit(self):
+        text = ('Befund vom 12.03.2020.\n\nTumorklassifikation: ypT2 pN1 (3/14) M0, L0 V1 Pn0 R - Status: 1\n'
+                'Keine weiteren Auffälligkeiten. pT1a, G2. ' * 10)
+        extractor = self.create_extractor(chunk_overlap=50)
+        results = extractor.transform(text)
+        first = results[0]
+        end = len(text)
+        for offset, deleted, inserted in [(end, 0, ' pN0'), (end - 4, 4, ''), (700, 1, 'x'), (700, 0, ' M1 '), (709, 5, 'cT3 N2'),
+                                          (200, 300, ''), (0, 0, 'T1 '), (3, 2, 'N0')]:
+            text, results = extractor.transform_edit(text, results, offset, deleted, inserted)
+            self.assertEqual(repr(results), repr(extractor.transform(text)), (offset, deleted, inserted))
+            if offset > 200:
+                self.assertIs(results[0], first)
+        # Candidates within the parentheses of another one, which replaces a shorter candidate after them
+        text = 'N1 N1 (G2 )pT2 G2 xx' + ' y' * 30
+        extractor = self.create_extractor(chunk_overlap=30)
+        text, results = extractor.transform_edit(text, extractor.transform(text), 37, 3, '(')
+        self.assertEqual(repr(results), repr(extractor.transform(text)))
+        with self.assertRaises(Exception):
+            self.create_extractor(merge_matches=True).transform_edit(text, results, 0, 0, 'T1')
+
+    def test_proximity_grouping(self):
+        text = 'pT2 pN1 (2/14) M0. G2 L1 ' + 'x ' * 50 + 'R0'
+        for options, expected in [({}, [['G', 'L', 'M', 'N', 'R', 'T']]),
+                                  ({'max_gap': 20}, [['G', 'L', 'M', 'N', 'T'], ['R']]),
+                                  ({'split_sentences': True}, [['M', 'N', 'T'], ['G', 'L', 'R']]),
+                                  ({'max_gap': 20, 'split_sentences': True}, [['M', 'N', 'T'], ['G', 'L'], ['R']])]:
+            results = self.create_extractor(**options).transform(text)
+            self.assertEqual([sorted(c.values) for c in results], expected, options)
+        # Rows of a follow-up table without repeated components
+        table = 'Datum      T    N    M    R\n' + ''.join('%02d.01.2020 pT%d  N0   M0\n\n' % (i % 28 + 1, i % 4 + 1) for i in range(200))
+        results = self.create_extractor(split_sentences=True).transform(table)
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all(sorted(c.values) == ['M', 'N', 'T'] for c in results))
+        extractor = self.create_extractor(split_sentences=True, max_gap=30, chunk_overlap=50)
+        text, results = table, extractor.transform(table)
+        for offset, deleted, inserted in [(200, 2, ''), (200, 0, '\n\n'), (500, 0, ' ' * 40), (30, 0, 'pT3 ')]:
+            text, results = extractor.transform_edit(text, results, offset, deleted, inserted)
+            self.assertEqual(repr(results), repr(extractor.transform(text)), (offset, deleted, inserted))
+
+    def test_preclassify(self):
+        if self.engine != 'spacy':
+            self.skipTest('Only used by the spaCy engine')
+        text = 'ypT2 pN1 (3/14) M0, L0 V1 Pn0 R - Status: 1, T 2 N 1, pT1-2, G2'
+        for allow_spaces in [False, True]:
+            preclassified = RuleTNMExtractor('de', allow_spaces)
+            plain = RuleTNMExtractor('de', allow_spaces, preclassify=False)
+            self.assertEqual(repr(preclassified.transform(text)), repr(plain.transform(text)))
+
+    def test_serialization(self):
+        text = 'ypT2 pN1 (3/14) M0, R - Status: 1'
+        extractor = self.create_extractor(allow_spaces=True, tokenizer_only=True)
+        expected = repr(extractor.transform(text))
+        self.assertEqual(repr(pickle.loads(pickle.dumps(extractor)).transform(text)), expected)
+        with tempfile.TemporaryDirectory() as path:
+            extractor.to_disk(path)
+            loaded = TNMExtractor.from_disk(path)
+            self.assertTrue(loaded._impl.allow_spaces)
+            self.assertEqual(repr(loaded.transform(text)), expected)
+
+    def test_lazy(self):
+        extractor = self.create_extractor(lazy=True)
+        self.assertFalse(extractor.loaded)
+        restored = pickle.loads(pickle.dumps(extractor))
+        self.assertEqual(extractor.transform('pT1 N0')[0].T.value, 'T1')
+        self.assertTrue(extractor.loaded)
+        self.assertFalse(restored.loaded)
+        self.assertEqual(repr(restored.transform('pT1 N0')), repr(extractor.transform('pT1 N0')))
+
+    def test_lazy_import(self):
+        code = ('import sys; from onconlp.classification.tnm import TNMExtractor; ex = TNMExtractor(engine=%r, lazy=True); '
+                'print("spacy" in sys.modules); ex.transform("pT1"); print("spacy" in sys.modules)') % self.engine
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+        self.assertEqual(output, ['False', str(self.engine == 'spacy')])
+
+    def test_detached_results(self):
+        tnm = self.extractor.transform('pT1 pN1 (5/13)')[0]
+        self.assertIsNone(tnm.N.span)
+        self.assertFalse(hasattr(tnm.N, '__dict__'))
+        self.assertFalse(hasattr(tnm, '__dict__'))
+        self.assertEqual(set(tnm.values), {'T', 'N'})
+        with_spans = self.create_extractor(keep_spans=True).transform('pT1 pN1 (5/13)')[0]
+        self.assertEqual(with_spans.N.span.text, 'pN1 (5/13)')
+        self.assertEqual(repr(with_spans), repr(tnm))
+
+    def test_transform_batch_tuples(self):
+        texts = [('pT1', 'doc1'), ('N0', 'doc2')]
+        results = list(self.extractor.transform_batch(texts, as_tuples=True))
+        self.assertEqual([context for _, context in results], ['doc1', 'doc2'])
+        self.check_match(results[0][0][0].T, 'pT1', ['p'], 'T1', {}, 0, 3)
+        self.check_match(results[1][0][0].N, 'N0', [], 'N0', {}, 0, 2)
+
+
+class TestRegexTNMExtractor(TestTNMExtractor):
+
+    engine = 'regex'
+    extractor = TNMExtractor(engine='regex', lazy=True)
+
+    # Spliced into generated reports: parentheses, colons, dots, ranges and non-ASCII letters next to codes
+    edge_cases = [
+        'TNM (7.Aufl.): pT2c, MX (0/2 sn), Grading: GX R-Klassifikation (lokal): R0 ICD-O (3. Aufl.): 8522/3',
+        'ypT0N0M0 und rpT2pN1M0, Rezidiv cT2-4 cN1a/b',
+        'pT2(1,2cm, is, m), pN1(mi, mol+), pM1(mi, 5,2cm), L1, V0, Pn1, SX2',
+        'Befund: T1 N1 M0\n\nVerlauf: pT3 (5 cm), pN1(2/12), Pn1, L0, V1, G2, R1 (Gallengangs- und Pankreasabsetzungsrand)',
+        '11. R-Status 0, V-Status: 1, Pn-Status 0 (fokal), L - Status 1',
+        'Tissue Target AT2 1T1 PN1 pn1 puT1 yraaM1 G5 R3 Tis T1,',
+        'Tumorstadium: T 2, pN X, pM X - G-II.',
+        'pT1c N0 (5/8) R-Status:1', 'pT2c.N1', 'ÄT1 T1é Läsion T2 N1ä', 'pN1 (3/8), V-Status:0, L1;Pn0', 'G2/3, pT1.5 cm',
+    ]
+
+    def test_engine_parity(self):
+        rnd = random.Random(0)
+        texts = generate_reports(150, code_density=0.5, length=300, seed=1) + \
+            generate_reports(50, language='en', code_density=0.5, length=300, seed=2)
+        texts = [text + rnd.choice([' ', '\n', ', ']) + rnd.choice(self.edge_cases) if i % 2 else text for i, text in enumerate(texts)]
+        texts += self.edge_cases
+        for options in [{}, {'allow_spaces': True}, {'merge_matches': True}, {'detect_parantheses': False}]:
+            spacy_extractor = TNMExtractor(**options)
+            regex_extractor = self.create_extractor(**options)
+            differing = [text for text in texts if repr(regex_extractor.transform(text)) != repr(spacy_extractor.transform(text))]
+            self.assertEqual(differing, [], options)
+
 
 if __name__ == '__main__':
     unittest.main()
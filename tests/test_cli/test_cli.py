@@ -0,0 +1,103 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from onconlp import cli
+
+
+class TestCLI(unittest.TestCase):
+
+    texts = ['pT1 pN1 (5/13)', 'Kein Befund', 'ypT0N0M0', 'cT4 cN2 cM0 G3']
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.dir.name, 'corpus.jsonl')
+        self.output = os.path.join(self.dir.name, 'results.jsonl')
+        with open(self.input, 'w') as f:
+            for i, text in enumerate(self.texts):
+                f.write(json.dumps({'id': 'doc%d' % i, 'text': text}) + '\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_cli(self, *options):
+        cli.main([self.input, '--output', self.output, '--extractors', 'tnm', '--engine', 'regex'] + list(options))
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_output(self):
+        results = self.run_cli()
+        self.assertEqual([r['id'] for r in results], ['doc0', 'doc1', 'doc2', 'doc3'])
+        self.assertEqual(results[1]['tnm'], [])
+        n = results[0]['tnm'][0]['N']
+        self.assertEqual((n['value'], n['start'], n['end']), ('N1', 4, 14))
+        self.assertEqual(n['details'], {'lymphnodes_affected': 5, 'lymphnodes_examined': 13})
+        self.assertEqual(results[0]['tnm'][0]['T']['prefix'], ['p'])
+
+    def test_chunk_size(self):
+        long_text = 'Keine Auffälligkeiten. ' * 50 + 'pT2 pN1 (3/14) M0, G2'
+        with open(self.input, 'a') as f:
+            f.write(json.dumps({'id': 'long', 'text': long_text}) + '\n')
+        expected = self.run_cli()
+        results = self.run_cli('--chunk-size', '300', '--chunk-overlap', '100', '--restart')
+        self.assertEqual(results, expected)
+        self.assertEqual(results[4]['tnm'][0]['T']['start'], long_text.index('pT2'))
+
+    def test_sqlite_output(self):
+        self.output = os.path.join(self.dir.name, 'results.sqlite')
+        cli.main([self.input, '--output', self.output, '--extractors', 'tnm', '--engine', 'regex'])
+        db = sqlite3.connect(self.output)
+        rows = db.execute('SELECT doc_id, component, start, "end", value, prefixes, lymphnodes_affected FROM matches '
+                          'WHERE doc_id = ? ORDER BY start', ('doc0',)).fetchall()
+        self.assertEqual(rows, [('doc0', 'T', 0, 3, 'T1', 'p', None), ('doc0', 'N', 4, 14, 'N1', 'p', 5)])
+        self.assertEqual(db.execute('SELECT COUNT(DISTINCT doc_id) FROM matches').fetchone(), (3,))
+        count = db.execute('SELECT COUNT(*) FROM matches').fetchone()
+        db.close()
+        # An existing output is only overwritten with --restart
+        with self.assertRaises(Exception):
+            cli.main([self.input, '--output', self.output, '--extractors', 'tnm', '--engine', 'regex'])
+        cli.main([self.input, '--output', self.output, '--extractors', 'tnm', '--engine', 'regex', '--restart'])
+        db = sqlite3.connect(self.output)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM matches').fetchone(), count)
+        db.close()
+
+    def test_workers(self):
+        expected = self.run_cli()
+        with open(self.input, 'a') as f:
+            for i in range(4, 50):
+                f.write(json.dumps({'id': 'doc%d' % i, 'text': self.texts[i % 4]}) + '\n')
+        expected += [dict(r, id='doc%d' % i) for i in range(4, 50) for r in [expected[i % 4]]]
+        self.assertEqual(self.run_cli('--workers', '3', '--batch-size', '4', '--restart'), expected)
+
+    def test_resume(self):
+        expected = self.run_cli()
+        # Simulate a run that was killed after the first checkpoint, with a partially written line
+        with open(self.output, 'rb') as f:
+            first_line = f.readline()
+        with open(self.output, 'wb') as f:
+            f.write(first_line + b'{"id": "doc1", "tn')
+        cli.Checkpoint(self.output + '.checkpoint', self.input).save(1, len(first_line))
+
+        self.assertEqual(self.run_cli(), expected)
+        self.assertEqual(self.run_cli('--restart'), expected)
+
+    def test_resume_modified_input(self):
+        self.run_cli()
+        with open(self.input, 'a') as f:
+            f.write(json.dumps({'id': 'doc4', 'text': 'pT2 N0'}) + '\n')
+        with self.assertRaises(Exception):
+            self.run_cli()
+        self.assertEqual(len(self.run_cli('--restart')), 5)
+
+    def test_txt_directory(self):
+        corpus = os.path.join(self.dir.name, 'reports')
+        os.makedirs(corpus)
+        for i, text in enumerate(self.texts):
+            with open(os.path.join(corpus, 'report%d.txt' % i), 'w') as f:
+                f.write(text)
+        self.assertEqual([doc_id for _, doc_id in cli.read_corpus(corpus)], ['report0.txt', 'report1.txt', 'report2.txt', 'report3.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
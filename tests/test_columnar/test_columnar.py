@@ -0,0 +1,36 @@
+import unittest
+from onconlp.classification.tnm import TNMExtractor
+
+
+class TestColumnarResults(unittest.TestCase):
+
+    texts = [('pT1 pN1 (5/13)', 'doc1'), ('Kein Befund', 'doc2'), ('ypT0N0M0, cT4', 'doc3')]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.extractor = TNMExtractor(engine='regex')
+
+    def test_columns(self):
+        results = self.extractor.transform_columns(self.texts, as_tuples=True)
+        self.assertEqual(results.documents, 3)
+        self.assertEqual(results.doc_ids, ['doc1', 'doc2', 'doc3'])
+        columns = results.to_dict()
+        self.assertEqual(columns['doc'], [0, 0, 2, 2, 2, 2])
+        self.assertEqual(columns['classification'], [0, 0, 0, 0, 0, 1])
+        self.assertEqual(columns['component'], ['T', 'N', 'T', 'N', 'M', 'T'])
+        self.assertEqual(columns['value'], ['T1', 'N1', 'T0', 'N0', 'M0', 'T4'])
+        self.assertEqual(columns['start'], [0, 4, 0, 4, 6, 10])
+        self.assertEqual(columns['end'], [3, 14, 4, 6, 8, 13])
+        self.assertEqual(columns['prefix_p'], [1, 1, 1, 0, 0, 0])
+        self.assertEqual(columns['prefix_y'], [0, 0, 1, 0, 0, 0])
+        self.assertEqual(columns['prefix_c'], [0, 0, 0, 0, 0, 1])
+        self.assertEqual(columns['lymphnodes_affected'], [-1, 5, -1, -1, -1, -1])
+        self.assertEqual(columns['lymphnodes_examined'], [-1, 13, -1, -1, -1, -1])
+
+    def test_consistent_with_transform_batch(self):
+        texts = [text for text, _ in self.texts]
+        results = self.extractor.transform_columns(texts)
+        self.assertEqual(results.doc_ids, [None, None, None])
+        rows = sum(len(c.values) for tnms in self.extractor.transform_batch(texts) for c in tnms)
+        self.assertEqual(len(results), rows)
+        self.assertEqual(len(results.to_dict()['start']), rows)
@@ -1,7 +1,9 @@
+import pickle
+import tempfile
 import unittest
 from onconlp.diagnosis.icd_o import ICD_O_Extractor
 
-extractor = ICD_O_Extractor('de')
+extractor = ICD_O_Extractor('de', lazy=True)
 
 class TestICD_O_Extractor(unittest.TestCase):
 
@@ -46,3 +48,75 @@ class TestICD_O_Extractor(unittest.TestCase):
     def test_morphology_error(self):
         result = extractor.transform('12345/3')
         self.assertEquals(result, {})
+
+    def test_topography(self):
+        result = extractor.transform('Lokalisation: C18.7, Sigma. C50.9')
+        codes = result['icd-o']['topography']
+        self.assertEqual([(c.value, c.start, c.end) for c in codes], [('C18.7', 14, 19), ('C50.9', 28, 33)])
+        self.assertEqual([c.label for c in codes], ['Sigmoid colon', 'Breast, NOS'])
+        self.assertNotIn('morphology', result['icd-o'])
+
+    def test_validation(self):
+        result = extractor.transform('C50.9 8500/3, Labor vom 2017/1: 1234/3, C99.9')['icd-o']
+        self.assertEqual([(c.value, c.valid) for c in result['morphology']], [('8500/3', True), ('2017/1', False), ('1234/3', False)])
+        self.assertEqual(result['morphology'][0].label, 'Infiltrating duct carcinoma, NOS')
+        self.assertEqual([(c.value, c.valid) for c in result['topography']], [('C50.9', True), ('C99.9', False)])
+
+    def test_drop_invalid(self):
+        ex = ICD_O_Extractor('de', drop_invalid=True)
+        result = ex.transform('C50.9 8500/3, Labor vom 2017/1: 1234/3, C99.9, 8163/3')['icd-o']
+        self.assertEqual([c.value for c in result['morphology']], ['8500/3', '8163/3'])
+        self.assertEqual([c.value for c in result['topography']], ['C50.9'])
+        self.assertEqual(ex.transform('1234/3'), {})
+
+    def test_prefilter(self):
+        ex = ICD_O_Extractor('de')
+        texts = ['Keine Morphologie', '8140/3', 'am 12.03. auf Station 4, Hb 12,1 g/dl', '1234 / 3']
+        results = list(ex.transform_batch(texts))
+        self.assertEqual([len(r) for r in results], [0, 1, 0, 1])
+        self.assertEqual(ex.prefilter.documents, 4)
+        self.assertEqual(ex.prefilter.skipped, 2)
+
+    def test_transform_batch(self):
+        texts = [('1234/3', 'doc1'), ('12345/3', 'doc2'), ('6789 / 8', 'doc3')]
+        results = list(extractor.transform_batch(texts, batch_size=2, as_tuples=True))
+        self.assertEqual([context for _, context in results], ['doc1', 'doc2', 'doc3'])
+        self.assertEqual(results[0][0]['icd-o']['morphology'][0].value, '1234/3')
+        self.assertEqual(results[1][0], {})
+        codes = results[2][0]['icd-o']['morphology']
+        self.assertEqual(len(codes), 1)
+        self.assertEqual(codes[0].value, '6789/8')
+        self.assertEqual(codes[0].end, 8)
+
+    def test_iter_transform(self):
+        texts = ['1234/3', '12345/3', '6789 / 8'] * 10
+        results = dict(extractor.iter_transform(iter(texts), batch_size=4, n_process=2, max_in_flight=8))
+        self.assertEqual(sorted(results), list(range(30)))
+        self.assertEqual(results[3]['icd-o']['morphology'][0].value, '1234/3')
+        self.assertEqual(results[4], {})
+        self.assertEqual(results[29]['icd-o']['morphology'][0].value, '6789/8')
+
+    def test_transform_docs(self):
+        import spacy
+        from spacy.tokens import Doc
+        nlp = spacy.blank('en')
+        docs = [Doc(nlp.vocab, words=['ICD-O:', '8140/3,', 'C50.9']), nlp('Kein Befund')]
+        results = list(extractor.transform_docs(docs))
+        self.assertEqual([m.value for m in results[0]['icd-o']['morphology']], ['8140/3'])
+        self.assertEqual([m.value for m in results[0]['icd-o']['topography']], ['C50.9'])
+        self.assertEqual(results[1], {})
+
+    def test_serialization(self):
+        ex = ICD_O_Extractor('de', tokenizer_only=True)
+        restored = pickle.loads(pickle.dumps(ex))
+        self.assertEqual(restored.transform('ICD-O: 8140 / 3')['icd-o']['morphology'][0].value, '8140/3')
+        with tempfile.TemporaryDirectory() as path:
+            ex.to_disk(path)
+            loaded = ICD_O_Extractor.from_disk(path)
+            self.assertEqual(loaded.transform('ICD-O: 8140 / 3')['icd-o']['morphology'][0].end, 15)
+
+    def test_lazy(self):
+        ex = ICD_O_Extractor('de', tokenizer_only=True, lazy=True)
+        self.assertFalse(ex.loaded)
+        self.assertEqual(ex.transform('ICD-O: 8140/3')['icd-o']['morphology'][0].value, '8140/3')
+        self.assertTrue(ex.loaded)
@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from onconlp.classification.tnm import TNMExtractor
+from onconlp.instrumentation import Stats, PrometheusExporter
+
+
+class TestStats(unittest.TestCase):
+
+    def test_counts(self):
+        stats = Stats()
+        extractor = TNMExtractor(engine='regex', merge_matches=True, stats=stats)
+        self.assertIs(extractor.stats, stats)
+        list(extractor.transform_batch(['pT1 pN1 (5/13) pT2', 'Kein Befund', 'pT1 N0, pT1 M1']))
+        self.assertEqual(stats.counts['documents'], 3)
+        self.assertEqual(stats.counts['skipped'], 1)
+        self.assertEqual(stats.counts['split_repeated'], 2)
+        self.assertEqual(stats.counts['rejected'], 1)
+        self.assertEqual(dict(stats.matches), {'T': 4, 'N': 2, 'M': 1})
+        self.assertEqual(set(stats.time), {'matcher', 'postprocess', 'merge'})
+        stats.reset()
+        self.assertEqual(stats.to_dict(), {'time': {}, 'counts': {}, 'matches': {}})
+
+    def test_disabled(self):
+        self.assertIsNone(TNMExtractor(engine='regex').stats)
+
+    def test_prometheus(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'onconlp.prom')
+            stats = Stats(exporters=[PrometheusExporter(path, labels={'job': 'test'})])
+            TNMExtractor(engine='regex', stats=stats).transform('pT1 pN0')
+            stats.export()
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertIn('# TYPE onconlp_documents_total counter', lines)
+            self.assertIn('onconlp_documents_total{job="test"} 1.0', lines)
+            self.assertIn('onconlp_matches_total{component="T",job="test"} 1.0', lines)
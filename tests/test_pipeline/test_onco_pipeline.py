@@ -0,0 +1,80 @@
+import unittest
+from benchmarks.generate import generate_reports
+from onconlp.pipeline import OncoPipeline
+from onconlp.classification.tnm import TNMExtractor
+from onconlp.diagnosis.icd_o import ICD_O_Extractor
+
+
+class TestOncoPipeline(unittest.TestCase):
+
+    pipeline = OncoPipeline()
+    tnm_extractor = TNMExtractor(lazy=True)
+    icd_o_extractor = ICD_O_Extractor(lazy=True)
+
+    texts = [
+        'TNM (7.Aufl.): pT2c, MX (0/2 sn), Grading: GX R-Klassifikation (lokal): R0 ICD-O (3. Aufl.): 8522/3 ICD-10: C 49.9',
+        'UICC-Klassifikation (8. Auflage, 2017) 16. pT2, pN1(2/22), G2, L1, V0, Pn1, R0 (lokal) ',
+        'ypT0N0M0, pNX/0, cT2-4, pT1a/b',
+        '1234 / 3, 6789/8, 12345/3',
+        'Mammakarzinom C50.9, 8500/3, pT1c pN0 (0/3) G2',
+        'Kein Tumornachweis.'
+    ]
+
+    def check_result(self, result, text):
+        self.assertEqual(repr(result['tnm']), repr(self.tnm_extractor.transform(text)), text)
+        expected = self.icd_o_extractor.transform(text)
+        if expected:
+            self.assertEqual(repr(result['icd-o']), repr(expected['icd-o']), text)
+        else:
+            self.assertNotIn('icd-o', result, text)
+
+    def test_same_as_separate_extractors(self):
+        for text in self.texts:
+            self.check_result(self.pipeline.transform(text), text)
+
+    def test_transform_batch(self):
+        results = list(self.pipeline.transform_batch(((text, i) for i, text in enumerate(self.texts)), batch_size=2, as_tuples=True))
+        self.assertEqual(len(results), len(self.texts))
+        for result, i in results:
+            self.check_result(result, self.texts[i])
+
+    def test_merged_result(self):
+        result = self.pipeline.transform('pT1 pN0, 8140/3')
+        self.assertEqual(len(result['tnm']), 1)
+        self.assertEqual(result['tnm'][0].T.value, 'T1')
+        self.assertEqual(result['icd-o']['morphology'][0].value, '8140/3')
+        self.assertEqual(result['icd-o']['morphology'][0].start, 9)
+
+    def test_same_tokenization_as_separate_extractors(self):
+        # The affixes of all rules are merged into one tokenizer, which must not change the matches of any of them
+        reports = generate_reports(30, code_density=0.5, length=600, seed=3)
+        codes = ['C50.9', 'C18.7, 8140/3', 'C34.1 (8070/3)', 'pT2c.N1 C61.9', 'ICD-O-3: C44.3/8090/3', 'C77.3 pN1(2/13)']
+        texts = [report + ' ' + codes[i % len(codes)] for i, report in enumerate(reports)]
+        for result, text in zip(self.pipeline.transform_batch(texts), texts):
+            self.check_result(result, text)
+        self.assertTrue(all('topography' in self.pipeline.transform(text)['icd-o'] for text in texts))
+
+    def test_topography(self):
+        text = 'Mammakarzinom C50.9, 8500/3, pT1c pN0 (0/3) G2'
+        result = self.pipeline.transform(text)
+        self.check_result(result, text)
+        self.assertEqual([m.value for m in result['icd-o']['topography']], ['C50.9'])
+        self.assertEqual(result['tnm'][0].T.value, 'T1c')
+
+    def test_rule_packs(self):
+        gleason = {'name': 'gleason', 'candidate_pattern': '(?i:gleason)',
+                   'entities': {'score': {'patterns': [[{'LOWER': 'gleason'}, {'LOWER': 'score', 'OP': '?'}, {'IS_DIGIT': True}]],
+                                          'normalizers': [{'name': 'replace', 'pattern': r'\D'}]}}}
+        pipeline = OncoPipeline(rule_packs=[gleason])
+        text = 'pT2 pN0, 8140/3, Gleason Score 7'
+        result = pipeline.transform(text)
+        self.check_result(result, text)
+        self.assertEqual(result['gleason']['score'][0].value, '7')
+        self.assertEqual(result['gleason']['score'][0].start, 17)
+        self.assertNotIn('gleason', pipeline.transform('pT1'))
+        self.assertIsNotNone(pipeline.prefilter)
+        self.assertIsNone(OncoPipeline(rule_packs=[dict(gleason, candidate_pattern=None)]).prefilter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from onconlp.rulepacks import unknown
+from onconlp.rulepacks.icd_o3 import CodeTable, load_table
+
+
+class TestICD_O3Table(unittest.TestCase):
+
+    def test_topography(self):
+        table = load_table()
+        self.assertEqual(table.topography('C50.9'), 'Breast, NOS')
+        self.assertEqual(table.topography('C18.7'), 'Sigmoid colon')
+        self.assertEqual(table.topography('C509'), 'Breast, NOS')
+        for code in ['C50.7', 'C99.9', 'C43.9', 'D50.9', '50.9', 'C50.99']:
+            self.assertIsNone(table.topography(code), code)
+
+    def test_morphology(self):
+        table = load_table()
+        self.assertEqual(table.morphology('8140/3'), 'Adenocarcinoma, NOS')
+        self.assertEqual(table.morphology('8500/2'), 'Infiltrating duct carcinoma, NOS')
+        self.assertEqual(table.lookup('morphology', '9732/3'), 'Multiple myeloma')
+        # Unknown histology types, behavior codes and dates
+        for code in ['1234/3', '8140/4', '8140/8', '2017/1', '7999/3', '8140']:
+            self.assertIsNone(table.morphology(code), code)
+        with self.assertRaises(Exception):
+            table.lookup('grade', 'G2')
+
+    def test_validate(self):
+        table = load_table()
+        self.assertEqual(table.validate('morphology', '8140/3'), 'Adenocarcinoma, NOS')
+        # Valid histology types missing from the bundled table
+        for code in ['8148/2', '8163/3', '8323/3']:
+            self.assertIs(table.validate('morphology', code), unknown, code)
+            self.assertIsNone(table.validate('morphology', code, strict=True), code)
+        for code in ['1234/3', '8140/4', '2017/1', '8140']:
+            self.assertIsNone(table.validate('morphology', code), code)
+        self.assertIsNone(table.validate('topography', 'C99.9'))
+
+    def test_load_once(self):
+        self.assertIs(load_table(), load_table())
+        self.assertGreater(len(load_table()), 700)
+
+    def test_custom_table(self):
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'codes.tsv')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write('axis\tcode\tlabel\ntopography\tC61.9\tProstata\nmorphology\t8140\tAdenokarzinom\n')
+            table = CodeTable(file_path)
+        self.assertEqual(table.topography('C61.9'), 'Prostata')
+        self.assertEqual(table.morphology('8140/3'), 'Adenokarzinom')
+        self.assertIsNone(table.topography('C50.9'))
+        self.assertEqual(len(table), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from onconlp.match import TextSpan
+from onconlp.rulepacks import RulePack, load_rule_pack, normalizers, register_normalizer
+
+
+class TestRulePacks(unittest.TestCase):
+
+    gleason = {
+        'name': 'gleason',
+        'candidate_pattern': '(?i:gleason)',
+        'entities': {
+            'score': {
+                'patterns': [[{'LOWER': 'gleason'}, {'LOWER': 'score', 'OP': '?'}, {'IS_DIGIT': True}]],
+                'normalizers': [{'name': 'replace', 'pattern': r'\D', 'repl': ''}]
+            }
+        }
+    }
+
+    def test_bundled(self):
+        pack = load_rule_pack('icd_o')
+        self.assertEqual(pack.name, 'icd-o')
+        self.assertEqual(pack.tokenizer_affixes(), (['/'], ['/'], ['/']))
+        result = pack.to_result([('morphology', TextSpan('8140 / 3', 7, 15))])
+        match = result['icd-o']['morphology'][0]
+        self.assertEqual((match.value, match.token, match.start, match.end), ('8140/3', '8140 / 3', 7, 15))
+        self.assertEqual(pack.to_result([]), {})
+
+    def test_lookup(self):
+        pack = load_rule_pack('icd_o')
+        candidates = [('topography', TextSpan('C50.9', 0, 5)), ('morphology', TextSpan('8140/3', 7, 13)),
+                      ('morphology', TextSpan('2017/1', 20, 26))]
+        result = pack.to_result(candidates)['icd-o']
+        self.assertEqual([(m.value, m.label, m.valid) for m in result['topography']], [('C50.9', 'Breast, NOS', True)])
+        self.assertEqual([(m.value, m.label, m.valid) for m in result['morphology']],
+                         [('8140/3', 'Adenocarcinoma, NOS', True), ('2017/1', None, False)])
+        self.assertEqual(result['morphology'][1].to_dict()['valid'], False)
+        result = pack.to_result(candidates, drop_invalid=True)['icd-o']
+        self.assertEqual([m.value for m in result['morphology']], ['8140/3'])
+        self.assertEqual(pack.to_result(candidates[2:], drop_invalid=True), {})
+        # Histology types missing from the bundled table are kept
+        match = pack.to_result([('morphology', TextSpan('8148/2', 0, 6))], drop_invalid=True)['icd-o']['morphology'][0]
+        self.assertEqual((match.value, match.label, match.valid), ('8148/2', None, None))
+        # Without a lookup, matches are not validated
+        match = load_rule_pack(self.gleason).to_result([('score', TextSpan('Gleason 7', 0, 9))])['gleason']['score'][0]
+        self.assertIsNone(match.valid)
+        self.assertNotIn('valid', match.to_dict())
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'gleason.json')
+            with open(file_path, 'w') as f:
+                json.dump(self.gleason, f)
+            pack = load_rule_pack(file_path)
+        self.assertEqual(pack.normalize('score', 'Gleason Score 7'), '7')
+        self.assertEqual(pack.tokenizer_affixes(), ([], [], []))
+
+    def test_yaml(self):
+        try:
+            import yaml
+        except ImportError:
+            self.skipTest('PyYAML is not installed')
+        with tempfile.TemporaryDirectory() as path:
+            file_path = os.path.join(path, 'gleason.yaml')
+            with open(file_path, 'w') as f:
+                yaml.safe_dump(self.gleason, f)
+            self.assertEqual(load_rule_pack(file_path).patterns, load_rule_pack(self.gleason).patterns)
+
+    def test_custom_normalizer(self):
+        register_normalizer('roman')(lambda value: {'I': '1', 'II': '2', 'III': '3'}.get(value, value))
+        try:
+            pack = RulePack({'name': 'grade', 'entities': {'grade': {'patterns': [], 'normalizers': ['strip', 'upper', 'roman']}}})
+            self.assertEqual(pack.normalize('grade', ' ii '), '2')
+        finally:
+            del normalizers['roman']
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            RulePack({'name': 'grade', 'entities': {'grade': {'patterns': [], 'normalizers': ['unknown']}}})
+        with self.assertRaises(Exception):
+            RulePack({'name': 'tnm', 'entities': {}})
+        with self.assertRaises(Exception):
+            RulePack({'name': 'grade', 'entities': {'grade': {'patterns': [], 'lookup': 'unknown'}}})
+        with self.assertRaises(Exception):
+            load_rule_pack('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
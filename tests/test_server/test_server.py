@@ -0,0 +1,103 @@
+import json
+import threading
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from onconlp.classification.tnm import TNMExtractor
+from onconlp.server import MicroBatcher, create_server
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_batches(self):
+        extractor = TNMExtractor(engine='regex')
+        batch_sizes = []
+
+        def transform_batch(texts, batch_size):
+            batch_sizes.append(len(texts))
+            return extractor.transform_batch(texts, batch_size)
+
+        batcher = MicroBatcher(transform_batch, max_batch_size=8, max_wait=0.2)
+        texts = ['pT%d' % (i % 5) for i in range(20)]
+        futures = [batcher.submit(text) for text in texts]
+        results = [f.result(5) for f in futures]
+        batcher.close()
+        self.assertEqual([r[0].T.value for r in results], ['T%d' % (i % 5) for i in range(20)])
+        self.assertEqual(sum(batch_sizes), 20)
+        self.assertTrue(all(size <= 8 for size in batch_sizes))
+        self.assertLess(len(batch_sizes), 20)
+        self.assertEqual((batcher.documents, batcher.batches), (20, len(batch_sizes)))
+
+    def test_error(self):
+        def transform_batch(texts, batch_size):
+            raise Exception('failed')
+        batcher = MicroBatcher(transform_batch)
+        with self.assertRaises(Exception):
+            batcher.transform('pT1', 5)
+        batcher.close()
+
+    def test_error_isolated(self):
+        extractor = TNMExtractor(engine='regex')
+
+        def transform_batch(texts, batch_size):
+            if 'bad' in texts:
+                raise Exception('failed')
+            return extractor.transform_batch(texts, batch_size)
+
+        batcher = MicroBatcher(transform_batch, max_batch_size=8, max_wait=0.2)
+        futures = [batcher.submit(text) for text in ['pT1', 'bad', 'N0']]
+        self.assertEqual(futures[0].result(5)[0].T.value, 'T1')
+        self.assertEqual(futures[2].result(5)[0].N.value, 'N0')
+        with self.assertRaises(Exception):
+            futures[1].result(5)
+        batcher.close()
+
+
+class TestServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = create_server({'tnm': TNMExtractor(engine='regex')}, port=0, max_wait=0.05)
+        cls.url = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        for batcher in cls.server.batchers.values():
+            batcher.close()
+
+    def post(self, path, body):
+        request = urllib.request.Request(self.url + path, data=json.dumps(body).encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_transform(self):
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda text: self.post('/tnm', {'text': text}), ['pT1 pN1 (5/13)', 'Kein Befund'] * 4))
+        self.assertEqual(results[0][0]['N']['details'], {'lymphnodes_affected': 5, 'lymphnodes_examined': 13})
+        self.assertEqual(results[1], [])
+        self.assertEqual(results[::2], [results[0]] * 4)
+
+    def test_texts(self):
+        self.assertEqual([len(r) for r in self.post('/tnm', {'texts': ['pT1', 'Kein Befund']})], [1, 0])
+
+    def test_errors(self):
+        for path, body in [('/unknown', {'text': 'pT1'}), ('/tnm', {'document': 'pT1'}), ('/tnm', ['pT1'])]:
+            with self.assertRaises(urllib.error.HTTPError):
+                self.post(path, body)
+
+    def test_invalid_text(self):
+        def post(body):
+            try:
+                return self.post('/tnm', body)
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        bodies = [{'text': 'pT1'}, {'text': 5}, {'texts': ['N0', None]}, {'texts': 'pT1'}, {'text': 'N0'}]
+        with ThreadPoolExecutor(len(bodies)) as executor:
+            results = list(executor.map(post, bodies))
+        self.assertEqual(results[1:4], [400] * 3)
+        self.assertEqual(results[0][0]['T']['value'], 'T1')
+        self.assertEqual(results[4][0]['N']['value'], 'N0')
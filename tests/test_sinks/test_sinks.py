@@ -0,0 +1,66 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from onconlp.classification.tnm import TNMExtractor
+from onconlp.sinks import ParquetSink, SQLiteSink, columns, to_rows
+from onconlp.streaming import iter_transform
+
+
+class TestSinks(unittest.TestCase):
+
+    texts = ['pT1 pN1 (5/13)', 'Kein Befund', 'ypT0N0M0', 'cT4 cN2 cM0 G3']
+
+    @classmethod
+    def setUpClass(cls):
+        extractor = TNMExtractor(engine='regex')
+        items = [(text, 'doc%d' % (i % 7)) for i, text in enumerate(cls.texts * 25)]
+        cls.results = list(extractor.transform_batch(items, as_tuples=True))
+        cls.expected = [row for result, doc_id in cls.results for row in to_rows(result, doc_id)]
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_rows(self):
+        rows = to_rows(self.results[0][0], 'doc0')
+        self.assertEqual(rows[1], ('doc0', 0, 'N', 4, 14, 'N1', 'p', '{"lymphnodes_affected": 5, "lymphnodes_examined": 13}', 5, 13))
+        self.assertEqual(to_rows(self.results[2][0], 3)[0][:7], ('3', 0, 'T', 0, 4, 'T0', 'yp'))
+        self.assertEqual(to_rows({'tnm': self.results[0][0], 'icd-o': {}}, 'doc0'), rows)
+        self.assertEqual(to_rows([], 'doc1'), [])
+
+    def test_sqlite(self):
+        path = os.path.join(self.dir.name, 'results.sqlite')
+        with SQLiteSink(path, batch_size=7) as sink:
+            self.assertEqual(sink.write_batch(self.results), 100)
+        self.assertEqual(sink.rows, len(self.expected))
+        db = sqlite3.connect(path)
+        self.assertEqual(db.execute('SELECT * FROM matches ORDER BY rowid').fetchall(), self.expected)
+        self.assertEqual([r[1] for r in db.execute('PRAGMA table_info(matches)')], columns)
+        db.close()
+
+    def test_write_pairs(self):
+        path = os.path.join(self.dir.name, 'results.sqlite')
+        items = [(text, 'doc%d' % (i % 7)) for i, text in enumerate(self.texts * 25)]
+        with SQLiteSink(path) as sink:
+            self.assertEqual(sink.write_pairs(iter_transform(TNMExtractor(engine='regex'), items, batch_size=10, as_tuples=True)), 100)
+        db = sqlite3.connect(path)
+        self.assertEqual(db.execute('SELECT * FROM matches ORDER BY rowid').fetchall(), self.expected)
+        db.close()
+
+    def test_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        path = os.path.join(self.dir.name, 'results.parquet')
+        with ParquetSink(path, row_group_size=50) as sink:
+            sink.write_batch(self.results)
+        table = pq.read_table(path)
+        self.assertEqual(table.column_names, columns)
+        self.assertEqual([tuple(r.values()) for r in table.to_pylist()], self.expected)
+        self.assertGreater(pq.ParquetFile(path).num_row_groups, 1)
+        self.assertEqual(json.loads(table.column('details')[1].as_py()), {'lymphnodes_affected': 5, 'lymphnodes_examined': 13})
@@ -0,0 +1,47 @@
+import gc
+import unittest
+from onconlp import spacy_util
+from onconlp.classification.tnm import TNMExtractor
+from onconlp.diagnosis.icd_o import ICD_O_Extractor
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        gc.collect()
+        spacy_util.set_max_models(4)
+
+    def test_shared_model(self):
+        gc.collect()
+        before = spacy_util.cached_models().get(('de_core_news_sm', True), 0)
+        tnm = TNMExtractor(tokenizer_only=True)
+        tnm_spaces = TNMExtractor(tokenizer_only=True, allow_spaces=True)
+        icd_o = ICD_O_Extractor(tokenizer_only=True)
+        self.assertEqual(spacy_util.cached_models()[('de_core_news_sm', True)], before + 3)
+        self.assertIs(tnm._impl.nlp.vocab, icd_o._impl.nlp.vocab)
+        self.assertIsNot(tnm._impl.nlp.tokenizer, icd_o._impl.nlp.tokenizer)
+
+        # Each extractor still uses its own tokenizer
+        self.assertEqual(len(tnm_spaces.transform('Tumorstadium: T 2, pN X, pM X - G-II.')), 1)
+        self.assertEqual(len(tnm.transform('Tumorstadium: T 2, pN X, pM X - G-II.')), 0)
+        self.assertEqual(len(icd_o.transform('1234/3')['icd-o']['morphology']), 1)
+        self.assertEqual(len(tnm.transform('pNX/0')), 1)
+
+    def test_release_and_evict(self):
+        gc.collect()
+        nlp = spacy_util.load_spacy('en', tokenizer_only=True)
+        other = spacy_util.load_spacy('en', tokenizer_only=True)
+        self.assertEqual(spacy_util.cached_models()[('en_core_web_sm', True)], 2)
+
+        spacy_util.set_max_models(0)
+        spacy_util.release_spacy(nlp)
+        spacy_util.release_spacy(nlp)
+        self.assertEqual(spacy_util.cached_models()[('en_core_web_sm', True)], 1)
+
+        del other
+        gc.collect()
+        self.assertNotIn(('en_core_web_sm', True), spacy_util.cached_models())
+
+
+if __name__ == '__main__':
+    unittest.main()
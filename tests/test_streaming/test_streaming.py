@@ -0,0 +1,63 @@
+import unittest
+from onconlp import streaming
+from onconlp.classification.tnm import TNMExtractor
+
+
+class TestIterTransform(unittest.TestCase):
+
+    texts = ['pT1 pN1 (5/13)', 'Kein Befund', 'ypT0N0M0', 'cT4 cN2 cM0 G3', 'pT2 G2, ICD-O 8140/3']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.extractor = TNMExtractor(engine='regex')
+        cls.expected = [repr(cls.extractor.transform(text)) for text in cls.texts]
+
+    def corpus(self, n, read):
+        for i in range(n):
+            read.append(i)
+            yield self.texts[i % len(self.texts)]
+
+    def test_iter_transform(self):
+        results = list(self.extractor.iter_transform(self.texts, batch_size=2))
+        self.assertEqual([i for i, _ in results], list(range(len(self.texts))))
+        self.assertEqual([repr(r) for _, r in results], self.expected)
+
+    def test_as_tuples(self):
+        items = [(text, 'doc-%d' % i) for i, text in enumerate(self.texts)]
+        results = dict(self.extractor.iter_transform(iter(items), batch_size=3, as_tuples=True))
+        self.assertEqual(list(results), ['doc-%d' % i for i in range(len(self.texts))])
+        self.assertEqual([repr(r) for r in results.values()], self.expected)
+
+    def test_lazy(self):
+        read = []
+        results = self.extractor.iter_transform(self.corpus(10**6, read), batch_size=10)
+        self.assertEqual(read, [])
+        for i, result in results:
+            self.assertLessEqual(len(read), i + 11)
+            if i == 100:
+                break
+        self.assertEqual(len(read), 110)
+
+    def test_processes(self):
+        read = []
+        results = {}
+        for i, result in self.extractor.iter_transform(self.corpus(500, read), batch_size=10, n_process=2, max_in_flight=30):
+            # At most max_in_flight documents are read, but not yet yielded
+            self.assertLessEqual(len(read) - len(results), 30)
+            results[i] = repr(result)
+        self.assertEqual(sorted(results), list(range(500)))
+        self.assertEqual([results[i] for i in range(500)], [self.expected[i % len(self.texts)] for i in range(500)])
+
+    def test_ordered(self):
+        read = []
+        results = []
+        for i, result in streaming.iter_transform(self.extractor, self.corpus(500, read), batch_size=10, n_process=3,
+                                                  max_in_flight=40, ordered=True):
+            self.assertLessEqual(len(read) - len(results), 40)
+            results.append((i, result))
+        self.assertEqual([i for i, _ in results], list(range(500)))
+        self.assertEqual([repr(r) for _, r in results], [self.expected[i % len(self.texts)] for i in range(500)])
+
+    def test_max_in_flight(self):
+        with self.assertRaises(Exception):
+            list(self.extractor.iter_transform(self.texts, batch_size=10, max_in_flight=5))